@@ -0,0 +1,134 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the solvers of the combined schedules of several stations.
+
+Random orbits of a few satellites are seen from a chain of stations, the
+neighbouring stations seeing the same passes a few minutes apart. Each pass has
+a random value per station, and the pass pairs of the station graphs are scored
+from these values, so that only the combination is timed. For each number of
+stations, print the time taken by each solver, the number of distinct passes
+received and of duplicate receptions, and the value of the received passes
+(the best value of each distinct pass)::
+
+    python benchmarks/combined_solvers.py --stations 2 3 4 5 6 --hours 12
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+
+from trollsched.combine import get_combined_sched, get_lagrangian_combined_sched
+from trollsched.satpass import SimplePass
+from trollsched.schedule import get_best_sched
+
+
+class KeyedPass(SimplePass):
+    """A simple pass with an identity key shared between stations, and a value."""
+
+    def __init__(self, satellite, orbit, risetime, falltime, value):
+        """Set up the pass."""
+        super().__init__(satellite, risetime, falltime)
+        self.pass_key = (satellite, orbit)
+        self.uptime = risetime + (falltime - risetime) / 2
+        self.value = value
+
+
+def get_passes(stations, hours, seed):
+    """Get the passes of each station."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2018, 12, 4)
+    passes = {"st%d" % i: [] for i in range(stations)}
+    for satellite in ["noaa-20", "metop-b", "aqua", "terra", "fengyun-3d"]:
+        first = start + timedelta(minutes=int(rng.integers(0, 100)))
+        for orbit in range(int(hours * 60 / 101)):
+            overhead = first + timedelta(minutes=101 * orbit)
+            for i in range(stations):
+                if rng.random() < 0.6:
+                    risetime = overhead + timedelta(minutes=3 * i + int(rng.integers(-2, 3)))
+                    duration = timedelta(minutes=int(rng.integers(6, 15)))
+                    passes["st%d" % i].append(KeyedPass(satellite, orbit, risetime, risetime + duration,
+                                                        float(rng.uniform(0.1, 1))))
+    return passes
+
+
+def fake_combine(p1, p2, area_of_interest):
+    """Score a pass pair from the values of the passes, less when they are close in time."""
+    gap = (p2.risetime - p1.falltime).total_seconds() / 3600.
+    return p1.value + p2.value - 0.5 * max(0, 1 - gap)
+
+
+def get_graphs(passes, delay):
+    """Get the graphs of the stations."""
+    graphs = {}
+    with patch("trollsched.schedule.combine", fake_combine), patch("trollsched.schedule.prime_twilights"):
+        for station, station_passes in passes.items():
+            _, (graphs[station], _) = get_best_sched(station_passes, None, delay)
+    return graphs
+
+
+def combine_graph(graphs, passes):
+    """Combine with the graph of the pass combinations."""
+    stats, schedule, _ = get_combined_sched(graphs, passes)
+    return [[node[i][0] for node in schedule if node[i][0] is not None] for i in range(len(stats))]
+
+
+def combine_lagrangian(graphs, passes):
+    """Combine by Lagrangian relaxation."""
+    return get_lagrangian_combined_sched(graphs, passes)[1]
+
+
+SOLVERS = {"graph": combine_graph, "lagrangian": combine_lagrangian}
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[2, 3, 4, 5, 6],
+                        help="Numbers of stations to benchmark")
+    parser.add_argument("--hours", type=float, default=12, help="Period covered by the passes")
+    parser.add_argument("--solvers", nargs="+", default=list(SOLVERS), choices=list(SOLVERS),
+                        help="Solvers to benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random passes")
+    opts = parser.parse_args()
+
+    delay = timedelta(seconds=60)
+    print("%8s %8s %12s %10s %10s %10s %10s" % ("stations", "passes", "solver", "time (s)", "received",
+                                                "duplicates", "value"))
+    for stations in opts.stations:
+        passes = get_passes(stations, opts.hours, opts.seed)
+        graphs = get_graphs(passes, delay)
+        for name in opts.solvers:
+            tic = time.perf_counter()
+            try:
+                schedules = SOLVERS[name](graphs, passes)
+            except Exception as err:
+                print("%8d %8d %12s failed: %s" % (stations, sum(map(len, passes.values())), name, repr(err)))
+                continue
+            duration = time.perf_counter() - tic
+            best = {}
+            for schedule in schedules:
+                for overpass in schedule:
+                    best[overpass.pass_key] = max(best.get(overpass.pass_key, 0), overpass.value)
+            receptions = sum(len(schedule) for schedule in schedules)
+            print("%8d %8d %12s %10.3f %10d %10d %10.2f" % (stations, sum(map(len, passes.values())), name, duration,
+                                                            len(best), receptions - len(best), sum(best.values())))
+
+
+if __name__ == "__main__":
+    main()
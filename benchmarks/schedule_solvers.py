@@ -0,0 +1,92 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the schedule solvers on dense conflict scenarios.
+
+Random passes are drawn over a period, more passes over the same period making
+larger groups of conflicting passes. The pass pairs are scored with a cheap
+deterministic function, so that only the solvers are timed. For each number of
+passes, print the time taken by each solver, and check that they all find the
+same schedule::
+
+    python benchmarks/schedule_solvers.py --passes 50 100 200 300 --hours 24
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+
+from trollsched.satpass import SimplePass
+from trollsched.schedule import conflicting_passes, get_best_sched, get_best_sched_dp, iter_best_sched
+
+
+def get_passes(number, hours, seed):
+    """Get *number* random passes of 5 to 15 minutes within *hours*."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2018, 12, 4)
+    passes = []
+    for i in range(number):
+        risetime = start + timedelta(seconds=int(rng.integers(0, hours * 3600)))
+        overpass = SimplePass("sat-%d" % i, risetime, risetime + timedelta(seconds=int(rng.integers(300, 900))))
+        overpass.uptime = risetime + (overpass.falltime - risetime) / 2
+        passes.append(overpass)
+    return passes
+
+
+def fake_combine(p1, p2, area_of_interest):
+    """Score a pass pair from its times."""
+    return ((p1.risetime.minute * 7 + p2.falltime.minute * 3) % 11) / 10.0
+
+
+SOLVERS = {"graph": lambda passes, delay: get_best_sched(passes, None, delay)[0][::-1],
+           "streaming": lambda passes, delay: [overpass for segment in iter_best_sched(passes, None, delay)
+                                               for overpass in segment],
+           "dp": lambda passes, delay: get_best_sched_dp(passes, None, delay)}
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--passes", type=int, nargs="+", default=[50, 100, 200, 300],
+                        help="Numbers of passes to benchmark")
+    parser.add_argument("--hours", type=int, default=24, help="Period covered by the passes")
+    parser.add_argument("--delay", type=int, default=60, help="Delay between passes, in seconds")
+    parser.add_argument("--solvers", nargs="+", default=list(SOLVERS), choices=list(SOLVERS),
+                        help="Solvers to benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random passes")
+    opts = parser.parse_args()
+
+    delay = timedelta(seconds=opts.delay)
+    print("%8s %12s" % ("passes", "max group") + "".join(" %12s" % (name + " (s)") for name in opts.solvers))
+    with patch("trollsched.schedule.combine", fake_combine):
+        for number in opts.passes:
+            passes = get_passes(number, opts.hours, opts.seed)
+            max_group = max(len(group) for group in conflicting_passes(passes, delay))
+            durations = []
+            schedules = []
+            for name in opts.solvers:
+                tic = time.perf_counter()
+                schedules.append([id(overpass) for overpass in SOLVERS[name](passes, delay)])
+                durations.append(time.perf_counter() - tic)
+            same = all(schedule == schedules[0] for schedule in schedules)
+            print("%8d %12d" % (number, max_group) + "".join(" %12.4f" % duration for duration in durations) +
+                  ("" if same else "   schedules differ!"))
+
+
+if __name__ == "__main__":
+    main()
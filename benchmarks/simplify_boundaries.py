@@ -0,0 +1,89 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the simplification of the swath boundaries.
+
+For a day of passes over a station, print for each tolerance (in km) the mean
+number of vertices of the swath contours, the time spent intersecting them
+with the area, and the error on the area coverage compared to the first
+tolerance (the full contours by default)::
+
+    python benchmarks/simplify_boundaries.py --tolerances 0 1 2 5 10 20
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+from pyorbital.orbital import Orbital
+from pyresample.geometry import AreaDefinition
+
+from trollsched.satpass import Pass
+
+TLES = {"NOAA-20": ("1 43013U 17073A   18288.00000000  .00000042  00000-0  20142-4 0  2763",
+                    "2 43013 098.7338 224.5862 0000752 108.7915 035.0971 14.19549169046919"),
+        "NOAA-19": ("1 33591U 09005A   18288.64852564  .00000055  00000-0  55330-4 0  9992",
+                    "2 33591  99.1559 269.1434 0013899 353.0306   7.0669 14.12312703499172")}
+INSTRUMENTS = {"NOAA-20": "viirs", "NOAA-19": "avhrr"}
+
+EURON1 = AreaDefinition("euron1", "Northern Europe - 1km", "euron1",
+                        {"proj": "stere", "ellps": "WGS84", "lat_0": 90.0, "lon_0": 0.0, "lat_ts": 60.0},
+                        3072, 3072, (-1000000.0, -4500000.0, 2072000.0, -1428000.0))
+
+
+def get_passes(start_time, hours, lon, lat, tolerance):
+    """Get the passes of the day over the station, simplified with *tolerance*."""
+    passes = []
+    for name, (line1, line2) in TLES.items():
+        orb = Orbital(name, line1=line1, line2=line2)
+        for rise, fall, _ in orb.get_next_passes(start_time, hours, lon, lat, 0):
+            passes.append(Pass(name, rise, fall, orb=orb, instrument=INSTRUMENTS[name],
+                               simplify_tolerance=tolerance))
+    return passes
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[0, 1, 2, 5, 10, 20],
+                        help="Tolerances in km to benchmark, 0 for no simplification")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to repeat the intersections")
+    opts = parser.parse_args()
+
+    start_time = datetime(2018, 10, 16)
+    area_poly = EURON1.boundary(8).contour_poly
+    area = area_poly.area()
+    reference = None
+    print("%10s %10s %14s %14s %14s" % ("tolerance", "vertices", "intersect (s)", "max error", "mean error"))
+    for tolerance in opts.tolerances:
+        passes = get_passes(start_time, 24, 16.15, 58.58, tolerance or None)
+        polys = [overpass.boundary.contour_poly for overpass in passes]
+        vertices = np.mean([len(poly.vertices) for poly in polys])
+
+        tic = time.perf_counter()
+        for _ in range(opts.repeat):
+            inters = [poly.intersection(area_poly) for poly in polys]
+        duration = (time.perf_counter() - tic) / opts.repeat
+
+        coverage = np.array([0 if inter is None else inter.area() / area for inter in inters])
+        if reference is None:
+            reference = coverage
+        errors = np.abs(coverage - reference)
+        print("%10g %10.1f %14.4f %14.2e %14.2e" % (tolerance, vertices, duration, errors.max(), errors.mean()))
+
+
+if __name__ == "__main__":
+    main()
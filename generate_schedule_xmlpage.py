@@ -28,17 +28,12 @@ It uses posttroll to listen for incoming schedule request xml files and then tri
 import logging
 import os.path
 import sys
-from datetime import datetime
 
-import defusedxml.ElementTree as ET
 import posttroll.subscriber
-from posttroll.publisher import Publish
 from six.moves.configparser import RawConfigParser
-from six.moves.urllib.parse import urlparse
 
-from trollsched import INSTRUMENT, SATELLITE_NAMES
-from trollsched.drawing import save_fig
-from trollsched.satpass import Pass
+from trollsched.lookup import get_pass_lookup
+from trollsched.page_generator import PageGenerator, process_request
 
 LOG = logging.getLogger(__name__)
 
@@ -62,88 +57,22 @@ _DEFAULT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 _DEFAULT_LOG_FORMAT = "[%(levelname)s: %(asctime)s : %(name)s] %(message)s"
 
 
-def process_xmlrequest(filename, plotdir, output_file, excluded_satellites):
-    """Process the xml request."""
-    tree = ET.parse(filename)
-    root = tree.getroot()
-
-    for child in root:
-        if child.tag == "pass":
-            LOG.debug("Pass: %s", str(child.attrib))
-            platform_name = SATELLITE_NAMES.get(child.attrib["satellite"], child.attrib["satellite"])
-            instrument = INSTRUMENT.get(platform_name)
-            if not instrument:
-                LOG.error("Instrument unknown! Platform = %s", platform_name)
-                continue
-
-            if platform_name in excluded_satellites:
-                LOG.debug("Platform name excluded: %s", platform_name)
-                continue
-            try:
-                overpass = Pass(platform_name,
-                                datetime.strptime(child.attrib["start-time"],
-                                                  "%Y-%m-%d-%H:%M:%S"),
-                                datetime.strptime(child.attrib["end-time"],
-                                                  "%Y-%m-%d-%H:%M:%S"),
-                                instrument=instrument)
-            except KeyError as err:
-                LOG.warning("Failed on satellite %s: %s", platform_name, str(err))
-                continue
-
-            save_fig(overpass, directory=plotdir)
-            child.set("img", overpass.fig)
-            child.set("rec", "True")
-            LOG.debug("Plot saved - plotdir = %s, platform_name = %s", plotdir, platform_name)
-
-    tree.write(output_file, encoding="utf-8", xml_declaration=True)
-
-    with open(output_file) as fpt:
-        lines = fpt.readlines()
-        lines.insert(
-            1, "<?xml-stylesheet type='text/xsl' href='reqreader.xsl'?>")
-
-    with open(output_file, "w") as fpt:
-        fpt.writelines(lines)
-
-
-def start_plotting(jobreg, message, **kwargs):
-    """Make a web-publishable version of the xml schedule.
-
-    Read the xmlschedule request file and make the png images of swath outlines
-    and generate the output xml file for web publication.
-    """
-    excluded_satellites = kwargs.get("excluded_satellites", [])
-
-    LOG.info("")
-    LOG.info("job-registry dict: " + str(jobreg))
-    LOG.info("\tMessage:")
-    LOG.info(message)
-    urlobj = urlparse(message.data["uri"])
-    # path, fname = os.path.split(urlobj.path)
-
-    process_xmlrequest(urlobj.path,
-                       OPTIONS["path_plots"], OPTIONS["xmlfilepath"],
-                       excluded_satellites)
-
-    return jobreg
-
-
-def schedule_page_generator(excluded_satellite_list=None):
+def process_xmlrequest(filename, plotdir, output_file, excluded_satellites, lookup=None):
+    """Process the xml request, rendering its plots one after the other."""
+    process_request(filename, plotdir, output_file, excluded_satellites, lookup)
+
+
+def schedule_page_generator(excluded_satellite_list=None, processes=None):
     """Listens and triggers processing."""
     LOG.info(
         "*** Start the generation of the schedule xml page with swath outline plots")
+    # the passes of the scheduler, from a pass lookup server if there is one, from the catalogue otherwise
+    lookup = get_pass_lookup(OPTIONS.get("pass_lookup_url"), OPTIONS.get("catalogue_dir"))
+    generator = PageGenerator(OPTIONS["path_plots"], OPTIONS["xmlfilepath"], excluded_satellite_list, lookup,
+                              processes=processes)
     with posttroll.subscriber.Subscribe("", [OPTIONS["posttroll_topic"], ],
                                         True) as subscr:
-        with Publish("schedule_page_generator", 0) as publisher:
-            job_registry = {}
-            for msg in subscr.recv():
-                job_registry = start_plotting(
-                    job_registry, msg, publisher=publisher, excluded_satellites=excluded_satellite_list)
-                # Cleanup in registry (keep only the last 5):
-                keys = job_registry.keys()
-                if len(keys) > 5:
-                    keys.sort()
-                    job_registry.pop(keys[0])
+        generator.run(subscr.recv())
 
 
 if __name__ == "__main__":
@@ -154,6 +83,8 @@ if __name__ == "__main__":
     parser.add_argument("-x", "--excluded_satellites", nargs="*",
                         help="List of platform names to exclude",
                         default=[])
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="Number of processes rendering the plots (the number of cpus by default)")
     opts = parser.parse_args()
 
     no_sats = opts.excluded_satellites
@@ -171,7 +102,7 @@ if __name__ == "__main__":
     LOG = logging.getLogger("schedule_page_generator")
     LOG.info("Exclude the following satellite platforms: %s", str(no_sats))
 
-    schedule_page_generator(no_sats)
+    schedule_page_generator(no_sats, opts.processes)
 
     # uri = "/data/temp/AdamD/xxx/2018-10-22-00-42-28-acquisition-schedule-confirmation-nrk.xml"
     # urlobj = urlparse(uri)
@@ -47,10 +47,12 @@ setup(name="pytroll-schedule",
       test_suite="trollsched.tests.suite",
       entry_points={
           "console_scripts": ["schedule = trollsched.schedule:run",
-                              "compare_scheds = trollsched.compare:run"]},
+                              "compare_scheds = trollsched.compare:run",
+                              "schedule_pass_lookup = trollsched.lookup:main"]},
       scripts=["generate_schedule_xmlpage.py"],
       packages=["trollsched"],
       tests_require=test_requires,
       install_requires=requires,
+      extras_require={"watch": ["pyinotify"]},
       zip_safe=False,
       )
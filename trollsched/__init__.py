@@ -23,9 +23,13 @@
 
 """Package file."""
 
-from . import version
 
-__version__ = version.get_versions()['version']
+def __getattr__(name):
+    """Compute the version lazily, it may need to call git."""
+    if name == "__version__":
+        from . import version
+        return version.get_versions()["version"]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 # shortest allowed pass in minutes
@@ -72,6 +76,3 @@ INSTRUMENT = {'Suomi NPP': 'viirs',
               'Metop-C': 'avhrr',
               'FY-3D': 'avhrr',
               'FY-3C': 'avhrr'}
-
-from . import version
-__version__ = version.get_versions()['version']
@@ -0,0 +1,114 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Area definitions and their boundary polygons, shared between stations and runs.
+
+An area file is parsed once for all the stations using it, and parsed again
+only when it changes on disk. The boundary polygons of the areas are kept for
+each resolution they are asked for, keyed by the hash of the area definition,
+so that a modified area never gets the polygon of its former self.
+"""
+
+import logging
+import os
+import threading
+
+from trollsched.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_area_files = {}
+_polygons = {}
+
+
+def _parse_area_file(area_file, *area_ids):
+    """Parse the area file, importing pyresample only when needed."""
+    try:
+        from pyresample import parse_area_file
+    except ImportError:
+        # Older versions of pyresample:
+        from pyresample.utils import parse_area_file
+    return parse_area_file(area_file, *area_ids)
+
+
+def _get_file_key(area_file):
+    stat = os.stat(area_file)
+    return os.path.abspath(area_file), stat.st_mtime_ns, stat.st_size
+
+
+def get_area(area_file, area_id):
+    """Get the area *area_id* from *area_file*, parsing the file only if it was not parsed since it last changed."""
+    key = _get_file_key(area_file)
+    with _lock:
+        areas = _area_files.get(key)
+        if areas is None:
+            for old_key in [old_key for old_key in _area_files if old_key[0] == key[0]]:
+                del _area_files[old_key]
+            try:
+                areas = {area.area_id: area for area in _parse_area_file(area_file)}
+            except Exception as err:
+                # Some areas of the file may not be parsable on their own, the requested ones are parsed below
+                logger.debug("Could not parse all the areas of %s: %s", area_file, str(err))
+                areas = {}
+            _area_files[key] = areas
+        if area_id not in areas:
+            areas[area_id] = _parse_area_file(area_file, area_id)[0]
+            profiler.count("area_cache", result="miss")
+        else:
+            profiler.count("area_cache", result="hit")
+        return areas[area_id]
+
+
+def get_area_polygon(area, vertices_per_side=None, frequency=None):
+    """Get the boundary polygon of *area*.
+
+    Args:
+        area: the area definition.
+        vertices_per_side: the number of vertices on each side of the area, as in the `boundary` method of the area.
+        frequency: the sampling frequency of the area edges, as in `pyresample.boundary.AreaDefBoundary`, used
+            if *vertices_per_side* is not given.
+
+    Returns:
+        The boundary polygon of the area, a `SphPolygon` shared with all the callers asking for the same area
+        and resolution. It must not be modified.
+    """
+    if vertices_per_side is not None:
+        key = (hash(area), "vertices_per_side", vertices_per_side)
+    else:
+        key = (hash(area), "frequency", frequency or 100)
+    with _lock:
+        try:
+            poly = _polygons[key]
+        except KeyError:
+            pass
+        else:
+            profiler.count("area_polygon_cache", result="hit")
+            return poly
+    if vertices_per_side is not None:
+        poly = area.boundary(vertices_per_side).contour_poly
+    else:
+        from pyresample.boundary import AreaDefBoundary
+        poly = AreaDefBoundary(area, frequency=frequency or 100).contour_poly
+    profiler.count("area_polygon_cache", result="miss")
+    with _lock:
+        return _polygons.setdefault(key, poly)
+
+
+def clear_cache():
+    """Forget all the cached areas and polygons."""
+    with _lock:
+        _area_files.clear()
+        _polygons.clear()
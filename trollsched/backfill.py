@@ -0,0 +1,167 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compute the schedules of a series of past start times in one go.
+
+The start times are run one after the other in the same process, each with
+the TLEs that were the latest at its start time in an archive of TLE files.
+When the periods of consecutive start times overlap, the passes predicted
+again for the overlap are replaced by the passes of the previous period, so
+that their boundaries and scores are computed only once. The start times can
+be split between several processes, each running a contiguous series of them.
+"""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import TemporaryDirectory
+
+from trollsched.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+
+def get_start_times(start, end, step):
+    """Get the start times from *start* to *end* included, every *step*."""
+    start_times = []
+    while start <= end:
+        start_times.append(start)
+        start += step
+    return start_times
+
+
+class PassPool:
+    """The passes of the stations, shared between the runs of overlapping periods.
+
+    A pass is shared when it is predicted again with the same TLE and the same rise and fall times.
+    """
+
+    def __init__(self):
+        """Initialize the pool."""
+        self._passes = {}
+
+    @staticmethod
+    def get_identity(overpass):
+        """Get the identity of *overpass*."""
+        return (overpass.satellite.name, overpass.instrument, overpass.orb.tle.line1, overpass.orb.tle.line2,
+                overpass.risetime, overpass.falltime)
+
+    def share(self, station_id, passes, start_time):
+        """Get the pooled passes of *station_id* for *passes*, a new period starting at *start_time*.
+
+        The passes of the station ending before *start_time* are removed from the pool, and the flags of the shared
+        passes are reset for the new schedule.
+        """
+        pool = self._passes.setdefault(station_id, {})
+        for key in [key for key, overpass in pool.items() if overpass.falltime < start_time]:
+            del pool[key]
+        shared = []
+        for overpass in passes:
+            pooled = pool.setdefault(self.get_identity(overpass), overpass)
+            profiler.count("pass_pool", result="miss" if pooled is overpass else "hit")
+            pooled.rec = False
+            pooled.antenna = None
+            shared.append(pooled)
+        return shared
+
+
+def forget_before(start_time):
+    """Remove the pass pair scores and the twilights of the passes ending before *start_time* from the caches."""
+    from trollsched import schedule
+    for key in [key for key, (p1, p2, _) in schedule.combination.items()
+                if p1.falltime < start_time or p2.falltime < start_time]:
+        del schedule.combination[key]
+    for utctime in [utctime for utctime in schedule.twilights if utctime < start_time]:
+        del schedule.twilights[utctime]
+
+
+def write_tle_file(directory, archive, satellites, start_time):
+    """Write the TLEs the *satellites* had at *start_time* in the *archive* to a file of *directory*.
+
+    Start times with the same TLEs share the same file.
+
+    Returns:
+        The name of the file, or None if a satellite has no TLE before *start_time*.
+    """
+    lines = []
+    for sat_name in satellites:
+        try:
+            line1, line2 = archive.get_tle(sat_name, start_time)
+        except KeyError as err:
+            logger.error("Skipping %s: %s", start_time.isoformat(), str(err))
+            return None
+        lines.extend([sat_name.upper(), line1, line2])
+    content = "\n".join(lines) + "\n"
+    filename = os.path.join(directory, hashlib.sha256(content.encode()).hexdigest()[:16] + ".tle")
+    if not os.path.exists(filename):
+        with open(filename, "w") as fd_:
+            fd_.write(content)
+    return filename
+
+
+def run_windows(scheduler, opts, windows):
+    """Compute and write the schedules of the *windows*, (start time, TLE file) pairs, sharing the passes.
+
+    Returns:
+        The number of windows run.
+    """
+    from trollsched.schedule import run_window
+
+    scheduler.pass_pool = PassPool()
+    for start_time, tle_file in windows:
+        logger.info("Computing the schedules starting at %s", start_time.isoformat())
+        forget_before(start_time)
+        with profiler.timer("backfill_window"):
+            run_window(scheduler, opts, start_time, tle_file, cacheable=True)
+    scheduler.pass_pool = None
+    return len(windows)
+
+
+def run_backfill(scheduler, opts):
+    """Compute and write the schedules of the start times of the `--backfill` option."""
+    from trollsched.tlestore import TleArchive, get_tle_store
+
+    start_times = get_start_times(*opts.backfill)
+    if opts.multiproc:
+        logger.warning("The stations are scheduled one after the other when backfilling, to share their passes")
+        opts.multiproc = False
+
+    with TemporaryDirectory(prefix="trollsched-backfill") as tle_dir:
+        if opts.tle_archive:
+            archive = TleArchive(opts.tle_archive)
+            satellites = sorted({sat.name for station in scheduler.stations for sat in station.satellites})
+            windows = [(start_time, write_tle_file(tle_dir, archive, satellites, start_time))
+                       for start_time in start_times]
+            windows = [(start_time, tle_file) for start_time, tle_file in windows if tle_file is not None]
+        else:
+            tle_file = opts.tle
+            if tle_file is None:
+                logger.warning("No TLE archive given, using the current TLEs for all the start times")
+                tle_file = get_tle_store().get_tle_file()
+            windows = [(start_time, tle_file) for start_time in start_times]
+
+        processes = max(1, min(opts.processes, len(windows)))
+        logger.info("Computing the schedules of %d start times with %d process(es)", len(windows), processes)
+        if processes == 1:
+            run_windows(scheduler, opts, windows)
+            return
+        # Contiguous start times in each process, for their periods to overlap
+        size = -(-len(windows) // processes)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(run_windows, scheduler, opts, windows[i:i + size])
+                       for i in range(0, len(windows), size)]
+            for future in futures:
+                future.result()
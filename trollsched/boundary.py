@@ -33,6 +33,9 @@ from pyresample.boundary import Boundary
 
 logger = logging.getLogger(__name__)
 
+#: Mean radius of the earth, in km
+EARTH_RADIUS = 6371.0
+
 INSTRUMENT = {"avhrr/3": "avhrr",
               "avhrr/2": "avhrr",
               "avhrr-3": "avhrr",
@@ -257,6 +260,19 @@ class SwathBoundary(Boundary):
 
         return
 
+    def simplify(self, tolerance):
+        """Simplify the sides of the boundary, dropping the points within *tolerance* km of the simplified sides.
+
+        The corners of the boundary are kept, so the simplified sides still join.
+        """
+        for side in ("top", "right", "bottom", "left"):
+            lons = getattr(self, side + "_lons")
+            lats = getattr(self, side + "_lats")
+            kept = simplify_line(lons, lats, tolerance / EARTH_RADIUS)
+            setattr(self, side + "_lons", lons[kept])
+            setattr(self, side + "_lats", lats[kept])
+        self._contour_poly = None
+
     def contour(self):
         """Get the contour lon/lats."""
         lons = np.concatenate((self.top_lons,
@@ -268,3 +284,40 @@ class SwathBoundary(Boundary):
                                self.bottom_lats,
                                self.left_lats[1:-1]))
         return lons, lats
+
+
+def simplify_line(lons, lats, tolerance):
+    """Simplify a line on the sphere with the Douglas-Peucker algorithm.
+
+    Arguments:
+        lons: the longitudes of the points of the line, in degrees
+        lats: the latitudes of the points of the line, in degrees
+        tolerance: the largest distance, in radians, allowed between a dropped point and the simplified line.
+
+    Returns:
+        The indices of the points to keep, the first and last ones included.
+    """
+    lons = np.deg2rad(np.asanyarray(lons, dtype=np.float64))
+    lats = np.deg2rad(np.asanyarray(lats, dtype=np.float64))
+    points = np.stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)), axis=-1)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, len(points) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        normal = np.cross(points[first], points[last])
+        norm = np.linalg.norm(normal)
+        if norm < 1e-12:
+            # the ends of the segment are the same point
+            distances = np.arccos(np.clip(points[first + 1:last] @ points[first], -1, 1))
+        else:
+            distances = np.abs(np.arcsin(np.clip(points[first + 1:last] @ (normal / norm), -1, 1)))
+        farthest = np.argmax(distances)
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            segments.append((first, middle))
+            segments.append((middle, last))
+    return np.flatnonzero(keep)
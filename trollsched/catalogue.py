@@ -0,0 +1,439 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A persistent catalogue of the predicted passes, to read them without running the scheduler again.
+
+The passes of each station are kept in a directory of their own, as one numpy
+file per column (rise, fall and up times, satellite, instrument, orbit number,
+maximum elevation, direction, recorded flag and score), with the vertices of
+the swath boundaries of all the passes in another file, each pass referring to
+its vertices by offset and count. The rows are sorted by risetime, so the
+passes of a time range are found by binary search in the memory-mapped
+risetime column, without reading the rest of the catalogue.
+
+Each run adds the passes it predicted to the catalogue of the station,
+replacing the passes of the previous runs overlapping the period it predicted,
+and dropping the passes which ended long before it (see `DEFAULT_RETENTION`).
+Each write makes a new generation of the catalogue of the station, in a
+directory of its own, under a lock against the other writers, and then
+switches the station's `current` pointer file to it at once. A reader opens
+everything from the one generation the pointer names, so it sees either the
+old passes or the new ones. The previous generation is kept for the readers
+still opening it.
+"""
+
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # no locking of the catalogue against concurrent writers on windows
+    fcntl = None
+
+from trollsched.satpass import SimplePass
+from trollsched.utils import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_VERSION = 1
+
+#: How long the passes are kept in the catalogue after the start of the runs
+DEFAULT_RETENTION = timedelta(days=30)
+
+META_FILENAME = "catalogue.json"
+
+#: The file naming the current generation of the catalogue of a station
+CURRENT_FILENAME = "current"
+
+GENERATION_PREFIX = "gen-"
+
+#: The columns of the catalogue, and their types
+COLUMNS = {"risetime": "datetime64[us]",
+           "falltime": "datetime64[us]",
+           "uptime": "datetime64[us]",
+           "satellite": "int16",
+           "instrument": "int16",
+           "orbit": "int32",
+           "max_elev": "float32",
+           "direction": "int8",
+           "rec": "bool",
+           "score": "float64",
+           "boundary_start": "int64",
+           "boundary_size": "int32"}
+
+DIRECTIONS = {"ascending": 1, "descending": -1}
+
+
+class CatalogueBoundary:
+    """The swath boundary of a catalogue pass, from its *vertices* (longitudes and latitudes in radians)."""
+
+    def __init__(self, vertices):
+        """Initialize the boundary."""
+        self.vertices = vertices
+        self._contour_poly = None
+
+    @property
+    def contour_poly(self):
+        """Get the boundary as a spherical polygon."""
+        if self._contour_poly is None:
+            from trollsched.spherical import SphPolygon
+            self._contour_poly = SphPolygon(np.array(self.vertices))
+        return self._contour_poly
+
+
+class CataloguePass(SimplePass):
+    """A pass read from the catalogue, with what the scheduler knew of it.
+
+    It can be drawn and written to the schedule files as the passes of the scheduler, but has no orbital.
+    """
+
+    def __init__(self, satellite, risetime, falltime, uptime, instrument, orbit=None, max_elev=None,
+                 direction=None, rec=False, score=None, boundary=None, station=None):
+        """Initialize the pass."""
+        SimplePass.__init__(self, satellite, risetime, falltime)
+        self.station = station
+        self.uptime = uptime
+        self.instrument = instrument
+        self.orbit = orbit
+        self.max_elev = max_elev
+        self.direction = direction
+        self.rec = rec
+        self.area_score = score
+        self._boundary = boundary
+
+    @property
+    def pass_key(self):
+        """Get the identity key of the pass, as :attr:`trollsched.satpass.Pass.pass_key`.
+
+        The passes catalogued without an orbit number are identified by their times instead.
+        """
+        if self.orbit is None or self.orbit < 0:
+            return (self.satellite.name, self.risetime, self.falltime)
+        return (self.satellite.name, self.orbit)
+
+    def __hash__(self):
+        """Hash the pass by its key, as it compares to the other passes with a key."""
+        return hash(self.pass_key)
+
+    @property
+    def boundary(self):
+        """Get the boundary of the swath, as it was when the pass was scheduled."""
+        if self._boundary is None:
+            raise AttributeError("No boundary in the catalogue for " + str(self))
+        return self._boundary
+
+    def pass_direction(self):
+        """Get the direction of the pass, ascending or descending."""
+        return self.direction
+
+
+def _to_datetime(value):
+    return value.astype("datetime64[us]").astype(datetime)
+
+
+def _get_pass_values(overpass, area=None, coords=None):
+    """Get the values of the columns of *overpass*, and the vertices of its boundary."""
+    orbit = -1
+    direction = 0
+    max_elev = getattr(overpass, "max_elev", None)
+    if hasattr(overpass, "orb"):
+        orbit = overpass.pass_key[1]
+        direction = DIRECTIONS[overpass.pass_direction()]
+        if max_elev is None and coords is not None:
+            max_elev = overpass.orb.get_observer_look(overpass.uptime, *coords)[1]
+    score = overpass.score.get(area, (None, None))[1] if area is not None else None
+    try:
+        vertices = overpass.boundary.contour_poly.vertices
+    except AttributeError:
+        vertices = np.zeros((0, 2))
+    return {"risetime": overpass.risetime,
+            "falltime": overpass.falltime,
+            "uptime": overpass.uptime,
+            "orbit": orbit,
+            "max_elev": np.nan if max_elev is None else max_elev,
+            "direction": direction,
+            "rec": bool(overpass.rec),
+            "score": np.nan if score is None else score}, vertices
+
+
+class StationCatalogue:
+    """The memory-mapped catalogue of the passes of a station, in the *directory* of one of its generations."""
+
+    def __init__(self, directory):
+        """Open the catalogue."""
+        with open(os.path.join(directory, META_FILENAME)) as fd_:
+            self.meta = json.load(fd_)
+        if self.meta["version"] != CATALOGUE_VERSION:
+            raise ValueError("Unsupported catalogue version %s in %s" % (self.meta["version"], directory))
+        self.columns = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+        self.vertices = np.load(os.path.join(directory, "boundary.npy"), mmap_mode="r")
+        self.max_duration = np.timedelta64(self.meta["max_duration"], "us")
+
+    def __len__(self):
+        """Get the number of passes."""
+        return len(self.columns["risetime"])
+
+    def _get_satellite_index(self, satellite):
+        for i, sat in enumerate(self.meta["satellites"]):
+            if satellite in (sat["name"], sat["schedule_name"]):
+                return i
+        return None
+
+    def select(self, start=None, end=None, satellite=None):
+        """Get the indices of the passes overlapping *start* to *end*, of *satellite* (by name or schedule name).
+
+        Returns:
+            The indices of the passes, in risetime order.
+        """
+        risetimes = self.columns["risetime"]
+        first, last = 0, len(risetimes)
+        if start is not None:
+            first = np.searchsorted(risetimes, np.datetime64(start, "us") - self.max_duration, side="right")
+        if end is not None:
+            last = np.searchsorted(risetimes, np.datetime64(end, "us"), side="left")
+        indices = np.arange(first, last)
+        if start is not None:
+            indices = indices[self.columns["falltime"][first:last] > np.datetime64(start, "us")]
+        if satellite is not None:
+            sat_index = self._get_satellite_index(satellite)
+            if sat_index is None:
+                return indices[:0]
+            indices = indices[self.columns["satellite"][indices] == sat_index]
+        return indices
+
+    def get_pass(self, i):
+        """Get the pass of index *i*."""
+        from trollsched.schedule import Satellite
+        columns = self.columns
+        sat = self.meta["satellites"][columns["satellite"][i]]
+        boundary_start = int(columns["boundary_start"][i])
+        boundary_size = int(columns["boundary_size"][i])
+        boundary = None
+        if boundary_size:
+            boundary = CatalogueBoundary(self.vertices[boundary_start:boundary_start + boundary_size])
+        max_elev = float(columns["max_elev"][i])
+        score = float(columns["score"][i])
+        direction = {value: name for name, value in DIRECTIONS.items()}.get(int(columns["direction"][i]))
+        return CataloguePass(Satellite(sat["name"], 0, 0, schedule_name=sat["schedule_name"]),
+                             _to_datetime(columns["risetime"][i]), _to_datetime(columns["falltime"][i]),
+                             _to_datetime(columns["uptime"][i]), self.meta["instruments"][columns["instrument"][i]],
+                             orbit=int(columns["orbit"][i]), max_elev=None if np.isnan(max_elev) else max_elev,
+                             direction=direction, rec=bool(columns["rec"][i]),
+                             score=None if np.isnan(score) else score, boundary=boundary,
+                             station=self.meta["station"])
+
+
+class PassCatalogue:
+    """The catalogue of the predicted passes of the stations, in *directory*.
+
+    Args:
+        directory: where to keep the catalogue, defaults to the `catalogue` directory of the scheduler's cache.
+    """
+
+    def __init__(self, directory=None):
+        """Initialize the catalogue."""
+        self.directory = os.fspath(directory or get_cache_dir("catalogue"))
+        os.makedirs(self.directory, exist_ok=True)
+        self._stations = {}
+
+    def _get_station_dir(self, station_id):
+        return os.path.join(self.directory, station_id)
+
+    def get_station_ids(self):
+        """Get the ids of the stations in the catalogue."""
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.exists(os.path.join(self.directory, name, CURRENT_FILENAME)))
+
+    def _get_generation(self, station_id):
+        """Get the name of the current generation of the catalogue of *station_id*, None if it has none."""
+        try:
+            with open(os.path.join(self._get_station_dir(station_id), CURRENT_FILENAME)) as fd_:
+                return fd_.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def get_station(self, station_id):
+        """Get the catalogue of *station_id*, or None if the station has no passes in the catalogue.
+
+        The catalogue is opened again when it has been written since it was last opened.
+        """
+        generation = self._get_generation(station_id)
+        if generation is None:
+            return None
+        cached = self._stations.get(station_id)
+        if cached is None or cached[0] != generation:
+            try:
+                station = StationCatalogue(os.path.join(self._get_station_dir(station_id), generation))
+            except FileNotFoundError:
+                if self._get_generation(station_id) == generation:
+                    raise
+                # Dropped by two later writes while opening it
+                return self.get_station(station_id)
+            cached = self._stations[station_id] = (generation, station)
+        return cached[1]
+
+    def get_passes(self, station_id, start=None, end=None, satellite=None):
+        """Get the passes of *station_id* overlapping *start* to *end*, of all satellites or of *satellite*."""
+        station = self.get_station(station_id)
+        if station is None:
+            return []
+        return [station.get_pass(i) for i in station.select(start, end, satellite)]
+
+    def find_pass(self, station_id, satellite, risetime, falltime, tolerance=timedelta(seconds=1)):
+        """Find the pass of *satellite* at *station_id* rising at *risetime* and falling at *falltime*.
+
+        The times are matched within *tolerance*, as schedule files have them to the second.
+
+        Returns:
+            The pass, or None if it is not in the catalogue.
+        """
+        for overpass in self.get_passes(station_id, risetime - tolerance, falltime + tolerance, satellite):
+            if abs(overpass.risetime - risetime) <= tolerance and abs(overpass.falltime - falltime) <= tolerance:
+                return overpass
+        return None
+
+    @contextmanager
+    def _locked(self, station_id):
+        """Lock the catalogue of *station_id* against other writers, in this process or others."""
+        with open(self._get_station_dir(station_id) + ".lock", "a") as fd_:
+            if fcntl is not None:
+                fcntl.flock(fd_, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd_, fcntl.LOCK_UN)
+
+    def add_passes(self, station_id, passes, start_time, end_time=None, area=None, coords=None,
+                   retention=DEFAULT_RETENTION):
+        """Add the *passes* of *station_id* predicted from *start_time* to *end_time* to the catalogue.
+
+        The passes of the station overlapping *start_time* to *end_time* (or ending after *start_time* if
+        *end_time* is None) already in the catalogue are replaced, and those ending more than *retention*
+        before *start_time* are dropped. The scores are those of the passes for *area*, and the maximum
+        elevations are computed from the station *coords* for the passes which don't have them.
+        """
+        new_rows = [_get_pass_values(overpass, area, coords) for overpass in passes]
+        with self._locked(station_id):
+            station = self.get_station(station_id)
+            if station is None:
+                columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+                vertices = np.zeros((0, 2))
+                satellites, instruments = [], []
+            else:
+                columns, vertices = _get_kept_rows(station, start_time, end_time, retention)
+                satellites, instruments = list(station.meta["satellites"]), list(station.meta["instruments"])
+
+            sat_indices = {sat["name"]: i for i, sat in enumerate(satellites)}
+            instrument_indices = {instrument: i for i, instrument in enumerate(instruments)}
+            for overpass, (values, _) in zip(passes, new_rows):
+                if overpass.satellite.name not in sat_indices:
+                    sat_indices[overpass.satellite.name] = len(satellites)
+                    satellites.append({"name": overpass.satellite.name,
+                                       "schedule_name": overpass.satellite.schedule_name or overpass.satellite.name})
+                if overpass.instrument not in instrument_indices:
+                    instrument_indices[overpass.instrument] = len(instruments)
+                    instruments.append(overpass.instrument)
+                values["satellite"] = sat_indices[overpass.satellite.name]
+                values["instrument"] = instrument_indices[overpass.instrument]
+
+            sizes = np.array([len(pass_vertices) for _, pass_vertices in new_rows], dtype=COLUMNS["boundary_size"])
+            starts = len(vertices) + np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            for name, dtype in COLUMNS.items():
+                if name == "boundary_start":
+                    values = starts
+                elif name == "boundary_size":
+                    values = sizes
+                else:
+                    values = [row[name] for row, _ in new_rows]
+                columns[name] = np.concatenate((columns[name], np.array(values, dtype=dtype)))
+            new_vertices = [pass_vertices for _, pass_vertices in new_rows if len(pass_vertices)]
+            vertices = np.concatenate([vertices] + new_vertices)
+
+            order = np.argsort(columns["risetime"], kind="stable")
+            columns = {name: values[order] for name, values in columns.items()}
+            meta = {"version": CATALOGUE_VERSION,
+                    "station": station_id,
+                    "satellites": satellites,
+                    "instruments": instruments}
+            self._write_station(station_id, columns, vertices, meta)
+
+    def _write_station(self, station_id, columns, vertices, meta):
+        """Write a new generation of the catalogue of the station, and make it the current one."""
+        station_dir = self._get_station_dir(station_id)
+        previous = self._get_generation(station_id)
+        number = 0 if previous is None else int(previous[len(GENERATION_PREFIX):]) + 1
+        generation = GENERATION_PREFIX + str(number)
+        generation_dir = os.path.join(station_dir, generation)
+        # left over by a write which failed
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        os.makedirs(generation_dir)
+
+        for name, values in columns.items():
+            np.save(os.path.join(generation_dir, name + ".npy"), values)
+        np.save(os.path.join(generation_dir, "boundary.npy"), vertices)
+
+        durations = columns["falltime"] - columns["risetime"]
+        meta["max_duration"] = int(durations.max() / np.timedelta64(1, "us")) if len(durations) else 0
+        with open(os.path.join(generation_dir, META_FILENAME), "w") as fd_:
+            json.dump(meta, fd_)
+
+        tmp_filename = os.path.join(station_dir, CURRENT_FILENAME + ".tmp")
+        with open(tmp_filename, "w") as fd_:
+            fd_.write(generation)
+        os.replace(tmp_filename, os.path.join(station_dir, CURRENT_FILENAME))
+        for name in os.listdir(station_dir):
+            if name.startswith(GENERATION_PREFIX) and name not in (previous, generation):
+                shutil.rmtree(os.path.join(station_dir, name), ignore_errors=True)
+        logger.debug("Wrote %d passes to the catalogue of %s", len(columns["risetime"]), station_id)
+
+
+def _get_kept_rows(station, start_time, end_time, retention):
+    """Get the columns and the boundary vertices of the passes of *station* which a new run doesn't replace."""
+    risetimes = station.columns["risetime"]
+    falltimes = station.columns["falltime"]
+    replaced = falltimes > np.datetime64(start_time, "us")
+    if end_time is not None:
+        replaced &= risetimes < np.datetime64(end_time, "us")
+    keep = ~replaced
+    if retention is not None:
+        keep &= falltimes >= np.datetime64(start_time - retention, "us")
+    columns = {name: np.asarray(values[keep]) for name, values in station.columns.items()}
+    sizes = columns["boundary_size"].astype(np.int64)
+    ends = np.cumsum(sizes)
+    # the indices of the vertices of the kept passes, contiguous from each pass start
+    indices = np.repeat(columns["boundary_start"] - ends + sizes, sizes) + np.arange(ends[-1] if len(ends) else 0)
+    columns["boundary_start"] = (ends - sizes).astype(COLUMNS["boundary_start"])
+    return columns, np.array(station.vertices[indices]).reshape(-1, 2)
+
+
+def add_to_catalogue(scheduler, start_time, allpasses, directory=None):
+    """Add the passes of the stations of *scheduler*, *allpasses* keyed by station id, to the pass catalogue."""
+    from trollsched.profiling import profiler
+    catalogue = PassCatalogue(directory)
+    for station in scheduler.stations:
+        if station.id not in allpasses:
+            continue
+        with profiler.timer("catalogue_write", station=station.id):
+            catalogue.add_passes(station.id, allpasses[station.id], start_time,
+                                 start_time + timedelta(hours=scheduler.forward), area=station.area,
+                                 coords=station.coords)
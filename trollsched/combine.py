@@ -24,27 +24,42 @@
 """
 import logging
 from datetime import datetime, timedelta
+from itertools import combinations
+
+import numpy as np
+
 from trollsched.graph import Graph
 
 logger = logging.getLogger("trollsched")
 
 
+def node_key(node):
+    """Get a hashable key for a combined node, a tuple of (pass, simulated weight) per station.
+
+    Two nodes have the same key when they are equal, but the key is computed from
+    the passes' identity keys, so comparing them does not need the orbit numbers again.
+    """
+    return tuple((p.pass_key if p is not None else None, w) for p, w in node)
+
+
+def get_pass_indices(passes_list):
+    """Get, for each station's list of passes, a mapping from pass key to index in the list."""
+    indices = []
+    for passes in passes_list:
+        index = {}
+        for i, overpass in enumerate(passes):
+            index.setdefault(overpass.pass_key, i)
+        indices.append(index)
+    return indices
+
+
 def add_graphs(graphs, passes, delay=timedelta(seconds=0)):
     """Add all graphs to one combined graph. """
     statlst = graphs.keys()
 
     def count_neq_passes(pl):
         """Counts how many satellite passes in a list are really distinct (satellite/epoch)."""
-        if len(pl):
-            r = []
-            s = 1
-            for q in pl[1:]:
-                if pl[0] != q:
-                    r.append(q)
-            s += count_neq_passes(r)
-            return s
-        else:
-            return 0
+        return len(set(node_key(pl)))
 
     for s, g in graphs.items():
         logger.debug("station: %s, order: %d", s, g.order)
@@ -56,6 +71,7 @@ def add_graphs(graphs, passes, delay=timedelta(seconds=0)):
     for s in statlst:
         grl.append(graphs[s])
         pl.append(sorted(passes[s], key=lambda x: x.risetime))
+    pidx = get_pass_indices(pl)
 
     # Rough estimate for the size of the combined passes' graph.
     n_vertices = 1
@@ -80,9 +96,12 @@ def add_graphs(graphs, passes, delay=timedelta(seconds=0)):
     # parlist = [newpasses[0]]
     #
     newpasses = [tuple((pl[s][grl[s].neighbours(0)[0] - 1], None) for s in range(len(statlst)))]
+    # The index of each new pass in newpasses, and the nodes of the next parlist, by node key.
+    newpasses_index = {node_key(newpasses[0]): 0}
     parlist = [newpasses[0]]
     while len(parlist):
         newparlist = []
+        newparkeys = set()
         for parnode in parlist:
             if parnode == stopper:
                 # All antennas reached the end of passes list in this path of
@@ -95,14 +114,18 @@ def add_graphs(graphs, passes, delay=timedelta(seconds=0)):
                 # to end.
                 continue
 
-            collected_newnodes = collect_nodes(0, parnode, grl, newgraph, newpasses, pl, delay)
+            collected_newnodes = collect_nodes(0, parnode, grl, newgraph, newpasses, pl, delay, pass_indices=pidx)
+            parkey = node_key(parnode)
 
             for newnode_list in collected_newnodes:
                 newnode = tuple(newnode_list)
-                if newnode not in newpasses:
+                newkey = node_key(newnode)
+                if newkey not in newpasses_index:
+                    newpasses_index[newkey] = len(newpasses)
                     newpasses.append(newnode)
 
-                if newnode not in newparlist:
+                if newkey not in newparkeys:
+                    newparkeys.add(newkey)
                     newparlist.append(newnode)
 
                 # Collecting the weights from each stations weight-matrix ...
@@ -113,7 +136,7 @@ def add_graphs(graphs, passes, delay=timedelta(seconds=0)):
                         if n[0] is None:
                             wl.append(0)
                         else:
-                            wl.append(n[1] or grl[s].weight(pl[s].index(p[0]) + 1, pl[s].index(n[0]) + 1))
+                            wl.append(n[1] or grl[s].weight(pidx[s][p[0].pass_key] + 1, pidx[s][n[0].pass_key] + 1))
                     except Exception:
                         logger.error(
                             "Collecting weights: stat %d - parnode %s %s - newnode %s %s",
@@ -126,11 +149,11 @@ def add_graphs(graphs, passes, delay=timedelta(seconds=0)):
 
                 # TODO: if the starting point isn't "just the first vertix",
                 # the comparison must be changed
-                if parnode == newpasses[0]:
+                if newpasses_index[parkey] == 0:
                     # "virtual" weight for the starting point.
-                    newgraph.add_arc(0, newpasses.index(parnode) + 1, w)
+                    newgraph.add_arc(0, newpasses_index[parkey] + 1, w)
 
-                newgraph.add_arc(newpasses.index(parnode) + 1, newpasses.index(newnode) + 1, w)
+                newgraph.add_arc(newpasses_index[parkey] + 1, newpasses_index[newkey] + 1, w)
 
         parlist = newparlist
 
@@ -139,11 +162,22 @@ def add_graphs(graphs, passes, delay=timedelta(seconds=0)):
     return statlst, newgraph, newpasses
 
 
-def collect_nodes(statnr, parnode, graph_set, newgraph, newpasses, passes_list, delay=timedelta(seconds=0)):
+def collect_nodes(statnr, parnode, graph_set, newgraph, newpasses, passes_list, delay=timedelta(seconds=0),
+                  pass_indices=None):
     """Collect all nodes reachable from the nodes in parnode, creating all combinations.
 
+    *pass_indices* are the indices of the passes in *passes_list*, as given by
+    :func:`get_pass_indices`, computed if not provided.
+
     RETURN: [[a1, b1], [a1, b2], ..., [a2, b1], ...]
     """
+    if pass_indices is None:
+        pass_indices = get_pass_indices(passes_list)
+
+    def index(s, overpass):
+        """Get the index of *overpass* in the passes of station *s*."""
+        return pass_indices[s][overpass.pass_key]
+
     # All collected nodes are virtually occuring at the same time, so some nodes
     # might be pulled up in the timeline to create a set "overlapping" passes.
     # If there are no more passes available for one station, None is set.
@@ -192,13 +226,13 @@ def collect_nodes(statnr, parnode, graph_set, newgraph, newpasses, passes_list,
         # It'll be processed as if it's the node which occurs in this
         # time-slot -- which it propably does, otherwise it's subjected
         # to simulation (again!).
-        gn = [passes_list[statnr].index(p[0]) + 1]
+        gn = [index(statnr, p[0]) + 1]
 
     else:
         # Special cases aside, this creates a list of neighbours to the
         # current passes node.
         try:
-            gn = g.neighbours(passes_list[statnr].index(p[0]) + 1)
+            gn = g.neighbours(index(statnr, p[0]) + 1)
         except Exception:
             print("len(passes_list)", len(passes_list), "   len(graph_set)",
                   len(graph_set), "   statnr", statnr, "   p", p)
@@ -227,7 +261,8 @@ def collect_nodes(statnr, parnode, graph_set, newgraph, newpasses, passes_list,
     else:
         # Since it's not the last element of the list parnode, we recurse and
         # then permutade all vertix-lists together.
-        col = collect_nodes(statnr + 1, parnode, graph_set, newgraph, newpasses, passes_list)
+        col = collect_nodes(statnr + 1, parnode, graph_set, newgraph, newpasses, passes_list,
+                            pass_indices=pass_indices)
 
         # Creating the permutation of all neighbours with the list returned
         # by the recursion.
@@ -260,7 +295,7 @@ def collect_nodes(statnr, parnode, graph_set, newgraph, newpasses, passes_list,
                             cc = cx[:]
                             cc.insert(0, (
                                 passes_list[statnr][n - 1],
-                                g.weight(passes_list[statnr].index(p[0]) + 1, n)
+                                g.weight(index(statnr, p[0]) + 1, n)
                             ))
                             bufflist.append(cc)
 
@@ -270,8 +305,8 @@ def collect_nodes(statnr, parnode, graph_set, newgraph, newpasses, passes_list,
                             # the recursion-list-node gets "simulated".
                             cc = [
                                 (c[0], graph_set[s].weight(
-                                 passes_list[s].index(parnode[s][0]) + 1,
-                                 passes_list[s].index(c[0]) + 1
+                                 index(s, parnode[s][0]) + 1,
+                                 index(s, c[0]) + 1
                                  )
                                  ) if c != (None, None) else (None, None)
                                 for s, c in zip(range(statnr + 1, len(parnode)), cx)
@@ -317,6 +352,160 @@ def get_combined_sched(allgraphs, allpasses, delay_sec=60):
     return statlst, [newpasses[idx - 1] for idx in path[1:-1]], (newgraph, newpasses)
 
 
+def get_station_arcs(graph):
+    """Get the arcs of a station's graph, as lists of (head, weight) for each vertex."""
+    return [list(zip(graph.neighbours(u).tolist(), graph.weight_matrix[u, graph.neighbours(u)].tolist()))
+            for u in range(graph.order)]
+
+
+def get_reception_values(graph):
+    """Get the value of receiving each pass of a station's graph.
+
+    Each arc weight scores the two passes it joins, so a pass is valued at half the
+    largest weight of the arcs leading to it.
+    """
+    weights = np.where(graph.adj_matrix, graph.weight_matrix, -np.inf).max(axis=0)
+    return np.where(np.isfinite(weights), weights / 2.0, 0).tolist()
+
+
+def longest_path(arcs, prices):
+    """Get the longest path from the first to the last vertex, the *prices* of the vertices being paid on arrival.
+
+    Returns:
+        The value of the path and its inner vertices, in order.
+    """
+    order = len(arcs)
+    dists = [-np.inf] * order
+    preds = [None] * order
+    dists[0] = 0
+    for u in range(order):
+        if dists[u] == -np.inf:
+            continue
+        for v, weight in arcs[u]:
+            candidate = dists[u] + weight - prices[v]
+            if candidate > dists[v]:
+                dists[v] = candidate
+                preds[v] = u
+    path = []
+    vertex = preds[order - 1]
+    while vertex:
+        path.append(vertex)
+        vertex = preds[vertex]
+    return dists[order - 1], path[::-1]
+
+
+def get_lagrangian_combined_sched(allgraphs, allpasses, iterations=100, tolerance=1e-4):
+    """Get the combined schedule of several stations by Lagrangian relaxation.
+
+    Each station records the passes of a path in its own graph, and the
+    combined schedule maximizes the sum of the path weights, minus a penalty for
+    each pair of stations receiving the same pass. The penalty is the smaller
+    value of the two receptions (see :func:`get_reception_values`).
+
+    The pairwise penalties are relaxed with one multiplier per pair of stations
+    and pass, so that each station is solved on its own with prices on its passes;
+    the multipliers are updated by subgradient steps. The paths found along the
+    way are improved by a local search, each station in turn taking its best path
+    given the passes of the other stations, and the best schedule is kept. The
+    minimum of the relaxed problem bounds the score of the best schedule, which
+    stops the iterations when the gap is below *tolerance*.
+
+    Returns:
+        The stations, and the list of the passes recorded by each station, in time order.
+    """
+    statlst = list(allgraphs.keys())
+    passes = [sorted(allpasses[s], key=lambda x: x.risetime) for s in statlst]
+    arcs = [get_station_arcs(allgraphs[s]) for s in statlst]
+    weights = [[dict(vertex_arcs) for vertex_arcs in station_arcs] for station_arcs in arcs]
+    values = [get_reception_values(allgraphs[s]) for s in statlst]
+
+    # The pairs of stations able to receive the same pass, with the vertices of the pass
+    # in both station graphs and the duplicate penalty.
+    vertices = [{overpass.pass_key: i + 1 for i, overpass in enumerate(station_passes)} for station_passes in passes]
+    pairs = []
+    for s, t in combinations(range(len(statlst)), 2):
+        for key, u in vertices[s].items():
+            v = vertices[t].get(key)
+            if v is not None:
+                pairs.append((s, u, t, v, min(values[s][u], values[t][v])))
+    logger.debug("%d passes can be received by two stations", len(pairs))
+
+    def get_prices(multipliers):
+        prices = [[0.0] * len(station_arcs) for station_arcs in arcs]
+        for (s, u, t, v, _), multiplier in zip(pairs, multipliers):
+            prices[s][u] += multiplier
+            prices[t][v] += multiplier
+        return prices
+
+    def score(paths):
+        total = sum(station_weights[u][v]
+                    for station_weights, path in zip(weights, paths)
+                    for u, v in zip([0] + path, path + [len(station_weights) - 1]))
+        received = [set(path) for path in paths]
+        return total - sum(penalty for s, u, t, v, penalty in pairs if u in received[s] and v in received[t])
+
+    def improve(paths):
+        paths = list(paths)
+        for _ in range(10):
+            changed = False
+            for s in range(len(statlst)):
+                received = [set(path) for path in paths]
+                prices = [0.0] * len(arcs[s])
+                for s1, u, t, v, penalty in pairs:
+                    if s1 == s and v in received[t]:
+                        prices[u] += penalty
+                    elif t == s and u in received[s1]:
+                        prices[v] += penalty
+                _, path = longest_path(arcs[s], prices)
+                if path != paths[s]:
+                    new_paths = paths[:s] + [path] + paths[s + 1:]
+                    if score(new_paths) > score(paths) + 1e-12:
+                        paths = new_paths
+                        changed = True
+            if not changed:
+                break
+        return paths
+
+    multipliers = [0.0] * len(pairs)
+    best_paths, best_score = None, -np.inf
+    best_bound = np.inf
+    step_scale = 2.0
+    stalled = 0
+    rounds = 0
+    while rounds < iterations:
+        rounds += 1
+        prices = get_prices(multipliers)
+        solutions = [longest_path(station_arcs, station_prices) for station_arcs, station_prices in zip(arcs, prices)]
+        bound = sum(value for value, _ in solutions) + sum(multipliers)
+        paths = improve([path for _, path in solutions])
+        paths_score = score(paths)
+        if paths_score > best_score:
+            best_paths, best_score = paths, paths_score
+        if bound < best_bound - 1e-12:
+            best_bound = bound
+            stalled = 0
+        else:
+            stalled += 1
+            if stalled >= 5:
+                step_scale /= 2
+                stalled = 0
+        if best_bound - best_score <= tolerance * max(abs(best_score), 1):
+            break
+
+        received = [set(path) for _, path in solutions]
+        subgradients = [int(u in received[s]) + int(v in received[t]) - 1 for s, u, t, v, _ in pairs]
+        norm = sum(subgradient ** 2 for subgradient in subgradients)
+        if norm == 0:
+            break
+        step = step_scale * (bound - best_score) / norm
+        multipliers = [min(max(multiplier + step * subgradient, 0), penalty)
+                       for multiplier, subgradient, (_, _, _, _, penalty) in zip(multipliers, subgradients, pairs)]
+    logger.debug("Lagrangian combination: score %f, bound %f after %d iterations",
+                 best_score, best_bound, rounds)
+
+    return statlst, [[station_passes[u - 1] for u in path] for station_passes, path in zip(passes, best_paths)]
+
+
 def print_matrix(m, ly=-1, lx=-1):
     """For DEBUG: Prints one of the graphs' backing matrix without
     flooding the screen.
@@ -345,36 +534,45 @@ def test_folding(g):
     return r
 
 
+def get_station_passes(station_id, graph, start_time, end_time, catalogue, dir_output):
+    """Get the passes of *station_id* from *start_time* to *end_time* which are the vertices of its *graph*.
+
+    The passes are taken from the pass *catalogue*, unless it doesn't have the same passes as the graph (the
+    catalogue has the passes of the last run only), in which case they are unpickled from *dir_output*.
+    """
+    import os
+    import pickle
+
+    passes = catalogue.get_passes(station_id, start_time, end_time)
+    if len(passes) == graph.order - 2:
+        return passes
+    logger.warning("The catalogue doesn't have the passes of the graph of %s, reading them from %s",
+                   station_id, dir_output)
+    with open(os.path.join(dir_output, "allpasses.%s.pkl" % station_id), "rb") as ph:
+        return pickle.load(ph)  # noqa: S301
+
+
 def main():
-    import logging
-    import logging.handlers
+    """Combine the schedules of the stations of a previous run, from their graphs and the pass catalogue."""
+    import argparse
     import os
     import pickle
-    from trollsched.schedule import parse_datetime
-    from trollsched.schedule import combined_stations, build_filename
+    import sys
+
+    from trollsched.catalogue import PassCatalogue
+    from trollsched.schedule import build_filename, combined_stations
+    from trollsched.utils import read_config
 
     try:
-        from trollsched.schedule import read_config
-        import argparse
-        logger = logging.getLogger("trollsched")
         parser = argparse.ArgumentParser()
         parser.add_argument("-c", "--config", default=None,
                             help="configuration file to use")
-        parser.add_argument("-s", "--start-time", type=parse_datetime,
-                            help="start time of the schedule to compute")
+        parser.add_argument("-s", "--start-time", type=datetime.fromisoformat,
+                            help="start time of the schedule to combine")
         parser.add_argument("-o", "--output-dir", default=None,
                             help="where to put generated files")
-        parser.add_argument("-x", "--xml", action="store_true",
-                            help="generate an xml request file (schedule)"
-                            )
-        parser.add_argument("-r", "--report", action="store_true",
-                            help="generate an xml report file (schedule)")
-        parser.add_argument("--scisys", action="store_true",
-                            help="generate a SCISYS schedule file")
-        parser.add_argument("-p", "--plot", action="store_true",
-                            help="generate plot images")
-        parser.add_argument("-g", "--graph", action="store_true",
-                            help="save graph info")
+        parser.add_argument("--catalogue", default=None, metavar="DIR",
+                            help="directory of the pass catalogue")
         opts = parser.parse_args()
 
         if opts.config is None:
@@ -384,58 +582,34 @@ def main():
         else:
             start_time = datetime.utcnow()
 
-        # [coords, station, area, scores], forward, start, pattern
-        station_list, forward, start, pattern = read_config(opts.config)
-
+        scheduler = read_config(opts.config)
+        if opts.output_dir:
+            scheduler.patterns["dir_output"] = opts.output_dir
         pattern_args = {
             "output_dir": opts.output_dir,
             "date": start_time.strftime("%Y%m%d"),
             "time": start_time.strftime("%H%M%S")
         }
-        dir_output = build_filename("dir_output", pattern, pattern_args)
+        dir_output = build_filename("dir_output", scheduler.patterns, pattern_args)
         if not os.path.exists(dir_output):
             print(dir_output, "does not exist!")
             sys.exit(1)
-        ph = open(os.path.join(dir_output, "opts.pkl"), "rb")
-        opts = pickle.load(ph)
-        ph.close()
+        catalogue = PassCatalogue(opts.catalogue)
+        # the options of the run
+        with open(os.path.join(dir_output, "opts.pkl"), "rb") as ph:
+            scheduler.opts = pickle.load(ph)  # noqa: S301
 
         graph = {}
         allpasses = {}
-        for coords, station, area, scores in station_list:
-            pattern_args["station"] = station
-            graph[station] = Graph()
-            graph[station].load(build_filename("file_graph", pattern, pattern_args) + ".npz")
-
-#             print "---",station,"---"
-#             print_matrix(graph[station].adj_matrix, ly=5)
-#             print_matrix(graph[station].weight_matrix, ly=5, lx=-1)
-
-#             allpasses[station] = get_passes_from_xml_file(os.path.join(opts.report,
-#                                                           "acquisition-schedule-report." + station + ".xml"))
-#             print len(allpasses[station]),allpasses[station]
-
-#             for v in graph[station].neighbours(1):
-#                 print v, " : ", allpasses[station][v].risetime, "->", graph[station].weight(1, v)
-
-            ph = open(
-                os.path.join(build_filename("dir_output", pattern, pattern_args), "allpasses.%s.pkl" % station), "rb")
-            allpasses[station] = pickle.load(ph)
-            ph.close()
-
-        from trollsched.schedule import conflicting_passes
-        totpas = []
-        for s, sp in allpasses.items():
-            print("len(sp)", s, len(sp))
-            totpas.extend(list(sp))
-        passes = sorted(totpas, key=lambda x: x.risetime)
-        cpg = conflicting_passes(passes, timedelta(seconds=600))
-        print("ALLPASSES", len(allpasses))  # ,allpasses
-        print("PASSES", len(passes))  # ,passes
-        print("CONFLGRPS", len(cpg))  # ,cpg
-        print("MAX", max([len(g) for g in cpg]))
-
-        combined_stations(opts, pattern, station_list, graph, allpasses, start_time, start, forward)
+        end_time = start_time + timedelta(hours=scheduler.forward)
+        for station in scheduler.stations:
+            pattern_args["station"] = station.id
+            graph[station.id] = Graph()
+            graph[station.id].load(build_filename("file_graph", scheduler.patterns, pattern_args) + ".npz")
+            allpasses[station.id] = get_station_passes(station.id, graph[station.id], start_time, end_time,
+                                                       catalogue, dir_output)
+
+        combined_stations(scheduler, start_time, graph, allpasses)
 
     except Exception:
         logger.exception("Something wrong happened!")
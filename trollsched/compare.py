@@ -20,15 +20,31 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Compare the request file and the confirmation file."""
+"""Compare the request file and the confirmation file.
+
+The passes of a request and of its confirmation are matched on their
+satellite, start and end times, so that the confirmed passes may come in any
+order, and all the differences between them are reported. Only the pass
+elements are compared, with their attributes compared strictly, as they are
+written: the other elements of the files and the text of the passes are not
+compared. Many archived pairs of files can be checked in one go with
+:func:`compare_batch`.
+"""
 
-import glob
 import logging
 import logging.handlers
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+#: The tags whose content is not compared
+SKIPTAGS = ["confirmed-by", "confirmed-on", "properties"]
+
+#: The attributes identifying a pass
+PASS_KEY = ("satellite", "start-time", "end-time")
+
 
 def xml_compare(x1_, x2_, reporter=None, skiptags=None):
     """Compare xml objects."""
@@ -56,8 +72,8 @@ def xml_compare(x1_, x2_, reporter=None, skiptags=None):
         if reporter:
             reporter("tail: %r != %r" % (x1_.tail, x2_.tail))
         return False
-    cl1 = x1_.getchildren()
-    cl2 = x2_.getchildren()
+    cl1 = list(x1_)
+    cl2 = list(x2_)
     if len(cl1) != len(cl2):
         if reporter:
             reporter("not the same number of passes, %i != %i"
@@ -85,38 +101,272 @@ def text_compare(t1_, t2_):
     return (t1_ or "").strip() == (t2_ or "").strip()
 
 
-def compare(file1, file2):
-    """Compare two xml files, request and confirmation."""
+def read_passes(filename):
+    """Read the passes of the request or confirmation *filename*, streaming through the file.
+
+    Returns:
+        The attributes of the passes, by satellite, start and end time, and the passes found more than once.
+    """
     import defusedxml.ElementTree as ET
-    xml1 = ET.parse(file1).getroot()
-    xml2 = ET.parse(file2).getroot()
-    if xml_compare(xml1, xml2, logger.error,
-                   ["confirmed-by", "confirmed-on", "properties"]):
+
+    passes = {}
+    duplicates = []
+    for _event, elem in ET.iterparse(filename):
+        if elem.tag == "pass":
+            key = tuple(elem.attrib.get(name) for name in PASS_KEY)
+            if key in passes:
+                duplicates.append(key)
+            passes[key] = dict(elem.attrib)
+            elem.clear()
+    return passes, duplicates
+
+
+def attrib_compare(attrib1, attrib2):
+    """Get the differences of the attributes *attrib1* and *attrib2* of a pass."""
+    differences = []
+    for name in sorted(set(attrib1) | set(attrib2)):
+        if name not in attrib2:
+            differences.append("attribute %s missing from confirmation" % name)
+        elif name not in attrib1:
+            differences.append("attribute %s missing from request" % name)
+        elif attrib1[name] != attrib2[name]:
+            differences.append("%s=%r, %s=%r" % (name, attrib1[name], name, attrib2[name]))
+    return differences
+
+
+def format_pass(key):
+    """Format the *key* of a pass for reporting."""
+    return "%s %s to %s" % key
+
+
+def compare_files(request, confirmation):
+    """Compare the passes of the *request* and *confirmation* files.
+
+    Returns:
+        The differences found, an empty list if all the passes are confirmed.
+    """
+    try:
+        requested, req_duplicates = read_passes(request)
+        confirmed, conf_duplicates = read_passes(confirmation)
+    except (IOError, SyntaxError, ValueError) as err:
+        return ["cannot read the files: %s" % str(err)]
+    differences = ["pass requested more than once: " + format_pass(key) for key in req_duplicates]
+    differences.extend("pass confirmed more than once: " + format_pass(key) for key in conf_duplicates)
+    for key, attrib in requested.items():
+        if key not in confirmed:
+            differences.append("pass not confirmed: " + format_pass(key))
+            continue
+        differences.extend("pass %s: %s" % (format_pass(key), diff)
+                           for diff in attrib_compare(attrib, confirmed[key]))
+    differences.extend("pass not requested: " + format_pass(key) for key in confirmed if key not in requested)
+    return differences
+
+
+def compare(file1, file2):
+    """Compare two xml files, request and confirmation, reporting all the differences."""
+    differences = compare_files(file1, file2)
+    for difference in differences:
+        logger.error("%s: %s", os.path.basename(file2), difference)
+    if not differences:
         logger.info("All passes confirmed.")
-        return True
-    else:
-        return False
+    return not differences
+
+
+def get_confirmation_name(request_name):
+    """Get the name of the confirmation file of *request_name*."""
+    return request_name[:-15] + "confirmation" + request_name[-8:]
 
 
-# import fnmatch
-# import pyinotify
+def is_request(filename):
+    """Check if *filename* is the name of a request file."""
+    return filename.endswith(".xml") and filename[-15:-8] == "request"
 
-# class EventHandler(pyinotify.ProcessEvent):
-#     """Manage events.
-#     """
-#     def process_IN_CLOSE_WRITE(self, event):
-#         if not fnmatch.fnmatch(event.pathname, "*-acquisition-schedule-confirmation-???.xml"):
-#             return
-#         logger.info("Processing: %s", event.pathname)
-#         reqname = event.pathname[:-20] + "request" +  event.pathname[-8:]
-#         logger.info("Validating against: %s", reqname)
-#         compare(reqname, event.pathname)
-#         sys.exit(0)
 
-#     def process_IN_MOVED_TO(self, event):
-#         self.process_IN_CLOSE_WRITE(event)
+def get_pairs(request_dir, confirmation_dir=None):
+    """Get the request files of *request_dir* and their confirmation files in *confirmation_dir*.
 
-def run():
+    The requests without confirmation files are paired with None.
+    """
+    confirmation_dir = confirmation_dir or request_dir
+    with os.scandir(confirmation_dir) as entries:
+        confirmations = {entry.name for entry in entries if entry.is_file()}
+    with os.scandir(request_dir) as entries:
+        requests = sorted(entry.path for entry in entries if entry.is_file() and is_request(entry.name))
+    pairs = []
+    for request in requests:
+        confname = get_confirmation_name(os.path.basename(request))
+        pairs.append((request, os.path.join(confirmation_dir, confname) if confname in confirmations else None))
+    return pairs
+
+
+def _compare_pair(pair):
+    request, confirmation = pair
+    if confirmation is None:
+        return ["no confirmation file"]
+    return compare_files(request, confirmation)
+
+
+def compare_batch(pairs, processes=None):
+    """Compare the pairs of request and confirmation files *pairs*, in a pool of *processes*.
+
+    Returns:
+        The differences of each request file which has some.
+    """
+    if processes == 1:
+        results = map(_compare_pair, pairs)
+        return {pair[0]: res for pair, res in zip(pairs, results) if res}
+    # a few chunks per process, as thousands of small files cost more in dispatching than in comparing
+    chunksize = max(1, len(pairs) // (4 * (processes or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(_compare_pair, pairs, chunksize=chunksize)
+        return {pair[0]: res for pair, res in zip(pairs, results) if res}
+
+
+def get_most_recent(request_dir):
+    """Get the most recent request file of *request_dir*, None if there is none."""
+    with os.scandir(request_dir) as entries:
+        requests = [entry for entry in entries if entry.is_file() and is_request(entry.name)]
+    if not requests:
+        return None
+    return max(requests, key=lambda entry: entry.stat().st_mtime).path
+
+
+def is_confirmation(filename):
+    """Check if *filename* is the name of a confirmation file."""
+    return filename.endswith(".xml") and filename[-20:-8] == "confirmation"
+
+
+def get_request_name(confirmation_name):
+    """Get the name of the request file of *confirmation_name*."""
+    return confirmation_name[:-20] + "request" + confirmation_name[-8:]
+
+
+class RequestIndex:
+    """The request files of *request_dir*, by the name of their confirmation files.
+
+    The directory is listed once, and again only when a confirmation has no request in the index.
+    """
+
+    def __init__(self, request_dir):
+        """Initialize the index."""
+        self.request_dir = request_dir
+        self.requests = {}
+        self.refresh()
+
+    def refresh(self):
+        """List the request files of the directory again."""
+        with os.scandir(self.request_dir) as entries:
+            self.requests = {get_confirmation_name(entry.name): entry.path for entry in entries
+                             if entry.is_file() and is_request(entry.name)}
+
+    def get_request(self, confirmation):
+        """Get the request file of the *confirmation* file, None if there is none."""
+        name = os.path.basename(confirmation)
+        if name not in self.requests:
+            self.refresh()
+        return self.requests.get(name)
+
+
+class ConfirmationWatcher:
+    """Check the confirmation files as soon as they are written to *confirmation_dir*.
+
+    The directory is watched with inotify for the files closed after writing or moved into it, when pyinotify is
+    available, and polled every *poll_interval* seconds otherwise. When polling, a file is checked once its size
+    and modification time are unchanged since the previous listing, so that files being written are not read.
+
+    Args:
+        confirmation_dir: the directory the confirmation files are written to.
+        request_dir: the directory of the request files, *confirmation_dir* by default.
+        poll_interval: the time between two listings of the directory when polling, in seconds.
+    """
+
+    def __init__(self, confirmation_dir, request_dir=None, poll_interval=0.2):
+        """Initialize the watcher."""
+        self.confirmation_dir = confirmation_dir
+        self.index = RequestIndex(request_dir or confirmation_dir)
+        self.poll_interval = poll_interval
+        #: Set once the directory is watched, the confirmations written from then on being checked
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._notifier = None
+
+    def process(self, path):
+        """Check the confirmation file *path* against its request.
+
+        Returns:
+            Whether all the passes are confirmed, None if *path* isn't a confirmation or has no request.
+        """
+        if not is_confirmation(os.path.basename(path)):
+            return None
+        logger.info("Processing: %s", path)
+        request = self.index.get_request(path)
+        if request is None:
+            logger.error("No request file for %s in %s", os.path.basename(path), self.index.request_dir)
+            return None
+        logger.info("Validating against: %s", request)
+        return compare(request, path)
+
+    def run(self, polling=False):
+        """Watch the directory until stopped, with inotify if available and not *polling*."""
+        if not polling:
+            try:
+                self.watch()
+                return
+            except ImportError:
+                logger.info("pyinotify is not available, polling %s instead", self.confirmation_dir)
+        self.poll()
+
+    def watch(self):
+        """Watch the directory with inotify until stopped."""
+        import pyinotify
+
+        watcher = self
+
+        class EventHandler(pyinotify.ProcessEvent):
+            """Manage events."""
+
+            def process_IN_CLOSE_WRITE(self, event):  # noqa: N802
+                watcher.process(event.pathname)
+
+            def process_IN_MOVED_TO(self, event):  # noqa: N802
+                watcher.process(event.pathname)
+
+        manager = pyinotify.WatchManager()
+        self._notifier = pyinotify.Notifier(manager, EventHandler(), timeout=int(self.poll_interval * 1000))
+        manager.add_watch(self.confirmation_dir, pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO, rec=False)
+        logger.info("Watching %s for confirmations", self.confirmation_dir)
+        self.ready.set()
+        try:
+            self._notifier.loop(callback=lambda _notifier: self._stop.is_set())
+        finally:
+            self._notifier.stop()
+
+    def _list(self):
+        with os.scandir(self.confirmation_dir) as entries:
+            return {entry.path: (entry.stat().st_mtime_ns, entry.stat().st_size) for entry in entries
+                    if entry.is_file() and is_confirmation(entry.name)}
+
+    def poll(self):
+        """Poll the directory until stopped."""
+        logger.info("Polling %s for confirmations", self.confirmation_dir)
+        checked = self._list()
+        previous = dict(checked)
+        self.ready.set()
+        while not self._stop.wait(self.poll_interval):
+            current = self._list()
+            for path, stat in current.items():
+                if previous.get(path) == stat and checked.get(path) != stat:
+                    checked[path] = stat
+                    self.process(path)
+            checked = {path: stat for path, stat in checked.items() if path in current}
+            previous = current
+
+    def stop(self):
+        """Stop watching."""
+        self._stop.set()
+
+
+def run(args=None):
     """Run the comparison."""
     import argparse
 
@@ -130,15 +380,25 @@ def run():
     parser.add_argument("-v", "--verbose", help="activate debug messages",
                         action="store_true")
     parser.add_argument("-l", "--log", help="file to log to")
-#    parser.add_argument("-w", "--watch",
-#                        help="directory to watch for new confirmation files")
+    parser.add_argument("-w", "--watch",
+                        help="directory to watch for new confirmation files")
+    parser.add_argument("--requests",
+                        help="directory of the request files of the watched confirmations (the watched directory "
+                        "by default)")
+    parser.add_argument("--poll", type=float, default=None, metavar="SECONDS",
+                        help="poll the watched directory at this interval instead of using inotify")
     parser.add_argument("-r", "--most-recent",
                         help="check the most recent request against the" +
                         " corresponding confirmation, from the given directory")
     parser.add_argument("-c", "--confirmation",
                         help="directory for the confirmation files")
+    parser.add_argument("-b", "--batch",
+                        help="check all the requests of the given directory against the corresponding "
+                        "confirmations")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of processes checking the files in batch mode (the number of cpus by default)")
 
-    opts = parser.parse_args()
+    opts = parser.parse_args(args)
 
     if opts.log:
         handler = logging.handlers.TimedRotatingFileHandler(opts.log,
@@ -172,31 +432,37 @@ def run():
     if opts.file:
         compare(opts.file[0], opts.file[1])
 
-    # if opts.watch:
-    #     wm = pyinotify.WatchManager() # Watch Manager
-    #     mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
-    #     handler = EventHandler()
-    #     notifier = pyinotify.Notifier(wm, handler)
-    #     wdd = wm.add_watch(opts.watch, mask, rec=False)
-
-    #     notifier.loop()
+    if opts.batch:
+        pairs = get_pairs(opts.batch, opts.confirmation)
+        differences = compare_batch(pairs, opts.processes)
+        for request in sorted(differences):
+            for difference in differences[request]:
+                logger.error("%s: %s", os.path.basename(request), difference)
+        logger.info("%d of %d requests confirmed.", len(pairs) - len(differences), len(pairs))
 
     if opts.most_recent:
-        logger.debug("looking for most recent file in " +
-                     os.path.join(opts.most_recent, "*request*.xml"))
-        filelist = glob.glob(os.path.join(opts.most_recent, "*request*.xml"))
-        newest = max(filelist, key=lambda x: os.stat(x).st_mtime)
+        logger.debug("looking for most recent file in " + opts.most_recent)
+        newest = get_most_recent(opts.most_recent)
+        if newest is None:
+            logger.error("No request file in %s", opts.most_recent)
+            return
         logger.debug("checking " + newest)
         reqdir, newfile = os.path.split(newest)
         confdir = opts.confirmation or reqdir
-        confname = os.path.join(confdir,
-                                newfile[:-15] + "confirmation" + newfile[-8:])
+        confname = os.path.join(confdir, get_confirmation_name(newfile))
         logger.debug("against " + confname)
         try:
             compare(newest, confname)
         except IOError:
             logger.exception("Something went wrong!")
 
+    if opts.watch:
+        watcher = ConfirmationWatcher(opts.watch, opts.requests, opts.poll or 0.2)
+        try:
+            watcher.run(polling=opts.poll is not None)
+        except KeyboardInterrupt:
+            pass
+
 
 if __name__ == "__main__":
     run()
@@ -27,23 +27,50 @@ import os
 import logging
 import logging.handlers
 import numpy as np
-import matplotlib as mpl
-MPL_BACKEND = mpl.get_backend()
 
 logger = logging.getLogger(__name__)
 
-try:
-    import cartopy.crs as ccrs
-    import cartopy.feature as cfeature
-    BASEMAP_NOT_CARTOPY = False
-except ImportError:
-    logger.warning("Failed loading Cartopy, will try Basemap instead")
-    BASEMAP_NOT_CARTOPY = True
-
-if not BASEMAP_NOT_CARTOPY:
-    import cartopy
-    cartopy.config['pre_existing_data_dir'] = os.environ.get(
-        "CARTOPY_PRE_EXISTING_DATA_DIR", cartopy.config['pre_existing_data_dir'])
+# matplotlib and Cartopy are slow to import, so they are only loaded when
+# something is actually drawn.
+_MPL_BACKEND = None
+_MAPPER = None
+
+
+def _get_mpl_backend():
+    """Get the matplotlib backend which was active before we started plotting."""
+    global _MPL_BACKEND
+    if _MPL_BACKEND is None:
+        import matplotlib as mpl
+        _MPL_BACKEND = mpl.get_backend()
+    return _MPL_BACKEND
+
+
+def _get_mapper():
+    """Get the mapper class, Cartopy if available, Basemap otherwise."""
+    global _MAPPER
+    if _MAPPER is None:
+        _get_mpl_backend()
+        try:
+            import cartopy
+        except ImportError:
+            logger.warning("Failed loading Cartopy, will try Basemap instead")
+            _MAPPER = MapperBasemap
+        else:
+            cartopy.config['pre_existing_data_dir'] = os.environ.get(
+                "CARTOPY_PRE_EXISTING_DATA_DIR", cartopy.config['pre_existing_data_dir'])
+            _MAPPER = MapperCartopy
+    return _MAPPER
+
+
+def __getattr__(name):
+    """Resolve the plotting backend related attributes lazily."""
+    if name == "Mapper":
+        return _get_mapper()
+    if name == "BASEMAP_NOT_CARTOPY":
+        return _get_mapper() is MapperBasemap
+    if name == "MPL_BACKEND":
+        return _get_mpl_backend()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 class MapperBasemap(object):
@@ -86,7 +113,10 @@ class MapperCartopy(object):
 
     def __init__(self, **proj_info):
 
-        mpl.use(MPL_BACKEND)
+        import cartopy.crs as ccrs
+        import cartopy.feature as cfeature
+        import matplotlib as mpl
+        mpl.use(_get_mpl_backend())
         import matplotlib.pyplot as plt
 
         if not proj_info:
@@ -112,7 +142,9 @@ class MapperCartopy(object):
         self._ax.gridlines()
 
     def plot(self, *args, **kwargs):
-        mpl.use(MPL_BACKEND)
+        import cartopy.crs as ccrs
+        import matplotlib as mpl
+        mpl.use(_get_mpl_backend())
         import matplotlib.pyplot as plt
 
         kwargs['transform'] = ccrs.Geodetic()
@@ -136,10 +168,13 @@ class MapperCartopy(object):
         pass
 
 
-if BASEMAP_NOT_CARTOPY:
-    Mapper = MapperBasemap
-else:
-    Mapper = MapperCartopy
+def get_fig_filename(sat_name, instrument, risetime, falltime, extension=".png"):
+    """Get the filename of the figure of the pass of *sat_name* from *risetime* to *falltime*."""
+    return "{rise}_{satname}_{instrument}_{fall}{extension}".format(rise=risetime.strftime("%Y%m%d%H%M%S"),
+                                                                    satname=sat_name.replace(" ", "_"),
+                                                                    instrument=instrument.replace("/", "-"),
+                                                                    fall=falltime.strftime("%Y%m%d%H%M%S"),
+                                                                    extension=extension)
 
 
 def save_fig(pass_obj,
@@ -161,23 +196,19 @@ def save_fig(pass_obj,
     if not isinstance(poly_color, (list, tuple)):
         poly_color = [poly_color]
 
+    import matplotlib as mpl
+    _get_mpl_backend()
     mpl.use('Agg')
     import matplotlib.pyplot as plt
     plt.clf()
 
     logger.debug("Save fig " + str(pass_obj))
-    rise = pass_obj.risetime.strftime("%Y%m%d%H%M%S")
-    fall = pass_obj.falltime.strftime("%Y%m%d%H%M%S")
     if not os.path.exists(directory):
         logger.debug("Create plot dir " + directory)
         os.makedirs(directory)
 
-    filename = '{rise}_{satname}_{instrument}_{fall}{extension}'.format(rise=rise,
-                                                                        satname=pass_obj.satellite.name.replace(
-                                                                            " ", "_"),
-                                                                        instrument=pass_obj.instrument.replace(
-                                                                            "/", "-"),
-                                                                        fall=fall, extension=extension)
+    filename = get_fig_filename(pass_obj.satellite.name, pass_obj.instrument,
+                                pass_obj.risetime, pass_obj.falltime, extension)
     filepath = os.path.join(directory, filename)
     pass_obj.fig = filepath
     if not overwrite and os.path.exists(filepath):
@@ -185,7 +216,7 @@ def save_fig(pass_obj,
 
     logger.debug("Filename = <%s>", filepath)
     plot_parameters = plot_parameters or {}
-    with Mapper(**plot_parameters) as mapper:
+    with _get_mapper()(**plot_parameters) as mapper:
         mapper.nightshade(pass_obj.uptime, alpha=0.2)
         for i, polygon in enumerate(poly):
             try:
@@ -217,11 +248,12 @@ def show(pass_obj,
          outline='-r'):
     """Show the current pass on screen (matplotlib, basemap).
     """
-    mpl.use(MPL_BACKEND)
+    import matplotlib as mpl
+    mpl.use(_get_mpl_backend())
     import matplotlib.pyplot as plt
 
     proj = proj or {}
-    with Mapper(**proj) as mapper:
+    with _get_mapper()(**proj) as mapper:
         mapper.nightshade(pass_obj.uptime, alpha=0.2)
         draw(pass_obj.boundary.contour_poly, mapper, outline)
         if poly is not None:
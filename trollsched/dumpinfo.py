@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fetch and cache the information on the Aqua and Terra global dumps.
+
+The dump reports (``wotis.*.rpt`` files) are listed and downloaded from the
+ftp server, reusing the same connections for both satellites and downloading
+the missing reports in parallel. The parsed reports are kept in a json dump
+table on disk, so that each report is only downloaded and parsed once, and
+reports older than a given time to live are evicted from the table.
+"""
+
+import ftplib
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from trollsched.utils import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+HOST = "ftp://is.sci.gsfc.nasa.gov/ancillary/ephemeris/schedule/%s/downlink/"
+
+DUMP_SATELLITES = ("aqua", "terra")
+
+#: How long parsed reports are kept in the dump table
+DEFAULT_TTL = timedelta(days=14)
+
+#: How often the ftp server is checked for new reports
+DEFAULT_REFRESH_INTERVAL = timedelta(hours=1)
+
+#: How long to wait for the ftp server, in seconds
+DEFAULT_TIMEOUT = 30
+
+
+def is_report(filename):
+    """Check if *filename* is the name of a dump report."""
+    return filename.startswith("wotis.") and filename.endswith(".rpt")
+
+
+def get_report_date(filename):
+    """Get the date of a dump report from its *filename*."""
+    return datetime.strptime("".join(filename.split(".")[2:4]), "%Y%j%H%M%S")
+
+
+def parse_report(lines):
+    """Parse the *lines* of a dump report into a list of dumps."""
+    dumps = []
+    for line in lines[7::2]:
+        if line.strip() == "":
+            break
+        station, aos, elev, los = line.split()[:4]
+        aos = datetime.strptime(aos, "%Y:%j:%H:%M:%S")
+        los = datetime.strptime(los, "%Y:%j:%H:%M:%S")
+        dumps.append({"station": station, "aos": aos, "los": los, "elev": elev})
+    return dumps
+
+
+class DumpTable:
+    """The parsed dump reports, per satellite, stored as json in *filename*."""
+
+    def __init__(self, filename, ttl=DEFAULT_TTL):
+        """Initialize the table, loading it from *filename* if it exists."""
+        self.filename = filename
+        self.ttl = ttl
+        self._reports = {}
+        self.load()
+
+    def load(self):
+        """Load the table from disk."""
+        try:
+            with open(self.filename) as fd_:
+                stored = json.load(fd_)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning("Corrupt dump table %s, starting from scratch", self.filename)
+            return
+        for sat, reports in stored.items():
+            self._reports[sat] = {name: [{"station": dump["station"],
+                                          "aos": datetime.fromisoformat(dump["aos"]),
+                                          "los": datetime.fromisoformat(dump["los"]),
+                                          "elev": dump["elev"]}
+                                         for dump in dumps]
+                                  for name, dumps in reports.items()}
+
+    def save(self):
+        """Save the table to disk, atomically."""
+        stored = {sat: {name: [{"station": dump["station"],
+                                "aos": dump["aos"].isoformat(),
+                                "los": dump["los"].isoformat(),
+                                "elev": dump["elev"]}
+                               for dump in dumps]
+                        for name, dumps in reports.items()}
+                  for sat, reports in self._reports.items()}
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as fd_:
+            json.dump(stored, fd_)
+        os.replace(tmp_filename, self.filename)
+
+    def has_report(self, sat_name, report_name):
+        """Check if the report *report_name* of satellite *sat_name* is in the table."""
+        return report_name in self._reports.get(sat_name, {})
+
+    def add_report(self, sat_name, report_name, dumps):
+        """Add the *dumps* of report *report_name* for satellite *sat_name*."""
+        self._reports.setdefault(sat_name, {})[report_name] = dumps
+
+    def evict(self, now=None):
+        """Remove the reports which are older than the time to live."""
+        oldest = (now or datetime.utcnow()) - self.ttl
+        for reports in self._reports.values():
+            for name in [name for name in reports if get_report_date(name) < oldest]:
+                del reports[name]
+
+    def get_dumps(self, sat_name):
+        """Get all the dumps of satellite *sat_name*, ordered by report date."""
+        reports = self._reports.get(sat_name, {})
+        dumps = []
+        for name in sorted(reports, key=get_report_date):
+            dumps.extend(reports[name])
+        return dumps
+
+
+class DumpInfoFetcher:
+    """Fetch the dump reports from the ftp server into a dump table.
+
+    Args:
+        url_template: the url of the report directories, with a `%s` placeholder for the satellite name.
+        cache_dir: where to store the dump table, defaults to the scheduler's cache directory.
+        ttl: how long to keep the parsed reports.
+        max_workers: the maximum number of parallel downloads (and ftp connections).
+        refresh_interval: how often to check the ftp server for new reports.
+        ftp_class: the class to create ftp connections with, for example `ftplib.FTP` for servers without TLS.
+        timeout: how long to wait for the ftp server, in seconds, before giving up on it.
+    """
+
+    def __init__(self, url_template=HOST, cache_dir=None, ttl=DEFAULT_TTL, max_workers=4,
+                 refresh_interval=DEFAULT_REFRESH_INTERVAL, ftp_class=ftplib.FTP_TLS, timeout=DEFAULT_TIMEOUT):
+        """Initialize the fetcher."""
+        self.url_template = url_template
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        self.ftp_class = ftp_class
+        cache_dir = cache_dir or get_cache_dir("dumps")
+        self.table = DumpTable(os.path.join(cache_dir, "dump_table.json"), ttl=ttl)
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+    def get_dumps(self, sat_name):
+        """Get the dumps for satellite *sat_name*, refreshing the table first if needed."""
+        with self._lock:
+            if (self._last_refresh is None or
+                    datetime.utcnow() - self._last_refresh > self.refresh_interval):
+                self.refresh()
+        return self.table.get_dumps(sat_name)
+
+    def refresh(self, sat_names=DUMP_SATELLITES):
+        """Download the reports of *sat_names* missing from the table."""
+        self._last_refresh = datetime.utcnow()
+        self.table.evict()
+        oldest = datetime.utcnow() - self.table.ttl
+        pool = _ConnectionPool(self._connect, self.max_workers)
+        try:
+            missing = []
+            with pool.connection() as ftp:
+                for sat_name in sat_names:
+                    path = urlparse(self.url_template % sat_name).path
+                    listing = []
+                    ftp.dir(path, listing.append)
+                    missing.extend((sat_name, path, name) for name in (line.split()[-1] for line in listing)
+                                   if is_report(name) and not self.table.has_report(sat_name, name) and
+                                   get_report_date(name) >= oldest)
+            logger.debug("Downloading %d new dump reports", len(missing))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = executor.map(lambda args: self._download(pool, *args), missing)
+                for (sat_name, _path, name), lines in zip(missing, results):
+                    if lines is not None:
+                        self.table.add_report(sat_name, name, parse_report(lines))
+        except ftplib.all_errors as err:
+            logger.error("Cannot get the dump info from %s: %s", self.url_template, str(err))
+            logger.info("Using cached dump info")
+        finally:
+            pool.close()
+        self.table.save()
+
+    def _connect(self):
+        """Open a new connection to the ftp server."""
+        url = urlparse(self.url_template % DUMP_SATELLITES[0])
+        logger.debug("Connect to ftp server %s", url.netloc)
+        ftp = self.ftp_class(url.netloc, timeout=self.timeout)
+        try:
+            ftp.login("anonymous", "guest")
+            if hasattr(ftp, "prot_p"):
+                ftp.prot_p()  # explicitly call for protected transfer
+        except ftplib.all_errors:
+            ftp.close()
+            raise
+        return ftp
+
+    @staticmethod
+    def _download(pool, sat_name, path, name):
+        """Download the report *name* from *path*."""
+        lines = []
+        with pool.connection() as ftp:
+            try:
+                ftp.retrlines("RETR " + os.path.join(path, name), lines.append)
+            except ftplib.error_perm:
+                logger.info("Permission error (???) on ftp server, skipping %s.", name)
+                return None
+        return lines
+
+
+class _ConnectionPool:
+    """A pool of at most *size* ftp connections, created on demand."""
+
+    def __init__(self, connect, size):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._all = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        return _PooledConnection(self)
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            ftp = self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._all.append(ftp)
+        return ftp
+
+    def release(self, ftp):
+        self._idle.put(ftp)
+        self._slots.release()
+
+    def discard(self, ftp):
+        """Close *ftp* instead of putting it back, as it failed."""
+        with self._lock:
+            self._all.remove(ftp)
+        ftp.close()
+        self._slots.release()
+
+    def close(self):
+        for ftp in self._all:
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+        self._all = []
+
+
+class _PooledConnection:
+    """Context manager borrowing a connection from a pool, and closing it if it fails."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._ftp = None
+
+    def __enter__(self):
+        self._ftp = self._pool.acquire()
+        return self._ftp
+
+    def __exit__(self, etype, value, tb):
+        if etype is None:
+            self._pool.release(self._ftp)
+        else:
+            self._pool.discard(self._ftp)
+
+
+_fetchers = {}
+
+
+def get_dump_fetcher(url_template=None):
+    """Get the shared fetcher for *url_template*."""
+    url_template = url_template if isinstance(url_template, str) else HOST
+    try:
+        return _fetchers[url_template]
+    except KeyError:
+        fetcher = _fetchers[url_template] = DumpInfoFetcher(url_template)
+        return fetcher
@@ -0,0 +1,162 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Minimum cost flows, to schedule the passes over the antennas of a station.
+
+The passes of a station with *k* antennas are scheduled as a flow of *k* units
+along a time line: each unit of flow is an antenna, following the time line
+when idle, or taking the arc of a pass from its risetime to its falltime
+(plus the delay between passes) when recording it. The arcs of the passes have
+a capacity of one and the opposite of the pass score as cost, so the minimum
+cost flow records the best set of passes the antennas can take.
+"""
+
+import heapq
+
+
+class FlowNetwork:
+    """A flow network, solved for the minimum cost flow by successive shortest paths.
+
+    The vertices are numbered from 0 to *order* - 1, and are expected to be in
+    topological order: the arcs added go from a vertex to a vertex with a higher
+    number. The costs are integers, so that the shortest paths are exact.
+    """
+
+    def __init__(self, order):
+        """Set up a network of *order* vertices without arcs."""
+        self.order = order
+        # arcs as [head, capacity, cost, index of the reverse arc], by tail
+        self.arcs = [[] for _ in range(order)]
+
+    def add_arc(self, tail, head, capacity, cost):
+        """Add an arc from *tail* to *head*, and return its key for :meth:`get_flow`."""
+        if head <= tail:
+            raise ValueError("Arcs must follow the order of the vertices, got %d -> %d" % (tail, head))
+        self.arcs[tail].append([head, capacity, cost, len(self.arcs[head])])
+        self.arcs[head].append([tail, 0, -cost, len(self.arcs[tail]) - 1])
+        return tail, len(self.arcs[tail]) - 1
+
+    def get_flow(self, key):
+        """Get the flow along the arc *key*, as returned by :meth:`add_arc`."""
+        tail, idx = key
+        head, _, _, rev = self.arcs[tail][idx]
+        return self.arcs[head][rev][1]
+
+    def _get_initial_potentials(self, source):
+        """Get the distances from *source*, relaxing the arcs in topological order as the costs can be negative."""
+        dists = [None] * self.order
+        dists[source] = 0
+        for tail in range(source, self.order):
+            if dists[tail] is None:
+                continue
+            for head, capacity, cost, _ in self.arcs[tail]:
+                if capacity > 0 and head > tail and (dists[head] is None or dists[tail] + cost < dists[head]):
+                    dists[head] = dists[tail] + cost
+        return dists
+
+    def min_cost_flow(self, source, sink, flow):
+        """Send up to *flow* units from *source* to *sink* at minimum cost, in a network without flow yet.
+
+        Returns:
+            The flow sent and its cost.
+        """
+        potentials = self._get_initial_potentials(source)
+        sent = 0
+        total_cost = 0
+        while sent < flow:
+            # Dijkstra on the costs reduced by the potentials, which are never negative
+            dists = [None] * self.order
+            preds = [None] * self.order
+            dists[source] = 0
+            heap = [(0, source)]
+            while heap:
+                dist, tail = heapq.heappop(heap)
+                if dist > dists[tail]:
+                    continue
+                for idx, (head, capacity, cost, _) in enumerate(self.arcs[tail]):
+                    if capacity <= 0 or potentials[head] is None:
+                        continue
+                    new_dist = dist + cost + potentials[tail] - potentials[head]
+                    if dists[head] is None or new_dist < dists[head]:
+                        dists[head] = new_dist
+                        preds[head] = (tail, idx)
+                        heapq.heappush(heap, (new_dist, head))
+            if dists[sink] is None:
+                break
+            for vertex in range(self.order):
+                if dists[vertex] is not None:
+                    potentials[vertex] += dists[vertex]
+
+            amount = flow - sent
+            vertex = sink
+            while vertex != source:
+                tail, idx = preds[vertex]
+                amount = min(amount, self.arcs[tail][idx][1])
+                vertex = tail
+            vertex = sink
+            while vertex != source:
+                tail, idx = preds[vertex]
+                arc = self.arcs[tail][idx]
+                arc[1] -= amount
+                self.arcs[vertex][arc[3]][1] += amount
+                total_cost += amount * arc[2]
+                vertex = tail
+            sent += amount
+        return sent, total_cost
+
+
+def schedule_antennas(passes, scores, antennas, delay):
+    """Schedule *passes* over a number of *antennas*, maximizing the total score.
+
+    Args:
+        passes: the passes to schedule.
+        scores: the integer scores of the passes, the passes with a score of None are never scheduled.
+        antennas: the number of antennas.
+        delay: the minimum time between two passes recorded by the same antenna.
+
+    Returns:
+        The lists of the passes recorded by each antenna, in time order.
+    """
+    times = sorted(set([overpass.risetime for overpass in passes] +
+                       [overpass.falltime + delay for overpass in passes]))
+    if not times:
+        return [[] for _ in range(antennas)]
+    vertex = {time: idx for idx, time in enumerate(times)}
+    network = FlowNetwork(len(times))
+    for idx in range(len(times) - 1):
+        network.add_arc(idx, idx + 1, antennas, 0)
+    pass_arcs = {}
+    for overpass, score in zip(passes, scores):
+        if score is not None:
+            key = network.add_arc(vertex[overpass.risetime], vertex[overpass.falltime + delay], 1, -score)
+            pass_arcs.setdefault(key[0], []).append((key, overpass))
+    network.min_cost_flow(0, len(times) - 1, antennas)
+
+    # Follow each unit of flow along the time line, taking the passes on its way
+    taken = {tail: [overpass for key, overpass in arcs if network.get_flow(key) > 0]
+             for tail, arcs in pass_arcs.items()}
+    schedules = []
+    for _ in range(antennas):
+        schedule = []
+        idx = 0
+        while idx < len(times) - 1:
+            if taken.get(idx):
+                overpass = taken[idx].pop(0)
+                schedule.append(overpass)
+                idx = vertex[overpass.falltime + delay]
+            else:
+                idx += 1
+        schedules.append(schedule)
+    return schedules
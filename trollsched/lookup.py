@@ -0,0 +1,298 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Look the passes of the scheduler's last runs up, without predicting them again.
+
+The passes are taken from the pass catalogue (see :mod:`trollsched.catalogue`),
+with the swath boundaries, maximum elevations, directions and scores the
+scheduler computed, either directly with :class:`PassLookup`, or through a
+local http server (on a port or a unix socket) with :class:`RemotePassLookup`,
+for tools which don't have access to the catalogue's directory. The server
+answers::
+
+  GET /pass?satellite=SAT&time=TIME[&station=STATION]
+  GET /passes?station=STATION[&start=START][&end=END][&satellite=SAT]
+  GET /find?station=STATION&satellite=SAT&start=RISETIME&end=FALLTIME
+
+with the passes as json, the times being iso times.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def pass_to_dict(overpass):
+    """Get the values of a catalogue pass as a json serializable dict, the boundary vertices being in radians."""
+    try:
+        boundary = np.asarray(overpass.boundary.vertices).tolist()
+    except AttributeError:
+        boundary = None
+    return {"satellite": overpass.satellite.name,
+            "schedule_name": overpass.satellite.schedule_name,
+            "station": overpass.station,
+            "risetime": overpass.risetime.isoformat(),
+            "falltime": overpass.falltime.isoformat(),
+            "uptime": overpass.uptime.isoformat(),
+            "instrument": overpass.instrument,
+            "orbit": overpass.orbit,
+            "max_elev": overpass.max_elev,
+            "direction": overpass.direction,
+            "rec": overpass.rec,
+            "score": overpass.area_score,
+            "boundary": boundary}
+
+
+def pass_from_dict(values):
+    """Get a catalogue pass from its *values*, as given by :func:`pass_to_dict`."""
+    from trollsched.catalogue import CatalogueBoundary, CataloguePass
+    from trollsched.schedule import Satellite
+
+    boundary = None
+    if values["boundary"] is not None:
+        boundary = CatalogueBoundary(np.array(values["boundary"], dtype=np.float64))
+    return CataloguePass(Satellite(values["satellite"], 0, 0, schedule_name=values["schedule_name"]),
+                         datetime.fromisoformat(values["risetime"]), datetime.fromisoformat(values["falltime"]),
+                         datetime.fromisoformat(values["uptime"]), values["instrument"], orbit=values["orbit"],
+                         max_elev=values["max_elev"], direction=values["direction"], rec=values["rec"],
+                         score=values["score"], boundary=boundary, station=values["station"])
+
+
+class PassLookup:
+    """Look passes up in the pass *catalogue*, a :class:`~trollsched.catalogue.PassCatalogue` or its directory."""
+
+    def __init__(self, catalogue=None):
+        """Initialize the lookup."""
+        from trollsched.catalogue import PassCatalogue
+        if not isinstance(catalogue, PassCatalogue):
+            catalogue = PassCatalogue(catalogue)
+        self.catalogue = catalogue
+
+    def get_passes(self, station_id, start=None, end=None, satellite=None):
+        """Get the passes of *station_id* overlapping *start* to *end*, of all satellites or of *satellite*."""
+        return self.catalogue.get_passes(station_id, start, end, satellite)
+
+    def get_pass(self, satellite, utctime, station_id=None):
+        """Get the pass of *satellite* over *station_id*, or any station, at *utctime*.
+
+        When the satellite passes over several stations at that time, the pass of a station which scheduled it is
+        preferred.
+
+        Returns:
+            The pass, or None if the satellite isn't passing over the station(s) at *utctime*.
+        """
+        station_ids = [station_id] if station_id else self.catalogue.get_station_ids()
+        passes = []
+        for station in station_ids:
+            passes.extend(self.catalogue.get_passes(station, utctime, utctime + timedelta(microseconds=1),
+                                                    satellite))
+        passes.sort(key=lambda overpass: not overpass.rec)
+        return passes[0] if passes else None
+
+    def find_pass(self, station_id, satellite, risetime, falltime):
+        """Find the pass of *satellite* over *station_id* rising at *risetime* and falling at *falltime*.
+
+        Returns:
+            The pass, or None if there is no such pass in the catalogue.
+        """
+        return self.catalogue.find_pass(station_id, satellite, risetime, falltime)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An http connection over a unix socket."""
+
+    def __init__(self, path, timeout=10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RemotePassLookup:
+    """Look passes up through a pass lookup server at *address*.
+
+    Args:
+        address: the url of the server, `http://host:port` or `unix:///path/to/socket`.
+        timeout: the timeout of the requests, in seconds.
+    """
+
+    def __init__(self, address, timeout=10):
+        """Initialize the lookup."""
+        self.address = urlparse(address)
+        if self.address.scheme not in ("http", "unix"):
+            raise ValueError("Unsupported pass lookup address %s" % address)
+        self.timeout = timeout
+
+    def _request(self, path, **params):
+        if self.address.scheme == "unix":
+            connection = _UnixHTTPConnection(self.address.path, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.address.hostname, self.address.port, timeout=self.timeout)
+        params = {name: value.isoformat() if isinstance(value, datetime) else value
+                  for name, value in params.items() if value is not None}
+        try:
+            connection.request("GET", path + "?" + urlencode(params))
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        if response.status == 404:
+            return None
+        if response.status != 200:
+            raise IOError("Pass lookup failed with %d: %s" % (response.status, body.decode("utf-8", "replace")))
+        return json.loads(body)
+
+    def get_passes(self, station_id, start=None, end=None, satellite=None):
+        """Get the passes of *station_id* overlapping *start* to *end*, of all satellites or of *satellite*."""
+        values = self._request("/passes", station=station_id, start=start, end=end, satellite=satellite)
+        return [pass_from_dict(pass_values) for pass_values in values or []]
+
+    def get_pass(self, satellite, utctime, station_id=None):
+        """Get the pass of *satellite* over *station_id*, or any station, at *utctime*, or None."""
+        values = self._request("/pass", satellite=satellite, time=utctime, station=station_id)
+        return values and pass_from_dict(values)
+
+    def find_pass(self, station_id, satellite, risetime, falltime):
+        """Find the pass of *satellite* over *station_id* rising at *risetime* and falling at *falltime*, or None."""
+        values = self._request("/find", station=station_id, satellite=satellite, start=risetime, end=falltime)
+        return values and pass_from_dict(values)
+
+
+def get_pass_lookup(address=None, catalogue=None):
+    """Get a lookup of the passes through the server at *address* if given, in the *catalogue* otherwise."""
+    if address:
+        return RemotePassLookup(address)
+    return PassLookup(catalogue)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_passes(lookup, port=None, host="localhost", socket_path=None):
+    """Serve the passes of *lookup* over http on *host*:*port*, or on the unix socket *socket_path*.
+
+    The server runs in a daemon thread.
+
+    Returns:
+        The server, to be stopped with its `shutdown` method.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    def get_time(params, name):
+        return params.get(name) and datetime.fromisoformat(params[name])
+
+    def get_pass(params):
+        return lookup.get_pass(params["satellite"], get_time(params, "time"), params.get("station"))
+
+    def get_passes(params):
+        return lookup.get_passes(params["station"], get_time(params, "start"), get_time(params, "end"),
+                                 params.get("satellite"))
+
+    def find_pass(params):
+        return lookup.find_pass(params["station"], params["satellite"], get_time(params, "start"),
+                                get_time(params, "end"))
+
+    queries = {"/pass": get_pass, "/passes": get_passes, "/find": find_pass}
+
+    class PassHandler(BaseHTTPRequestHandler):
+        """Serve the passes."""
+
+        def do_GET(self):  # noqa: N802
+            url = urlparse(self.path)
+            if url.path not in queries:
+                self.send_error(404)
+                return
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                res = queries[url.path](params)
+            except (KeyError, TypeError, ValueError) as err:
+                self.send_error(400, explain=str(err))
+                return
+            if res is None:
+                self.send_error(404)
+                return
+            if isinstance(res, list):
+                res = [pass_to_dict(overpass) for overpass in res]
+            else:
+                res = pass_to_dict(res)
+            body = json.dumps(res).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):  # noqa: A002
+            logger.debug("Pass lookup request: " + format, *args)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, PassHandler)
+        where = "unix://" + socket_path
+    else:
+        server = ThreadingHTTPServer((host, port or 0), PassHandler)
+        server.daemon_threads = True
+        where = "http://%s:%d" % (host, server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, name="trollsched-lookup", daemon=True)
+    thread.start()
+    logger.info("Serving passes on %s", where)
+    return server
+
+
+def main(args=None):
+    """Serve the passes of the catalogue until interrupted."""
+    parser = argparse.ArgumentParser(description="Serve the passes of the scheduler's pass catalogue over http.")
+    parser.add_argument("--catalogue", default=None, metavar="DIR",
+                        help="directory of the pass catalogue (the 'catalogue' directory of the cache directory "
+                             "by default)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-p", "--port", type=int, help="port to serve the passes on")
+    group.add_argument("--socket", default=None, metavar="PATH", help="unix socket to serve the passes on")
+    parser.add_argument("--host", default="localhost", help="host to serve the passes on (localhost by default)")
+    opts = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="[%(levelname)s: %(asctime)s : %(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+    server = serve_passes(PassLookup(opts.catalogue), opts.port, opts.host, opts.socket)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Export the scheduler's timings, counters and gauges as Prometheus metrics.
+
+The metrics are those collected by :data:`trollsched.profiling.profiler`, in
+the Prometheus text exposition format. They can be written to a file, to be
+picked up for example by the textfile collector of the node exporter, or
+served over http with :func:`serve_metrics`.
+"""
+
+import logging
+import os
+import sys
+import threading
+
+from trollsched.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "trollsched_"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#: Help texts of the known metrics
+HELP = {
+    "stage_seconds_total": "Time spent in the stages of the schedule run.",
+    "stage_calls_total": "Number of times the stages of the schedule run were entered.",
+    "passes_predicted_total": "Number of passes predicted, per satellite.",
+    "combination_cache_total": "Lookups in the cache of pass pair scores.",
+    "score_cache_total": "Lookups in the cache of pass scores.",
+    "area_cache_total": "Lookups in the cache of area definitions.",
+    "area_polygon_cache_total": "Lookups in the cache of area boundary polygons.",
+    "run_cache_total": "Lookups in the cache of whole runs.",
+    "day_night_check_total": "Polygons found on a single side of the terminator, or across it.",
+    "intersection_prefilter_total": "Polygon pairs rejected or passed by the bounding cap check before intersecting.",
+    "schedule_segments_total": "Schedule segments finalized by the streaming solver.",
+    "pass_pool_total": "Passes predicted again for overlapping periods when backfilling, found in the pool or not.",
+    "page_requests_total": "Schedule requests received by the page generator, processed or coalesced in a burst.",
+    "page_plots_total": "Pass plots of the schedule pages rendered, or skipped as they already existed.",
+    "graph_order": "Number of vertices of the schedule graph.",
+    "graph_edges": "Number of arcs of the schedule graph.",
+    "output_file_bytes": "Size of the generated files.",
+    "peak_rss_bytes": "Peak resident set size of the scheduler process.",
+}
+
+
+def get_peak_rss():
+    """Get the peak resident set size of this process in bytes, None if it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes, except on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        label_str = ",".join('%s="%s"' % (key, _escape(val)) for key, val in sorted(labels.items()))
+        return "%s%s{%s} %s" % (PREFIX, name, label_str, repr(float(value)))
+    return "%s%s %s" % (PREFIX, name, repr(float(value)))
+
+
+def generate_metrics(prof=profiler):
+    """Generate the metrics of *prof* in the Prometheus text exposition format."""
+    samples = {}
+    for record in prof.report():
+        labels = record["labels"]
+        if record["kind"] == "timer":
+            stage_labels = dict(labels, stage=record["name"])
+            samples.setdefault(("stage_seconds_total", "counter"), []).append((stage_labels, record["total"]))
+            samples.setdefault(("stage_calls_total", "counter"), []).append((stage_labels, record["calls"]))
+        elif record["kind"] == "counter":
+            samples.setdefault((record["name"] + "_total", "counter"), []).append((labels, record["value"]))
+        else:
+            samples.setdefault((record["name"], "gauge"), []).append((labels, record["value"]))
+    peak_rss = get_peak_rss()
+    if peak_rss is not None:
+        samples[("peak_rss_bytes", "gauge")] = [({}, peak_rss)]
+
+    lines = []
+    for (name, kind), values in samples.items():
+        lines.append("# HELP %s%s %s" % (PREFIX, name, HELP.get(name, name.replace("_", " ").capitalize() + ".")))
+        lines.append("# TYPE %s%s %s" % (PREFIX, name, kind))
+        lines.extend(_format_sample(name, labels, value) for labels, value in values)
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(filename, prof=profiler):
+    """Write the metrics of *prof* to *filename*, atomically so that collectors never read half a file."""
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as fd_:
+        fd_.write(generate_metrics(prof))
+    os.replace(tmp_filename, filename)
+    logger.info("Metrics written to %s", filename)
+
+
+def record_output_size(filename, **labels):
+    """Record the size of the generated file *filename* as a gauge."""
+    if profiler.enabled and os.path.exists(filename):
+        profiler.gauge("output_file_bytes", os.path.getsize(filename), file=os.path.basename(filename), **labels)
+
+
+def serve_metrics(port, host="localhost", prof=profiler):
+    """Serve the metrics of *prof* over http on *host*:*port*, from a daemon thread.
+
+    Returns:
+        The server, to be stopped with its `shutdown` method.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Serve the metrics on /metrics."""
+
+        def do_GET(self):  # noqa: N802
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = generate_metrics(prof).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # noqa: A002
+            logger.debug("Metrics request: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="trollsched-metrics", daemon=True)
+    thread.start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,283 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Generate the web pages of the schedule requests, with the swath outline plots of their passes.
+
+The :class:`PageGenerator` receives the messages announcing new schedule
+request files (from posttroll, or any iterable of messages with the file's
+``uri`` in their data) and hands them through a bounded queue to a worker
+thread, so that receiving doesn't wait for the plotting. Messages arriving in
+a burst for the same request file are coalesced into a single page. A burst
+ends when no message came for a while, but also after a maximum wait from its
+first message or at a maximum number of messages, so that steady traffic
+doesn't hold back the pages, and receiving blocks on the full queue when the
+pages can't keep up. The plots of a page are rendered in a process pool. Plots
+which already exist are not rendered again.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+from trollsched import INSTRUMENT, SATELLITE_NAMES
+from trollsched.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+#: The time format of the schedule request files
+TIME_FORMAT = "%Y-%m-%d-%H:%M:%S"
+
+#: The stylesheet of the pages
+STYLESHEET = "<?xml-stylesheet type='text/xsl' href='reqreader.xsl'?>"
+
+#: How many of the last processed requests the job registry keeps
+REGISTRY_SIZE = 5
+
+#: A pass to plot: the values of its catalogue pass (see :func:`trollsched.lookup.pass_to_dict`) if it was found,
+#: the platform name, rise and fall times and instrument to compute it again otherwise.
+PlotJob = namedtuple("PlotJob", ["values", "platform_name", "risetime", "falltime", "instrument"])
+
+_STOP = object()
+
+
+def render_pass(job, plotdir):
+    """Render the plot of the pass of *job* in *plotdir*.
+
+    Returns:
+        The filename of the plot.
+    """
+    from trollsched.drawing import save_fig
+    from trollsched.lookup import pass_from_dict
+    from trollsched.satpass import Pass
+
+    if job.values is not None:
+        overpass = pass_from_dict(job.values)
+    else:
+        overpass = Pass(job.platform_name, job.risetime, job.falltime, instrument=job.instrument)
+    save_fig(overpass, directory=plotdir)
+    return overpass.fig
+
+
+def get_plot_jobs(root, plotdir, excluded_satellites=(), lookup=None):
+    """Get the plots of the passes of the request *root*, and the jobs to render those which don't exist yet.
+
+    The passes are looked up with *lookup* (see :mod:`trollsched.lookup`) in the passes of the scheduler's last
+    runs, with their swath boundaries, and are computed again when rendering if they are not there.
+
+    Returns:
+        The pass elements with the filenames of their plots, and the pass elements with the jobs to render.
+    """
+    from trollsched.drawing import get_fig_filename
+    from trollsched.lookup import pass_to_dict
+
+    station = root.findtext("properties/station")
+    existing = []
+    jobs = []
+    for child in root:
+        if child.tag != "pass":
+            continue
+        logger.debug("Pass: %s", str(child.attrib))
+        platform_name = SATELLITE_NAMES.get(child.attrib["satellite"], child.attrib["satellite"])
+        instrument = INSTRUMENT.get(platform_name)
+        if not instrument:
+            logger.error("Instrument unknown! Platform = %s", platform_name)
+            continue
+        if platform_name in excluded_satellites:
+            logger.debug("Platform name excluded: %s", platform_name)
+            continue
+        risetime = datetime.strptime(child.attrib["start-time"], TIME_FORMAT)
+        falltime = datetime.strptime(child.attrib["end-time"], TIME_FORMAT)
+
+        overpass = None
+        if lookup is not None and station:
+            overpass = lookup.find_pass(station, child.attrib["satellite"], risetime, falltime)
+        if overpass is None:
+            job = PlotJob(None, platform_name, risetime, falltime, instrument)
+            filename = get_fig_filename(platform_name, instrument, risetime, falltime)
+        else:
+            job = PlotJob(pass_to_dict(overpass), platform_name, risetime, falltime, overpass.instrument)
+            filename = get_fig_filename(overpass.satellite.name, overpass.instrument, overpass.risetime,
+                                        overpass.falltime)
+        filename = os.path.join(plotdir, filename)
+        if os.path.exists(filename):
+            existing.append((child, filename))
+        else:
+            jobs.append((child, job))
+    return existing, jobs
+
+
+def write_page(tree, output_file):
+    """Write the request *tree* as a web page to *output_file*."""
+    tree.write(output_file, encoding="utf-8", xml_declaration=True)
+    with open(output_file) as fpt:
+        lines = fpt.readlines()
+    lines.insert(1, STYLESHEET)
+    with open(output_file, "w") as fpt:
+        fpt.writelines(lines)
+
+
+def process_request(filename, plotdir, output_file, excluded_satellites=(), lookup=None, executor=None,
+                    render=render_pass):
+    """Make the web page of the schedule request *filename*, with the plots of its passes.
+
+    Args:
+        filename: the schedule request file.
+        plotdir: the directory of the plots.
+        output_file: the file to write the page to.
+        excluded_satellites: the platform names of the satellites not to plot.
+        lookup: the lookup of the scheduler's passes, None to compute them all again.
+        executor: the executor to render the plots in, None to render them one after the other.
+        render: the function rendering the plot of a :class:`PlotJob` in a directory.
+    """
+    import defusedxml.ElementTree as ET
+
+    tree = ET.parse(filename)
+    existing, jobs = get_plot_jobs(tree.getroot(), plotdir, excluded_satellites, lookup)
+    profiler.count("page_plots", len(existing), result="skipped")
+    if executor is None:
+        results = [_render(render, job, plotdir) for _child, job in jobs]
+    else:
+        futures = [executor.submit(_render, render, job, plotdir) for _child, job in jobs]
+        results = [future.result() for future in futures]
+    profiler.count("page_plots", len(jobs), result="rendered")
+
+    plots = existing + [(child, plot) for (child, _job), plot in zip(jobs, results) if plot is not None]
+    for child, plot in plots:
+        child.set("img", plot)
+        child.set("rec", "True")
+    logger.debug("%d plots in %s, %d rendered", len(plots), plotdir, len(jobs))
+    write_page(tree, output_file)
+
+
+def _render(render, job, plotdir):
+    """Render *job*, None if the pass can't be computed."""
+    try:
+        return render(job, plotdir)
+    except KeyError as err:
+        logger.warning("Failed on satellite %s: %s", job.platform_name, str(err))
+        return None
+
+
+class PageGenerator:
+    """Generate the web pages of the schedule requests announced by messages.
+
+    Args:
+        plotdir: the directory of the plots.
+        output_file: the file to write the pages to.
+        excluded_satellites: the platform names of the satellites not to plot.
+        lookup: the lookup of the scheduler's passes, None to compute them all again.
+        processes: the number of processes rendering the plots, None for the number of cpus, 1 to render them in
+            the worker thread.
+        queue_size: the number of requests waiting for their page before receiving blocks.
+        delay: how long to wait for more messages, in seconds, before making the pages of a burst of messages.
+        max_wait: the longest time to wait for more messages after the first message of a burst, in seconds.
+        max_burst: the maximum number of messages in a burst.
+        render: the function rendering the plot of a :class:`PlotJob` in a directory.
+    """
+
+    def __init__(self, plotdir, output_file, excluded_satellites=None, lookup=None, processes=None, queue_size=10,
+                 delay=1.0, max_wait=10.0, max_burst=100, render=render_pass):
+        """Initialize the generator."""
+        self.plotdir = plotdir
+        self.output_file = output_file
+        self.excluded_satellites = excluded_satellites or []
+        self.lookup = lookup
+        self.processes = processes
+        self.delay = delay
+        self.max_wait = max_wait
+        self.max_burst = max_burst
+        self.render = render
+        self.requests = queue.Queue(maxsize=queue_size)
+        #: The last processed requests, with the time their page was written
+        self.job_registry = {}
+        self._executor = None
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread and the process pool."""
+        if self.processes != 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        self._thread = threading.Thread(target=self._work, name="trollsched-pages", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Make the pages of the requests received so far, and stop the worker thread and the process pool."""
+        self.requests.put(_STOP)
+        self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def submit(self, message):
+        """Queue the request file of *message*, waiting if the queue is full."""
+        filename = urlparse(message.data["uri"]).path
+        logger.debug("Request received: %s", filename)
+        self.requests.put(filename)
+
+    def run(self, messages):
+        """Make the pages of the requests of *messages* (posttroll messages, or None on timeouts) until they end."""
+        self.start()
+        try:
+            for message in messages:
+                if message is not None:
+                    self.submit(message)
+        finally:
+            self.stop()
+
+    def _get_burst(self):
+        """Get the request files of the next burst of messages, in the order of their last messages."""
+        burst = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while burst[-1] is not _STOP and len(burst) < self.max_burst:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                burst.append(self.requests.get(timeout=min(self.delay, remaining)))
+            except queue.Empty:
+                break
+        filenames = [item for item in burst if item is not _STOP]
+        unique = list(reversed(dict.fromkeys(reversed(filenames))))
+        profiler.count("page_requests", len(unique), result="processed")
+        profiler.count("page_requests", len(filenames) - len(unique), result="coalesced")
+        return unique, burst[-1] is _STOP
+
+    def _work(self):
+        stop = False
+        while not stop:
+            filenames, stop = self._get_burst()
+            for filename in filenames:
+                self.process(filename)
+
+    def process(self, filename):
+        """Make the page of the request *filename*."""
+        logger.info("Making the page of %s", filename)
+        try:
+            with profiler.timer("page_generation"):
+                process_request(filename, self.plotdir, self.output_file, self.excluded_satellites, self.lookup,
+                                self._executor, self.render)
+        except Exception:
+            logger.exception("Failed making the page of %s", filename)
+            return
+        self.job_registry[filename] = time.time()
+        for old in sorted(self.job_registry, key=self.job_registry.get)[:-REGISTRY_SIZE]:
+            self.job_registry.pop(old)
+        logger.debug("job-registry dict: %s", str(self.job_registry))
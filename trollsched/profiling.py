@@ -0,0 +1,226 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Timers, counters and gauges for the different stages of a schedule run.
+
+The instrumentation is always in place, but only records anything once the
+shared :data:`profiler` is enabled, for example with the ``--profile`` option
+of the `schedule` command::
+
+    with profiler.timer("graph_build", station="nrk"):
+        ...
+    profiler.count("combination_cache", result="hit")
+
+The collected timings, counters and gauges can then be written as a json or csv
+report with :meth:`Profiler.write_report`, or exported as metrics with
+:mod:`trollsched.metrics`.
+"""
+
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class _Timer:
+    """Context manager adding the time spent in it to a stage of the profiler."""
+
+    __slots__ = ("_profiler", "_key", "_start")
+
+    def __init__(self, profiler, key):
+        self._profiler = profiler
+        self._key = key
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, etype, value, tb):
+        self._profiler.add_time(self._key, time.perf_counter() - self._start)
+
+
+class _NullTimer:
+    """Context manager doing nothing, for when the profiler is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, tb):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _make_key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Profiler:
+    """Collect the time spent in the stages of a schedule run, counters and gauges."""
+
+    def __init__(self):
+        """Initialize a disabled profiler."""
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        """Start recording."""
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording."""
+        self.enabled = False
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.timings = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def timer(self, stage, **labels):
+        """Time the code in the context, adding it to *stage* with *labels*."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, _make_key(stage, labels))
+
+    def timed(self, stage):
+        """Decorate a function so that its calls are timed as *stage*."""
+        def decorator(func):
+            from functools import wraps
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_time(self, key, seconds):
+        """Add *seconds* to the timing of *key*, a (stage, labels) tuple."""
+        with self._lock:
+            calls, total, longest = self.timings.get(key, (0, 0.0, 0.0))
+            self.timings[key] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def count(self, name, value=1, **labels):
+        """Increment the counter *name* with *labels* by *value*."""
+        if not self.enabled:
+            return
+        key = _make_key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        """Set the gauge *name* with *labels* to *value*."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[_make_key(name, labels)] = value
+
+    def get_total(self, stage, **labels):
+        """Get the total time spent in *stage*, over all the labels matching *labels*."""
+        return sum(total for (name, key_labels), (_, total, _) in self.timings.items()
+                   if name == stage and set(labels.items()) <= set(key_labels))
+
+    def get_count(self, name, **labels):
+        """Get the value of counter *name*, summed over all the labels matching *labels*."""
+        return sum(value for (key_name, key_labels), value in self.counters.items()
+                   if key_name == name and set(labels.items()) <= set(key_labels))
+
+    def report(self):
+        """Get the report as a list of records, timings first, then counters and gauges."""
+        with self._lock:
+            timings = sorted(self.timings.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        records = []
+        for (stage, labels), (calls, total, longest) in timings:
+            records.append({"kind": "timer", "name": stage, "labels": dict(labels),
+                            "calls": calls, "total": total, "max": longest, "value": None})
+        for (name, labels), value in counters:
+            records.append({"kind": "counter", "name": name, "labels": dict(labels),
+                            "calls": None, "total": None, "max": None, "value": value})
+        for (name, labels), value in gauges:
+            records.append({"kind": "gauge", "name": name, "labels": dict(labels),
+                            "calls": None, "total": None, "max": None, "value": value})
+        return records
+
+    def write_report(self, filename):
+        """Write the report to *filename*, as csv if it ends with `.csv`, json otherwise."""
+        records = self.report()
+        with open(filename, "w", newline="") as fd_:
+            if filename.endswith(".csv"):
+                writer = csv.DictWriter(fd_, fieldnames=["kind", "name", "labels", "calls", "total", "max", "value"])
+                writer.writeheader()
+                for record in records:
+                    record["labels"] = ";".join("%s=%s" % item for item in record["labels"].items())
+                    writer.writerow(record)
+            else:
+                json.dump(records, fd_, indent=2)
+        logger.info("Profiling report written to %s", filename)
+
+    @contextmanager
+    def profile(self, kind, filename):
+        """Run the code in the context under a *kind* profiler (see :data:`PROFILERS`), dumping it to *filename*.
+
+        cProfile dumps can be read with :mod:`pstats` or snakeviz, pyinstrument dumps are html pages.
+        """
+        if kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as Pyinstrument
+            except ImportError:
+                logger.error("pyinstrument is not installed, not profiling %s", filename)
+                yield
+                return
+            prof = Pyinstrument()
+            prof.start()
+            try:
+                yield
+            finally:
+                prof.stop()
+                with open(filename, "w") as fd_:
+                    fd_.write(prof.output_html())
+        else:
+            import cProfile
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                prof.dump_stats(filename)
+        logger.info("Profile written to %s", filename)
+
+
+def get_profile_filename(report_filename, station_id, kind):
+    """Get the name of the *kind* profile dump for *station_id*, next to the report."""
+    extension = ".html" if kind == "pyinstrument" else ".prof"
+    base = os.path.splitext(report_filename)[0]
+    return "%s.%s%s" % (base, station_id, extension)
+
+
+#: The profiler used by the scheduler
+profiler = Profiler()
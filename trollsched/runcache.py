@@ -0,0 +1,270 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache the results of whole schedule runs.
+
+A run is identified by the hash of everything its schedule depends on: the
+scheduler configuration, the areas of the stations, the TLE lines of the
+scheduled satellites, the start time and the options changing the schedule.
+Running the scheduler again with the same inputs, after a crash or by a cron
+retry, then gets the passes and their schedule from the cache instead of
+computing them again.
+
+The entries are stored as json in the scheduler's cache directory, the passes
+with the TLE lines of their orbitals and the vertices of their swath
+boundaries, so that reading an entry never runs code from the cache. The least
+recently used entries are evicted when there are too many of them, or when
+they take up too much space.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+
+from trollsched.utils import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+#: The maximum number of runs kept in the cache
+MAX_ENTRIES = 100
+
+#: The maximum size of the cache on disk, in bytes
+MAX_BYTES = 500 * 1024 * 1024
+
+EXTENSION = ".json"
+
+
+def _get_file_hash(filename):
+    with open(filename, "rb") as fd_:
+        return hashlib.sha256(fd_.read()).hexdigest()
+
+
+def _get_tle_lines(satellites, tle_file):
+    """Get the TLE lines of the *satellites* from *tle_file*, or the whole file if a satellite is not found in it."""
+    from pyorbital import tlefile
+    lines = {}
+    for sat in satellites:
+        try:
+            tle = tlefile.read(sat.name, tle_file)
+        except (KeyError, ValueError):
+            return {"file": _get_file_hash(tle_file)}
+        lines[sat.name] = [tle.line1, tle.line2]
+    return lines
+
+
+def get_run_key(scheduler, opts, start_time, tle_file):
+    """Get the key of a schedule run, the hash of everything the schedule depends on.
+
+    The output options (which files to write and where) are left out, so that a
+    run asking for other files still gets the schedule from the cache.
+
+    Args:
+        scheduler: the :class:`~trollsched.schedule.Scheduler` holding the configuration.
+        opts: the command line options.
+        start_time: the start time of the run.
+        tle_file: the TLE file the passes are computed from.
+
+    Returns:
+        The key, as a hexadecimal string.
+    """
+    import trollsched
+    satellites = {sat.name: sat for station in scheduler.stations for sat in station.satellites}
+    stations = [{"id": station.id,
+                 "coords": list(station.coords),
+                 # The string of an area definition holds all its parameters
+                 "area": str(station.area),
+                 "min_pass": station.min_pass,
+                 "local_horizon": station.local_horizon,
+                 "simplify_tolerance": station.simplify_tolerance,
+                 "antennas": station.antennas,
+                 "satellites": [[sat.name, sat.schedule_name, sat.score.day, sat.score.night]
+                                for sat in station.satellites]}
+                for station in scheduler.stations]
+    description = {"version": trollsched.__version__,
+                   "start_time": start_time.isoformat(),
+                   "scheduler": {"forward": scheduler.forward,
+                                 "start": scheduler.start,
+                                 "min_pass": scheduler.min_pass,
+                                 "dump_url": scheduler.dump_url,
+                                 "center_id": scheduler.center_id,
+                                 "combined_solver": scheduler.combined_solver},
+                   "stations": stations,
+                   "tle": _get_tle_lines(satellites.values(), tle_file),
+                   "opts": {"delay": opts.delay,
+                            "solver": opts.solver,
+                            "aqua_terra_dumps": opts.no_aqua_terra_dump,
+                            "avoid": _get_file_hash(opts.avoid) if opts.avoid else None}}
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _pass_to_values(overpass):
+    """Get the values of *overpass* as json serializable values, the boundary vertices being in radians."""
+    boundary = None
+    if overpass._boundary is not None:
+        boundary = np.asarray(overpass._boundary.contour_poly.vertices).tolist()
+    return {"satellite": overpass.satellite.name,
+            "schedule_name": overpass.satellite.schedule_name,
+            "risetime": overpass.risetime.isoformat(),
+            "falltime": overpass.falltime.isoformat(),
+            "uptime": overpass.uptime.isoformat(),
+            "instrument": overpass.instrument,
+            "orbital": [overpass.orb.satellite_name, overpass.orb.tle.line1, overpass.orb.tle.line2],
+            "number_of_fovs": overpass.number_of_fovs,
+            "frequency": overpass.frequency,
+            "simplify_tolerance": overpass.simplify_tolerance,
+            "station": overpass.station,
+            "max_elev": overpass.max_elev,
+            "rec": overpass.rec,
+            "fig": overpass.fig,
+            "antenna": getattr(overpass, "antenna", None),
+            # the intersections with the areas are not kept, only the scores
+            "area_scores": {area.area_id: score for area, (_, score) in overpass.score.items()},
+            "boundary": boundary}
+
+
+def _pass_from_values(values, satellites, areas, orbitals):
+    """Get a pass from its *values*, with its satellite from *satellites*, its scores for *areas* and its orbital."""
+    from pyorbital import orbital
+
+    from trollsched.catalogue import CatalogueBoundary
+    from trollsched.satpass import Pass
+    from trollsched.schedule import Satellite
+
+    satellite = satellites.get(values["satellite"])
+    if satellite is None:
+        satellite = satellites[values["satellite"]] = Satellite(values["satellite"], 0, 0,
+                                                                schedule_name=values["schedule_name"])
+    orbital_key = tuple(values["orbital"])
+    if orbital_key not in orbitals:
+        name, line1, line2 = orbital_key
+        orbitals[orbital_key] = orbital.Orbital(name, line1=line1, line2=line2)
+    overpass = Pass(satellite, datetime.fromisoformat(values["risetime"]), datetime.fromisoformat(values["falltime"]),
+                    orb=orbitals[orbital_key], uptime=datetime.fromisoformat(values["uptime"]),
+                    instrument=values["instrument"], number_of_fovs=values["number_of_fovs"],
+                    frequency=values["frequency"], simplify_tolerance=values["simplify_tolerance"])
+    overpass.station = values["station"]
+    overpass.max_elev = values["max_elev"]
+    overpass.rec = values["rec"]
+    overpass.fig = values["fig"]
+    overpass.antenna = values["antenna"]
+    overpass.score = {areas[area_id]: (None, score) for area_id, score in values["area_scores"].items()
+                      if area_id in areas}
+    if values["boundary"] is not None:
+        overpass._boundary = CatalogueBoundary(np.array(values["boundary"], dtype=np.float64))
+    return overpass
+
+
+def dump_run(entry):
+    """Get the *entry* of a run, as computed by :func:`~trollsched.schedule.compute_schedules`, as json values."""
+    return {"passes": {station_id: [_pass_to_values(overpass) for overpass in passes]
+                       for station_id, passes in entry["passes"].items()},
+            "rec": entry["rec"],
+            "comb_rec": entry["comb_rec"]}
+
+
+def load_run(values, satellites=(), areas=()):
+    """Get the entry of a run from its json *values*, as given by :func:`dump_run`.
+
+    Args:
+        values: the values of the run.
+        satellites: the satellites of the scheduler, for the passes to get them again.
+        areas: the areas of the stations, for the passes to get their scores for them again.
+
+    Returns:
+        The passes of the stations, with the recorded flags of the passes in the single and combined schedules.
+    """
+    satellites = {sat.name: sat for sat in satellites}
+    areas = {area.area_id: area for area in areas}
+    orbitals = {}
+    return {"passes": {station_id: [_pass_from_values(pass_values, satellites, areas, orbitals)
+                                    for pass_values in passes]
+                       for station_id, passes in values["passes"].items()},
+            "rec": values["rec"],
+            "comb_rec": values["comb_rec"]}
+
+
+def _to_json(obj):
+    """Get the json serializable value of the numpy scalar *obj*."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Cannot store %r in the run cache" % obj)
+
+
+class RunCache:
+    """The cache of the run results, as json files in *cache_dir*.
+
+    The entries are json values, see :func:`dump_run` for the runs.
+
+    Args:
+        cache_dir: where to store the runs, defaults to the scheduler's cache directory.
+        max_entries: the maximum number of runs to keep.
+        max_bytes: the maximum size of the stored runs, in bytes.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        """Initialize the cache."""
+        self.cache_dir = cache_dir or get_cache_dir("runs")
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def _get_filename(self, key):
+        return os.path.join(self.cache_dir, key + EXTENSION)
+
+    def get(self, key):
+        """Get the run stored under *key*, None if there is none."""
+        filename = self._get_filename(key)
+        try:
+            with open(filename) as fd_:
+                entry = json.load(fd_)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            logger.warning("Corrupt run cache entry %s, ignoring it: %s", filename, str(err))
+            return None
+        # Mark the entry as recently used
+        os.utime(filename)
+        return entry
+
+    def put(self, key, entry):
+        """Store the run *entry* under *key*, atomically, and evict the least recently used runs."""
+        filename = self._get_filename(key)
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "w") as fd_:
+            json.dump(entry, fd_, default=_to_json)
+        os.replace(tmp_filename, filename)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used runs until there are not too many of them, nor too large."""
+        entries = []
+        for dir_entry in os.scandir(self.cache_dir):
+            if dir_entry.name.endswith(EXTENSION):
+                stat = dir_entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, dir_entry.path))
+        entries.sort(reverse=True)
+        total = 0
+        for number, (_, size, path) in enumerate(entries):
+            total += size
+            if number >= self.max_entries or total > self.max_bytes:
+                logger.debug("Evicting run %s from the cache", path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
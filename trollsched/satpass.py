@@ -22,24 +22,25 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Satellite passes."""
 
-import ftplib
-import glob
 import logging
 import logging.handlers
 import operator
 import os
-import socket
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from functools import reduce as fctools_reduce
-from tempfile import gettempdir, mkstemp
-from urllib.parse import urlparse
+from itertools import accumulate
 
 import numpy as np
 from pyorbital import orbital, tlefile
-from pyresample.boundary import AreaDefBoundary
 
 from trollsched import MIN_PASS, NOAA20_NAME, NUMBER_OF_FOVS
+from trollsched.areas import get_area_polygon
 from trollsched.boundary import SwathBoundary
+from trollsched.dumpinfo import get_dump_fetcher
+from trollsched.profiling import profiler
+from trollsched.spherical import clip_areas, is_disjoint
+from trollsched.tlestore import get_tle_store
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +50,16 @@ MERSI_PLATFORM_NAMES = ["FENGYUN 3C", "FENGYUN-3C", "FY-3C"]
 MERSI2_PLATFORM_NAMES = ["FENGYUN 3D", "FENGYUN-3D", "FY-3D",
                          "FENGYUN 3E", "FENGYUN-3E", "FY-3E"]
 
+#: Ground stations receiving the global dumps of Terra and Aqua: Svalbard, Poker Flat and Wallops
+DUMP_STATIONS = {"SG": (15.399, 78.228, 0),
+                 "PF": (-147.43, 65.12, 0.51),
+                 "WP": (-75.457222, 37.938611, 0)}
+
+
+def has_pass_key(overpass):
+    """Check if *overpass* is of a class of passes identified by a pass key, and hashed by it."""
+    return isinstance(getattr(type(overpass), "pass_key", None), property)
+
 
 class SimplePass:
     """A pass: satellite, risetime, falltime, (orbital)."""
@@ -68,10 +79,14 @@ class SimplePass:
         self.subsattrack = {"start": None, "end": None}
         self.rec = False
         self.fig = None
+        self.antenna = None
 
     def __hash__(self):
-        """Hash the pass."""
-        return super.__hash__(self)
+        """Hash the pass.
+
+        Simple passes are equal when they overlap, which isn't transitive, so they are hashed by identity.
+        """
+        return object.__hash__(self)
 
     def overlaps(self, other, delay=None):
         """Check if two passes overlap in time."""
@@ -99,14 +114,11 @@ class SimplePass:
     def __eq__(self, other):
         """Determine if two satellite passes are the same."""
         # Two passes, maybe observed from two distinct stations, are compared by
-        # a) satellite name and orbit number,
+        # a) satellite name and orbit number (their pass key),
         # or if the later is not available
         # b) the time difference between rise- and fall-times.
-        if other is not None and isinstance(self, Pass) and isinstance(
-                other, Pass):
-            return (self.satellite.name == other.satellite.name and
-                    self.orb.get_orbit_number(self.risetime) == other.orb.get_orbit_number(other.risetime))
-        timedelta(seconds=1)
+        if other is not None and has_pass_key(self) and has_pass_key(other):
+            return self.pass_key == other.pass_key
         return (other is not None and
                 self.satellite.name == other.satellite.name and
                 self.overlaps(other))
@@ -131,6 +143,13 @@ class SimplePass:
                 duration.microseconds * 1e-6)
 
 
+def get_orbital(satellite, line1=None, line2=None):
+    """Get the orbital of *satellite*, with its TLE from the TLE store if the TLE *line1* and *line2* are not given."""
+    if line1 is None or line2 is None:
+        line1, line2 = get_tle_store().get_tle(satellite)
+    return orbital.Orbital(satellite, line1=line1, line2=line2)
+
+
 class Pass(SimplePass):
     """A pass: satellite, risetime, falltime, (orbital)."""
 
@@ -170,6 +189,8 @@ class Pass(SimplePass):
         # The frequency shouldn't actualy depend on the number of FOVS along a scanline should it!?
         # frequency = kwargs.get('frequency', int(self.number_of_fovs / 4))
         frequency = kwargs.get("frequency", 300)
+        #: Tolerance in km of the simplification of the swath boundary, None to keep all its points
+        self.simplify_tolerance = kwargs.get("simplify_tolerance", None)
 
         self.station = None
         self.max_elev = None
@@ -180,23 +201,41 @@ class Pass(SimplePass):
             self.orb = orb
         else:
             try:
-                self.orb = orbital.Orbital(satellite, line1=tle1, line2=tle2)
+                self.orb = get_orbital(satellite, tle1, tle2)
             except KeyError as err:
                 logger.debug("Failed in PyOrbital: %s", str(err))
-                self.orb = orbital.Orbital(
-                    NOAA20_NAME.get(satellite, satellite),
-                    line1=tle1,
-                    line2=tle2)
+                self.orb = get_orbital(NOAA20_NAME.get(satellite, satellite), tle1, tle2)
                 logger.info("Using satellite name %s instead",
                             str(NOAA20_NAME.get(satellite, satellite)))
 
         self._boundary = None
+        self._pass_key = None
+
+    def __hash__(self):
+        """Hash the pass, consistently with the comparison of two passes."""
+        return hash(self.pass_key)
+
+    @property
+    def pass_key(self):
+        """Get the identity key of the pass: the satellite name and the orbit number at risetime.
+
+        Two passes, maybe observed from two distinct stations, are the same pass when their keys are
+        equal. The orbit number is only computed again if the risetime has changed.
+        """
+        risetime, key = getattr(self, "_pass_key", None) or (None, None)
+        if risetime is not self.risetime:
+            key = (self.satellite.name, self.orb.get_orbit_number(self.risetime))
+            self._pass_key = (self.risetime, key)
+        return key
 
     @property
     def boundary(self):
         """Get the boundary of the swath."""
         if not self._boundary:
-            self._boundary = SwathBoundary(self, frequency=self.frequency)
+            with profiler.timer("boundary"):
+                self._boundary = SwathBoundary(self, frequency=self.frequency)
+                if getattr(self, "simplify_tolerance", None):
+                    self._boundary.simplify(self.simplify_tolerance)
         return self._boundary
 
     @boundary.setter
@@ -237,17 +276,7 @@ class Pass(SimplePass):
 
     def area_coverage(self, area_of_interest):
         """Get the ratio of coverage (between 0 and 1) of the pass with the area of interest."""
-        try:
-            area_boundary = area_of_interest.poly
-        except AttributeError:
-            area_boundary = AreaDefBoundary(area_of_interest, frequency=100)
-            area_boundary = area_boundary.contour_poly
-
-        inter = self.boundary.contour_poly.intersection(area_boundary)
-
-        if inter is None:
-            return 0
-        return inter.area() / area_boundary.area()
+        return batch_area_coverage([self], area_of_interest)[0]
 
     def generate_metno_xml(self, coords, root):
         """Generate a metno xml schedule."""
@@ -396,9 +425,6 @@ class Pass(SimplePass):
         return line
 
 
-HOST = "ftp://is.sci.gsfc.nasa.gov/ancillary/ephemeris/schedule/%s/downlink/"
-
-
 def get_aqua_terra_dumps(start_time,
                          end_time,
                          satorb,
@@ -425,99 +451,32 @@ def get_aqua_terra_dumps(start_time,
     return dumps
 
 
-def get_aqua_terra_dumpdata_from_ftp(sat, dump_url):
-    """Get the information on the internet on the actual global dumps of Terra and Aqua."""
-    logger.info("Fetch %s dump info from internet", str(sat.name))
-    if isinstance(dump_url, str):
-        url = urlparse(dump_url % sat.name)
-    else:
-        url = urlparse(HOST % sat.name)
-    logger.debug("Connect to ftp server")
-    try:
-        f = ftplib.FTP_TLS(url.netloc)
-    except (socket.error, socket.gaierror) as e:
-        logger.error("cannot reach to %s " % HOST + str(e))
-        f = None
+def batch_area_coverage(passes, area_of_interest):
+    """Get the ratios of coverage (between 0 and 1) of the *passes* with the area of interest, as an array.
 
-    if f is not None:
-        try:
-            f.login("anonymous", "guest")
-            logger.debug("Logged in")
-        except ftplib.error_perm:
-            logger.error("cannot login anonymously")
-            f.quit()
-            f = None
-
-    if f is not None:
-        data = []
-        try:
-            f.prot_p()  # explicitly call for protected transfer
-            f.dir(url.path, data.append)
-        except socket.error as e:
-            logger.error("Can't get any data: " + str(e))
-            f.quit()
-            f = None
-        else:
-            filenames = [line.split()[-1] for line in data]
+    The swaths of all the passes that may reach the area are clipped together.
+    """
+    try:
+        area_boundary = area_of_interest.poly
+    except AttributeError:
+        area_boundary = get_area_polygon(area_of_interest, frequency=100)
 
-    if f is None:
-        logger.info("Can't access ftp server, using cached data")
-        filenames = glob.glob(os.path.join(gettempdir(), "*.rpt"))
+    coverage = np.zeros(len(passes))
+    polygons = [overpass.boundary.contour_poly for overpass in passes]
+    candidates = [i for i, poly in enumerate(polygons) if not is_disjoint(poly, area_boundary)]
+    if candidates:
+        coverage[candidates] = clip_areas([polygons[i] for i in candidates], area_boundary) / area_boundary.area()
+    return coverage
 
-    filenames = [
-        x for x in filenames if x.startswith("wotis.") and x.endswith(".rpt")
-    ]
-    dates = [
-        datetime.strptime("".join(filename.split(".")[2:4]), "%Y%j%H%M%S")
-        for filename in filenames
-    ]
-    filedates = dict(zip(dates, filenames))
 
-    dumps = []
-
-    for date in sorted(dates):
-        lines = []
-        if not os.path.exists(os.path.join(gettempdir(), filedates[date])):
-            try:
-                f.prot_p()  # explicitly call for protected transfer
-                f.retrlines("RETR " + os.path.join(url.path, filedates[date]),
-                            lines.append)
-            except ftplib.error_perm:
-                logger.info("Permission error (???) on ftp server, skipping.")
-                continue
-            with open(os.path.join(gettempdir(), filedates[date]), "w") as fd_:
-                for line in lines:
-                    fd_.write(line + "\n")
+def get_aqua_terra_dumpdata_from_ftp(sat, dump_url):
+    """Get the information on the internet on the actual global dumps of Terra and Aqua.
 
-        else:
-            with open(os.path.join(gettempdir(), filedates[date]), "r") as fd_:
-                for line in fd_:
-                    lines.append(line)
-
-        # for line in lines[7::2]:
-        #     if line.strip() == '':
-        #         break
-        #     station, aos, elev, los = line.split()[:4]
-        #     aos = datetime.strptime(aos, "%Y:%j:%H:%M:%S")
-        #     los = datetime.strptime(los, "%Y:%j:%H:%M:%S")
-        #     if los >= start_time and aos <= end_time:
-        #         uptime = aos + (los - aos) / 2
-        #         overpass = Pass(sat, aos, los, orb=satorb, uptime=uptime, instrument="modis")
-        #         overpass.station = station
-        #         overpass.max_elev = elev
-        #         dumps.append(overpass)
-
-        for line in lines[7::2]:
-            if line.strip() == "":
-                break
-            station, aos, elev, los = line.split()[:4]
-            aos = datetime.strptime(aos, "%Y:%j:%H:%M:%S")
-            los = datetime.strptime(los, "%Y:%j:%H:%M:%S")
-            dumps.append({"station": station, "aos": aos, "los": los, "elev": elev})
-
-    if f is not None:
-        f.quit()
-    return dumps
+    The dump reports are fetched and cached by :mod:`trollsched.dumpinfo`, so only the reports that
+    are not already in the dump table are downloaded.
+    """
+    logger.info("Fetch %s dump info from internet", str(sat.name))
+    return get_dump_fetcher(dump_url).get_dumps(sat.name)
 
 
 def get_next_passes(satellites,
@@ -539,56 +498,64 @@ def get_next_passes(satellites,
     """
     passes = {}
 
-    if tle_file is None and "TLES" not in os.environ:
-        fp_, tle_file = mkstemp(prefix="tle", dir=gettempdir())
-        os.close(fp_)
-        logger.info("Fetch tle info from internet")
-        tlefile.fetch(tle_file)
-
-    if not os.path.exists(tle_file) and "TLES" not in os.environ:
+    store = None
+    if tle_file is None:
+        store = get_tle_store()
+        store.get_tle_file()
+    elif not os.path.exists(tle_file) and "TLES" not in os.environ:
         logger.info("Fetch tle info from internet")
-        tlefile.fetch(tle_file)
+        with profiler.timer("tle_fetch"):
+            tlefile.fetch(tle_file)
 
     for sat in satellites:
         if not hasattr(sat, "name"):
             from trollsched.schedule import Satellite
             sat = Satellite(sat, 0, 0)
 
-        satorb = orbital.Orbital(sat.name, tle_file=tle_file)
-        passlist = satorb.get_next_passes(utctime,
-                                          forward,
-                                          *coords,
-                                          horizon=local_horizon,
-                                          )
-
-        if sat.name.lower() == "metop-a":
-            # Take care of metop-a special case
-            passes["metop-a"] = get_metopa_passes(sat, passlist, satorb)
-        elif sat.name.lower() in ["aqua", "terra"] and aqua_terra_dumps:
-            # Take care of aqua (dumps in svalbard and poker flat)
-            # Get the Terra/Aqua passes and fill the passes dict:
-            get_terra_aqua_passes(passes, utctime, forward, sat, passlist, satorb, aqua_terra_dumps)
-        else:
-            if sat.name.upper() in VIIRS_PLATFORM_NAMES:
-                instrument = "viirs"
-            elif sat.name.lower().startswith("metop") or sat.name.lower().startswith("noaa"):
-                instrument = "avhrr"
-            elif sat.name.lower() in ["aqua", "terra"]:  # when aqua_terra_dumps=False
-                instrument = "modis"
-            elif sat.name.upper() in MERSI_PLATFORM_NAMES:
-                instrument = "mersi"
-            elif sat.name.upper() in MERSI2_PLATFORM_NAMES:
-                instrument = "mersi-2"
+        with profiler.timer("tle_load", satellite=sat.name):
+            if store is None:
+                satorb = orbital.Orbital(sat.name, tle_file=tle_file)
+            else:
+                line1, line2 = store.get_tle(sat.name)
+                satorb = orbital.Orbital(sat.name, line1=line1, line2=line2)
+        with profiler.timer("pass_prediction", satellite=sat.name):
+            passlist = satorb.get_next_passes(utctime,
+                                              forward,
+                                              *coords,
+                                              horizon=local_horizon,
+                                              )
+
+            if sat.name.lower() == "metop-a":
+                # Take care of metop-a special case
+                passes["metop-a"] = get_metopa_passes(sat, passlist, satorb)
+            elif sat.name.lower() in ["aqua", "terra"] and aqua_terra_dumps:
+                # Take care of aqua (dumps in svalbard and poker flat)
+                # Get the Terra/Aqua passes and fill the passes dict:
+                get_terra_aqua_passes(passes, utctime, forward, sat, passlist, satorb, aqua_terra_dumps)
             else:
-                instrument = "unknown"
+                if sat.name.upper() in VIIRS_PLATFORM_NAMES:
+                    instrument = "viirs"
+                elif sat.name.lower().startswith("metop") or sat.name.lower().startswith("noaa"):
+                    instrument = "avhrr"
+                elif sat.name.lower() in ["aqua", "terra"]:  # when aqua_terra_dumps=False
+                    instrument = "modis"
+                elif sat.name.upper() in MERSI_PLATFORM_NAMES:
+                    instrument = "mersi"
+                elif sat.name.upper() in MERSI2_PLATFORM_NAMES:
+                    instrument = "mersi-2"
+                else:
+                    instrument = "unknown"
 
-            passes[sat.name] = [
-                Pass(sat, rtime, ftime, orb=satorb, uptime=uptime, instrument=instrument)
-                for rtime, ftime, uptime in passlist
-                if ftime - rtime > timedelta(minutes=min_pass)
-            ]
+                passes[sat.name] = [
+                    Pass(sat, rtime, ftime, orb=satorb, uptime=uptime, instrument=instrument)
+                    for rtime, ftime, uptime in passlist
+                    if ftime - rtime > timedelta(minutes=min_pass)
+                ]
 
-    return set(fctools_reduce(operator.concat, list(passes.values())))
+    for sat_name, sat_passes in passes.items():
+        profiler.count("passes_predicted", len(sat_passes), satellite=sat_name)
+    # The passes are all distinct, a set would merge the passes sharing a pass key
+    return fctools_reduce(operator.concat, list(passes.values()))
 
 
 def get_metopa_passes(sat, passlist, satorb):
@@ -637,28 +604,7 @@ def get_terra_aqua_passes(passes, utctime, forward, sat, passlist, satorb, aqua_
     """
     instrument = "modis"
 
-    wpcoords = (-75.457222, 37.938611, 0)
-    passlist_wp = satorb.get_next_passes(
-        utctime - timedelta(minutes=30), forward + 1, *wpcoords)
-    wp_passes = [
-        Pass(sat, rtime, ftime, orb=satorb, uptime=uptime, instrument=instrument)
-        for rtime, ftime, uptime in passlist_wp if rtime < ftime
-    ]
-
-    svcoords = (15.399, 78.228, 0)
-    passlist_sv = satorb.get_next_passes(
-        utctime - timedelta(minutes=30), forward + 1, *svcoords)
-    sv_passes = [
-        Pass(sat, rtime, ftime, orb=satorb, uptime=uptime, instrument=instrument)
-        for rtime, ftime, uptime in passlist_sv if rtime < ftime
-    ]
-    pfcoords = (-147.43, 65.12, 0.51)
-    passlist_pf = satorb.get_next_passes(
-        utctime - timedelta(minutes=30), forward + 1, *pfcoords)
-    pf_passes = [
-        Pass(sat, rtime, ftime, orb=satorb, uptime=uptime, instrument=instrument)
-        for rtime, ftime, uptime in passlist_pf if rtime < ftime
-    ]
+    station_passes = get_dump_station_passes(utctime, forward, sat, satorb, instrument)
 
     aqua_passes = [
         Pass(sat, rtime, ftime, orb=satorb, uptime=uptime, instrument=instrument)
@@ -669,66 +615,66 @@ def get_terra_aqua_passes(passes, utctime, forward, sat, passlist, satorb, aqua_
                                  utctime + timedelta(hours=forward + 0.5),
                                  satorb, sat, aqua_terra_dumps)
 
+    elevations = {}
+
+    def get_elevation(overpass, station):
+        """Get the elevation of *overpass* at its uptime, seen from *station*."""
+        try:
+            return elevations[id(overpass)]
+        except KeyError:
+            elevation = overpass.orb.get_observer_look(overpass.uptime, *DUMP_STATIONS[station])[1]
+            elevations[id(overpass)] = elevation
+            return elevation
+
     # remove the known dumps
     for dump in dumps:
-        # print "*", dump.station, dump, dump.max_elev
         logger.debug("dump from ftp: " + str((dump.station, dump,
                                               dump.max_elev)))
-        for i, sv_pass in enumerate(sv_passes):
-            if sv_pass.overlaps(dump, timedelta(minutes=40)):
-                sv_elevation = sv_pass.orb.get_observer_look(
-                    sv_pass.uptime, *svcoords)[1]
-                logger.debug("Computed " + str(("SG", sv_pass,
-                                                sv_elevation)))
-                del sv_passes[i]
-        for i, pf_pass in enumerate(pf_passes):
-            if pf_pass.overlaps(dump, timedelta(minutes=40)):
-                pf_elevation = pf_pass.orb.get_observer_look(
-                    pf_pass.uptime, *pfcoords)[1]
-                logger.debug("Computed " + str(("PF", pf_pass,
-                                                pf_elevation)))
-                del pf_passes[i]
-        for i, wp_pass in enumerate(wp_passes):
-            if wp_pass.overlaps(dump, timedelta(minutes=40)):
-                wp_elevation = wp_pass.orb.get_observer_look(
-                    wp_pass.uptime, *wpcoords)[1]
-                logger.debug("Computed " + str(("WP", wp_pass,
-                                                wp_elevation)))
-                del wp_passes[i]
+    for station, st_passes in station_passes.items():
+        index = PassIntervalIndex(st_passes)
+        removed = set()
+        for dump in dumps:
+            removed.update(index.overlapping(dump, timedelta(minutes=40)))
+        for i in sorted(removed):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Computed " + str((station, st_passes[i],
+                                                get_elevation(st_passes[i], station))))
+        station_passes[station] = [st_pass for i, st_pass in enumerate(st_passes) if i not in removed]
 
     # sort out dump passes first
     # between sv an pf, we take the one with the highest elevation if
     # pf < 20°, pf otherwise
     # I think wp is also used if sv is the only other alternative
-    used_pf = []
-    for sv_pass in sv_passes:
-        found_pass = False
-        for pf_pass in pf_passes:
-            if sv_pass.overlaps(pf_pass):
-                found_pass = True
-                used_pf.append(pf_pass)
-                sv_elevation = sv_pass.orb.get_observer_look(
-                    sv_pass.uptime, *svcoords)[1]
-                pf_elevation = pf_pass.orb.get_observer_look(
-                    pf_pass.uptime, *pfcoords)[1]
-                if pf_elevation > 20:
-                    dumps.append(pf_pass)
-                elif sv_elevation > pf_elevation:
-                    dumps.append(sv_pass)
-                else:
-                    dumps.append(pf_pass)
-                break
-        if not found_pass:
+    pf_passes = station_passes["PF"]
+    pf_index = PassIntervalIndex(pf_passes)
+    used_pf = set()
+    for sv_pass in station_passes["SG"]:
+        overlapping = pf_index.overlapping(sv_pass)
+        if overlapping:
+            used_pf.add(overlapping[0])
+            pf_pass = pf_passes[overlapping[0]]
+            sv_elevation = get_elevation(sv_pass, "SG")
+            pf_elevation = get_elevation(pf_pass, "PF")
+            if pf_elevation > 20:
+                dumps.append(pf_pass)
+            elif sv_elevation > pf_elevation:
+                dumps.append(sv_pass)
+            else:
+                dumps.append(pf_pass)
+        else:
             dumps.append(sv_pass)
 
-    for pf_pass in pf_passes:
-        if pf_pass not in used_pf:
+    for i, pf_pass in enumerate(pf_passes):
+        if i not in used_pf:
             dumps.append(pf_pass)
 
+    dump_index = PassIntervalIndex(dumps)
     passes[sat.name] = []
     for overpass in aqua_passes:
         add = True
-        for dump_pass in dumps:
+        # the overpass only shrinks, so the dumps overlapping it are among those overlapping it now
+        for i in dump_index.overlapping(overpass):
+            dump_pass = dumps[i]
             if dump_pass.overlaps(overpass):
                 if (dump_pass.uptime < overpass.uptime and
                         dump_pass.falltime > overpass.risetime):
@@ -736,14 +682,14 @@ def get_terra_aqua_passes(passes, utctime, forward, sat, passlist, satorb, aqua_
                                  " to new risetime " +
                                  str(dump_pass.falltime))
                     overpass.risetime = dump_pass.falltime
-                    overpass.boundary = SwathBoundary(overpass)
+                    overpass._boundary = None
                 elif (dump_pass.uptime >= overpass.uptime and
                       dump_pass.risetime < overpass.falltime):
                     logger.debug("adjusting " + str(overpass) +
                                  " to new falltime " +
                                  str(dump_pass.risetime))
                     overpass.falltime = dump_pass.risetime
-                    overpass.boundary = SwathBoundary(overpass)
+                    overpass._boundary = None
                 if overpass.falltime <= overpass.risetime:
                     add = False
                     logger.debug("skipping " + str(overpass))
@@ -751,3 +697,86 @@ def get_terra_aqua_passes(passes, utctime, forward, sat, passlist, satorb, aqua_
             passes[sat.name].append(overpass)
 
     return
+
+
+def get_dump_station_passes(utctime, forward, sat, satorb, instrument):
+    """Get the passes of *sat* over the stations receiving the global dumps of Terra and Aqua.
+
+    Returns:
+        A dictionary of the lists of passes, per station in :data:`DUMP_STATIONS`.
+    """
+    start_time = utctime - timedelta(minutes=30)
+    station_passes = {}
+    for station, coords in DUMP_STATIONS.items():
+        passlist = satorb.get_next_passes(start_time, forward + 1, *coords)
+        station_passes[station] = [
+            Pass(sat, rtime, ftime, orb=satorb, uptime=uptime, instrument=instrument)
+            for rtime, ftime, uptime in passlist if rtime < ftime
+        ]
+    return station_passes
+
+
+class PassIntervalIndex:
+    """An index of passes sorted by risetime, to find the passes overlapping a time window quickly."""
+
+    def __init__(self, passes):
+        """Index *passes*."""
+        self.passes = passes
+        self._order = sorted(range(len(passes)), key=lambda i: passes[i].risetime)
+        self._risetimes = [passes[i].risetime for i in self._order]
+        self._max_duration = max((overpass.falltime - overpass.risetime for overpass in passes),
+                                 default=timedelta(0))
+
+    def overlapping(self, other, delay=None):
+        """Get the indices of the passes overlapping *other*, in the order of the indexed list.
+
+        The overlap is checked with :meth:`SimplePass.overlaps`, with the same *delay*.
+        """
+        if delay is None:
+            delay = timedelta(seconds=0)
+        # an overlapping pass rises after other.risetime - delay - max_duration
+        # and before other.falltime + delay
+        start = bisect_right(self._risetimes, other.risetime - delay - self._max_duration)
+        end = bisect_left(self._risetimes, other.falltime + delay)
+        return sorted(i for i in self._order[start:end] if self.passes[i].overlaps(other, delay))
+
+
+class AvoidIndex:
+    """An index of passes to avoid, for example read from a previous schedule request.
+
+    A pass is in the index when a pass of the same satellite overlaps it, which is
+    how a pass compares to a simple pass. Checking a pass takes a set lookup for
+    exact matches, and otherwise a binary search in the avoided time windows of
+    its satellite, sorted by risetime, along with the latest falltime up to each.
+    """
+
+    def __init__(self, passes):
+        """Index *passes*."""
+        self._exact = set()
+        windows = {}
+        for overpass in passes:
+            self._exact.add((overpass.satellite.name, overpass.risetime, overpass.falltime))
+            windows.setdefault(overpass.satellite.name, []).append((overpass.risetime, overpass.falltime))
+        self._risetimes = {}
+        self._max_falltimes = {}
+        for sat_name, sat_windows in windows.items():
+            sat_windows.sort()
+            self._risetimes[sat_name] = [risetime for risetime, _ in sat_windows]
+            self._max_falltimes[sat_name] = list(accumulate((falltime for _, falltime in sat_windows), max))
+        self._length = len(passes)
+
+    def __len__(self):
+        """Get the number of passes in the index."""
+        return self._length
+
+    def __contains__(self, overpass):
+        """Check if *overpass* overlaps one of the passes to avoid."""
+        sat_name = overpass.satellite.name
+        if (sat_name, overpass.risetime, overpass.falltime) in self._exact:
+            return True
+        risetimes = self._risetimes.get(sat_name)
+        if not risetimes:
+            return False
+        # the passes rising before overpass falls, one of them must fall after overpass rises
+        last = bisect_left(risetimes, overpass.falltime)
+        return last > 0 and self._max_falltimes[sat_name][last - 1] > overpass.risetime
@@ -28,31 +28,30 @@ from pprint import pformat
 from urllib.parse import urlparse
 
 import numpy as np
-from pyorbital import astronomy
-
-from trollsched.writers import generate_meos_file, generate_metno_xml_file, generate_sch_file, generate_xml_file
-
-try:
-    from pyresample import parse_area_file
-except ImportError:
-    # Older versions of pyresample:
-    from pyresample.utils import parse_area_file
-
 
 from trollsched import MIN_PASS, utils
-from trollsched.combine import get_combined_sched
+from trollsched.areas import get_area, get_area_polygon
+from trollsched.combine import get_combined_sched, get_lagrangian_combined_sched
 from trollsched.graph import Graph
-from trollsched.satpass import SimplePass, get_next_passes
-from trollsched.spherical import get_twilight_poly
+from trollsched.metrics import record_output_size, write_metrics
+from trollsched.profiling import PROFILERS, get_profile_filename, profiler
+from trollsched.sweep import SWEEP_FILENAME
+from trollsched.writers import generate_meos_file, generate_metno_xml_file, generate_sch_file, generate_xml_file
+
+# pyorbital and pyresample are imported where they are used, so that
+# `schedule --help` and `import trollsched.schedule` stay fast.
 
 logger = logging.getLogger(__name__)
 
+#: Name of the metrics file written to the output directory with --metrics
+METRICS_FILENAME = "trollsched.prom"
+
 
 class Station:
     """docstring for Station."""
 
     def __init__(self, station_id, name, longitude, latitude, altitude, area, satellites, area_file=None,
-                 min_pass=MIN_PASS, local_horizon=0):
+                 min_pass=MIN_PASS, local_horizon=0, simplify_tolerance=None, antennas=1):
         """Initialize the station."""
         self.id = station_id
         self.name = name
@@ -64,11 +63,13 @@ class Station:
 
         if area_file is not None:
             try:
-                self.area = parse_area_file(area_file, area)[0]
+                self.area = get_area(area_file, area)
             except TypeError:
                 pass
         self.min_pass = min_pass
         self.local_horizon = local_horizon
+        self.simplify_tolerance = simplify_tolerance
+        self.antennas = antennas
 
     @property
     def coords(self):
@@ -95,8 +96,8 @@ class Station:
 
         allpasses = self.get_next_passes(opts, sched, start_time, tle_file)
 
-        area_boundary = self.area.boundary(8)
-        self.area.poly = area_boundary.contour_poly
+        with profiler.timer("area_boundary", station=self.id):
+            self.area.poly = get_area_polygon(self.area, vertices_per_side=8)
 
         if opts.plot:
             logger.info("Saving plots to %s", build_filename(
@@ -115,76 +116,65 @@ class Station:
             image_saver.start()
 
         if opts.avoid is not None:
-            avoid_list = get_passes_from_xml_file(opts.avoid)
+            from trollsched.satpass import AvoidIndex
+            avoid_list = AvoidIndex(get_passes_from_xml_file(opts.avoid))
         else:
             avoid_list = None
 
         logger.info("computing best schedule for area %s" % self.area.area_id)
-        schedule, (graph, labels) = get_best_sched(allpasses,
-                                                   self.area,
-                                                   timedelta(seconds=opts.delay),
-                                                   avoid_list)
+        solver = opts.solver
+        if self.antennas > 1:
+            solver = "flow"
+        if solver != "graph" and (opts.graph or opts.comb):
+            if solver == "flow":
+                logger.warning("The graph of the schedule is needed, scheduling %s for one antenna", self.id)
+            else:
+                logger.warning("The graph of the schedule is needed, using the graph solver")
+            solver = "graph"
+        with profiler.timer("best_schedule", station=self.id):
+            if solver == "flow":
+                graph = None
+                schedule = get_best_sched_antennas(allpasses, self.area, timedelta(seconds=opts.delay),
+                                                   self.antennas, avoid_list)
+            elif solver == "streaming":
+                graph = None
+                schedule = []
+                for segment in iter_best_sched(allpasses, self.area, timedelta(seconds=opts.delay), avoid_list):
+                    logger.debug("Schedule segment until %s", str(segment[-1].falltime))
+                    for opass in segment:
+                        opass.rec = True
+                    schedule.extend(segment)
+            elif solver == "dp":
+                graph = None
+                schedule = get_best_sched_dp(allpasses, self.area, timedelta(seconds=opts.delay), avoid_list)
+            else:
+                schedule, (graph, labels) = get_best_sched(allpasses,
+                                                           self.area,
+                                                           timedelta(seconds=opts.delay),
+                                                           avoid_list)
+        if graph is not None:
+            profiler.gauge("graph_order", int(graph.order), station=self.id)
+            profiler.gauge("graph_edges", int(np.count_nonzero(graph.adj_matrix)), station=self.id)
 
         logger.debug(pformat(schedule))
         for opass in schedule:
             opass.rec = True
         logger.info("generating file")
-
-        if opts.scisys:
-            generate_sch_file(build_filename("file_sci", pattern,
-                                             pattern_args), allpasses, self.coords)
-
-        if opts.meos:
-            generate_meos_file(build_filename("file_meos", pattern, pattern_args), allpasses,
-                               self.coords, start_time + timedelta(hours=sched.start), True)  # Ie report mode
+        self.write_schedule_files(sched, start_time, allpasses)
 
         if opts.plot:
             logger.info("Waiting for images to be saved...")
-            image_saver.join()
+            with profiler.timer("plot_wait", station=self.id):
+                image_saver.join()
             logger.info("Done!")
 
-        if opts.metno_xml:
-            generate_metno_xml_file(build_filename("file_metno_xml", pattern, pattern_args), allpasses,
-                                    self.coords, start_time + timedelta(hours=sched.start),
-                                    start_time + timedelta(hours=sched.forward), self.id, sched.center_id,
-                                    report_mode=True)
-
-        if opts.xml or opts.report:
-            url = urlparse(opts.output_url or opts.output_dir)
-            if opts.xml or opts.report:
-                # Always create xml-file in request-mode
-                pattern_args["mode"] = "request"
-                xmlfile = generate_xml_file(allpasses,
-                                            start_time + timedelta(hours=sched.start),
-                                            start_time + timedelta(hours=sched.forward),
-                                            build_filename(
-                                                "file_xml", pattern, pattern_args),
-                                            self.id,
-                                            sched.center_id,
-                                            report_mode=False
-                                            )
-                logger.info("Generated " + str(xmlfile))
-                send_file(url, xmlfile)
-            if opts.report:
-                """'If report-mode was set"""
-                pattern_args["mode"] = "report"
-                xmlfile = generate_xml_file(allpasses,
-                                            start_time + timedelta(hours=sched.start),
-                                            start_time + timedelta(hours=sched.forward),
-                                            build_filename(
-                                                "file_xml", pattern, pattern_args),
-                                            self.id,
-                                            sched.center_id,
-                                            True
-                                            )
-                logger.info("Generated " + str(xmlfile))
-
         if opts.graph or opts.comb:
-            graph.save(build_filename("file_graph", pattern, pattern_args))
-            graph.export(
-                labels=[str(label) for label in labels],
-                filename=build_filename("file_graph", pattern, pattern_args) + ".gv"
-            )
+            with profiler.timer("writer", writer="graph", station=self.id):
+                graph.save(build_filename("file_graph", pattern, pattern_args))
+                graph.export(
+                    labels=[str(label) for label in labels],
+                    filename=build_filename("file_graph", pattern, pattern_args) + ".gv"
+                )
         if opts.comb:
             import pickle
             ph = open(os.path.join(build_filename("dir_output", pattern,
@@ -194,18 +184,97 @@ class Station:
 
         return graph, allpasses
 
+    def write_schedule_files(self, sched, start_time, allpasses, only_missing=False):
+        """Write the schedule files asked for in the options of *sched*.
+
+        With *only_missing*, the files which are already there are kept as they are.
+        """
+        opts = sched.opts
+        pattern = sched.patterns
+        pattern_args = {
+            "station": self.id,
+            "output_dir": opts.output_dir,
+            "date": start_time.strftime("%Y%m%d"),
+            "time": start_time.strftime("%H%M%S")
+        }
+        if opts.xml:
+            pattern_args["mode"] = "request"
+        elif opts.report:
+            pattern_args["mode"] = "report"
+
+        if opts.scisys and is_missing(build_filename("file_sci", pattern, pattern_args), only_missing):
+            with profiler.timer("writer", writer="scisys", station=self.id):
+                generate_sch_file(build_filename("file_sci", pattern,
+                                                 pattern_args), allpasses, self.coords)
+            record_output_size(build_filename("file_sci", pattern, pattern_args), station=self.id)
+
+        if opts.meos and is_missing(build_filename("file_meos", pattern, pattern_args), only_missing):
+            with profiler.timer("writer", writer="meos", station=self.id):
+                generate_meos_file(build_filename("file_meos", pattern, pattern_args), allpasses,
+                                   self.coords, start_time + timedelta(hours=sched.start), True)  # Ie report mode
+            record_output_size(build_filename("file_meos", pattern, pattern_args), station=self.id)
+
+        if opts.metno_xml and is_missing(build_filename("file_metno_xml", pattern, pattern_args), only_missing):
+            with profiler.timer("writer", writer="metno_xml", station=self.id):
+                generate_metno_xml_file(build_filename("file_metno_xml", pattern, pattern_args), allpasses,
+                                        self.coords, start_time + timedelta(hours=sched.start),
+                                        start_time + timedelta(hours=sched.forward), self.id, sched.center_id,
+                                        report_mode=True)
+            record_output_size(build_filename("file_metno_xml", pattern, pattern_args), station=self.id)
+
+        if opts.xml or opts.report:
+            url = urlparse(opts.output_url or opts.output_dir)
+            # Always create xml-file in request-mode
+            pattern_args["mode"] = "request"
+            if is_missing(build_filename("file_xml", pattern, pattern_args), only_missing):
+                with profiler.timer("writer", writer="xml", station=self.id):
+                    xmlfile = generate_xml_file(allpasses,
+                                                start_time + timedelta(hours=sched.start),
+                                                start_time + timedelta(hours=sched.forward),
+                                                build_filename(
+                                                    "file_xml", pattern, pattern_args),
+                                                self.id,
+                                                sched.center_id,
+                                                report_mode=False
+                                                )
+                logger.info("Generated " + str(xmlfile))
+                record_output_size(xmlfile, station=self.id)
+                send_file(url, xmlfile)
+        if opts.report:
+            """'If report-mode was set"""
+            pattern_args["mode"] = "report"
+            if is_missing(build_filename("file_xml", pattern, pattern_args), only_missing):
+                with profiler.timer("writer", writer="report", station=self.id):
+                    xmlfile = generate_xml_file(allpasses,
+                                                start_time + timedelta(hours=sched.start),
+                                                start_time + timedelta(hours=sched.forward),
+                                                build_filename(
+                                                    "file_xml", pattern, pattern_args),
+                                                self.id,
+                                                sched.center_id,
+                                                True
+                                                )
+                logger.info("Generated " + str(xmlfile))
+                record_output_size(xmlfile, station=self.id)
+
     def get_next_passes(self, opts, sched, start_time, tle_file):
         """Get the next passes."""
+        from trollsched.satpass import get_next_passes
         logger.info("Computing next satellite passes")
-        allpasses = get_next_passes(self.satellites, start_time,
-                                    sched.forward,
-                                    self.coords, tle_file,
-                                    aqua_terra_dumps=(sched.dump_url or True
-                                                      if opts.no_aqua_terra_dump
-                                                      else None),
-                                    min_pass=self.min_pass,
-                                    local_horizon=self.local_horizon
-                                    )
+        with profiler.timer("next_passes", station=self.id):
+            allpasses = get_next_passes(self.satellites, start_time,
+                                        sched.forward,
+                                        self.coords, tle_file,
+                                        aqua_terra_dumps=(sched.dump_url or True
+                                                          if opts.no_aqua_terra_dump
+                                                          else None),
+                                        min_pass=self.min_pass,
+                                        local_horizon=self.local_horizon
+                                        )
+            for overpass in allpasses:
+                overpass.simplify_tolerance = self.simplify_tolerance
+            if sched.pass_pool is not None:
+                allpasses = sched.pass_pool.share(self.id, allpasses, start_time)
         logger.info("Computation of next overpasses done")
         logger.debug(str(sorted(allpasses, key=lambda x: x.risetime)))
         return allpasses
@@ -232,10 +301,15 @@ class Satellite:
         self.schedule_name = schedule_name or name
 
 
+#: The solvers combining the schedules of several stations
+COMBINED_SOLVERS = ("graph", "lagrangian")
+
+
 class Scheduler:
     """docstring for Scheduler."""
 
-    def __init__(self, stations, min_pass, forward, start, dump_url, patterns, center_id, plot_parameters, plot_title):
+    def __init__(self, stations, min_pass, forward, start, dump_url, patterns, center_id, plot_parameters, plot_title,
+                 combined_solver="graph"):
         """Initialize the scheduler."""
         self.stations = stations
         self.min_pass = min_pass
@@ -246,7 +320,10 @@ class Scheduler:
         self.center_id = center_id
         self.plot_parameters = plot_parameters
         self.plot_title = plot_title
+        self.combined_solver = combined_solver
         self.opts = None
+        #: The passes shared between the runs of overlapping periods, see :class:`trollsched.backfill.PassPool`
+        self.pass_pool = None
 
 
 def conflicting_passes(allpasses, delay=None):
@@ -319,125 +396,188 @@ def fermib(t):
     return 1 / (np.exp((t - a) / b) + 1)
 
 
+# The scores of pass pairs, keyed by the identities of the passes, as the
+# score depends on the actual pass objects (times, boundaries) and not only on
+# the satellite and orbit they share with passes of other stations.
 combination = {}
 
+# The twilight polygons and sun vectors at the uptimes of the passes being scheduled.
+twilights = {}
 
-def combine(p1, p2, area_of_interest):
-    """Combine passes together."""
-    try:
-        return combination[p1, p2]
-    except KeyError:
-        pass
 
-    area = area_of_interest.poly.area()
+def prime_twilights(utctimes):
+    """Compute the twilight polygons and sun vectors at the *utctimes* that are not cached yet, in one go."""
+    from trollsched.spherical import get_sun_vectors, get_twilight_polys
 
-    def pscore(poly, coeff=1):
-        if poly is None:
-            return 0
-        else:
-            return poly.area() * coeff
+    missing = sorted(set(utctimes).difference(twilights))
+    if missing:
+        twilights.update(zip(missing, zip(get_twilight_polys(missing), get_sun_vectors(missing))))
 
-    twi1 = get_twilight_poly(p1.uptime)
-    twi2 = get_twilight_poly(p2.uptime)
 
-    ip1, sip1 = p1.score.get(area_of_interest, (None, None))
-    if sip1 is None:
-        ip1 = p1.boundary.contour_poly.intersection(area_of_interest.poly)
-        # FIXME: ip1 or ip2 could be None if the pass is entirely inside the
-        # area (or vice versa)
+def get_twilight(utctime):
+    """Get the twilight polygon and the sun vector at *utctime*, from cache if possible."""
+    if utctime not in twilights:
+        prime_twilights([utctime])
+    return twilights[utctime]
+
+
+def get_area_score(overpass, area_of_interest, twilight, sun=None):
+    """Get the intersection of *overpass* with *area_of_interest* and its score, from cache if possible.
+
+    The score weighs the day and night parts of the intersection (split by the *twilight*
+    polygon at the pass uptime) with the day and night scores of the satellite. If the *sun*
+    vector at the pass uptime is given, the intersection is only clipped with the twilight polygon
+    when it lies across the terminator.
+
+    Returns:
+        The intersection polygon and its score, or (None, None) if the pass misses the area.
+    """
+    ip1, sip1 = overpass.score.get(area_of_interest, (None, None))
+    if sip1 is not None:
+        profiler.count("score_cache", result="hit")
+        return ip1, sip1
+    profiler.count("score_cache", result="miss")
+
+    with profiler.timer("area_scoring", kind="pass"):
+        ip1, total, day = get_area_parts(overpass, area_of_interest, twilight, sun)
         if ip1 is None:
+            return None, None
+
+        sip1 = weigh_area(total, day, overpass.satellite.score, area_of_interest.poly.area())
+        overpass.score[area_of_interest] = (ip1, sip1)
+    return ip1, sip1
+
+
+def get_area_parts(overpass, area_of_interest, twilight, sun=None):
+    """Get the intersection of *overpass* with *area_of_interest*, its area and the area of its daylit part.
+
+    Returns:
+        The intersection polygon, its area and its day area, or (None, None, None) if the pass misses the area.
+    """
+    from trollsched.spherical import get_areas, intersection
+
+    ip1 = intersection(overpass.boundary.contour_poly, area_of_interest.poly)
+    # FIXME: ip1 could be None if the pass is entirely inside the
+    # area (or vice versa)
+    if ip1 is None:
+        return None, None, None
+
+    total = get_areas([ip1])[0]
+    return ip1, total, get_day_area(ip1, total, twilight, sun)
+
+
+def weigh_area(total, day, sat_score, area):
+    """Weigh the night and *day* parts of an area of size *total* with the *sat_score*, relative to *area*."""
+    ns1 = (total - day) * sat_score.night / area
+    ds1 = day * sat_score.day / area
+    return ns1 + ds1
+
+
+def get_day_area(poly, area, twilight, sun=None, *clips):
+    """Get the area of the daylit part of *poly* clipped by *clips*, *area* being the area of the whole clipped polygon.
+
+    With the *sun* vector, the clipping with the *twilight* polygon is skipped when *poly* is all on one
+    side of the terminator.
+    """
+    from trollsched.spherical import clip_areas, day_night_sides
+
+    if sun is not None:
+        side = day_night_sides([poly], sun)[0]
+        profiler.count("day_night_check", result="mixed" if side == 0 else "single")
+        if side > 0:
+            return area
+        if side < 0:
             return 0
+    return clip_areas([poly], *clips, twilight)[0]
 
-        ip1d = ip1.intersection(twi1)
-        if ip1d is None:
-            lon, lat = np.rad2deg(ip1.vertices[0, :])
-            theta = astronomy.cos_zen(p1.uptime,
-                                      lon, lat)
-            if np.sign(theta) > 0:
-                ip1d = ip1
-                ip1n = None
-            else:
-                ip1n = ip1
-        else:
-            twi1.invert()
-            ip1n = ip1.intersection(twi1)
-            twi1.invert()
 
-        ns1 = pscore(ip1n, p1.satellite.score.night / area)
-        ds1 = pscore(ip1d, p1.satellite.score.day / area)
-        sip1 = ns1 + ds1
-        p1.score[area_of_interest] = (ip1, sip1)
+def combine(p1, p2, area_of_interest):
+    """Combine passes together."""
+    cached = combination.get((id(p1), id(p2)))
+    if cached is not None and cached[0] is p1 and cached[1] is p2:
+        profiler.count("combination_cache", result="hit")
+        return cached[2]
+    profiler.count("combination_cache", result="miss")
+
+    area = area_of_interest.poly.area()
+
+    twi1, sun1 = get_twilight(p1.uptime)
+    twi2, sun2 = get_twilight(p2.uptime)
+
+    ip1, sip1 = get_area_score(p1, area_of_interest, twi1, sun1)
+    if sip1 is None:
+        return 0
 
-    ip2, sip2 = p2.score.get(area_of_interest, (None, None))
+    ip2, sip2 = get_area_score(p2, area_of_interest, twi2, sun2)
     if sip2 is None:
-        ip2 = p2.boundary.contour_poly.intersection(area_of_interest.poly)
-        if ip2 is None:
-            return 0
+        return 0
 
-        ip2d = ip2.intersection(twi2)
-        if ip2d is None:
-            lon, lat = np.rad2deg(ip2.vertices[0, :])
-            theta = astronomy.cos_zen(p2.uptime,
-                                      lon, lat)
-            if np.sign(theta) > 0:
-                ip2d = ip2
-                ip2n = None
-            else:
-                ip2n = ip2
+    with profiler.timer("area_scoring", kind="pair"):
+        parts = get_pair_parts(ip1, ip2, (twi1, sun1), (twi2, sun2))
+        if parts is None:
+            sip1p2 = 0
         else:
-            twi2.invert()
-            ip2n = ip2.intersection(twi2)
-            twi2.invert()
+            common, day_a, day_b = parts
+            sip1p2a = weigh_area(common, day_a, p1.satellite.score, area)
+            sip1p2b = weigh_area(common, day_b, p2.satellite.score, area)
+            sip1p2 = (sip1p2a + sip1p2b) / 2.0
 
-        ns2 = pscore(ip2n, p2.satellite.score.night / area)
-        ds2 = pscore(ip2d, p2.satellite.score.day / area)
-        sip2 = ns2 + ds2
-        p2.score[area_of_interest] = (ip2, sip2)
+    res = get_pair_score(p1, p2, sip1, sip2, sip1p2)
+    combination[id(p1), id(p2)] = (p1, p2, res)
 
-    ip1p2 = ip1.intersection(ip2)
+    return res
 
-    if ip1p2 is None:
-        sip1p2 = 0
-    else:
-        ip1p2da = ip1p2.intersection(twi1)
-        twi1.invert()
-        ip1p2na = ip1p2.intersection(twi1)
-        twi1.invert()
 
-        ip1p2db = ip1p2.intersection(twi2)
-        twi2.invert()
-        ip1p2nb = ip1p2.intersection(twi2)
-        twi2.invert()
+def get_pair_parts(ip1, ip2, twilight1, twilight2):
+    """Get the common area of the intersections *ip1* and *ip2* of two passes with an area.
+
+    The *twilight1* and *twilight2* (twilight polygon, sun vector) pairs are those at the uptimes of the passes.
 
-        ns12a = pscore(ip1p2na, p1.satellite.score.night / area)
-        ds12a = pscore(ip1p2da, p1.satellite.score.day / area)
-        ns12b = pscore(ip1p2nb, p2.satellite.score.night / area)
-        ds12b = pscore(ip1p2db, p2.satellite.score.day / area)
+    Returns:
+        The common area and its day areas at the uptimes of the first and the second pass, or None if the
+        intersections are disjoint.
+    """
+    from trollsched.spherical import clip_areas, is_disjoint
 
-        sip1p2a = ns12a + ds12a
-        sip1p2b = ns12b + ds12b
-        sip1p2 = (sip1p2a + sip1p2b) / 2.0
+    if is_disjoint(ip1, ip2):
+        return None
+    # Only the areas of the intersections are needed, not the polygons
+    common = clip_areas([ip1], ip2)[0]
+    day_a = get_day_area(ip1, common, *twilight1, ip2)
+    day_b = get_day_area(ip1, common, *twilight2, ip2)
+    return common, day_a, day_b
 
+
+def get_pair_score(p1, p2, sip1, sip2, sip1p2):
+    """Get the score of the pass pair *p1*, *p2*, from their scores and the score of their common area."""
     if p2 > p1:
         tdiff = (p2.uptime - p1.uptime).seconds / 3600.
     else:
         tdiff = (p1.uptime - p2.uptime).seconds / 3600.
 
-    res = fermia(tdiff) * (sip1 + sip2) - fermib(tdiff) * sip1p2
-    combination[p1, p2] = res
-
-    return res
+    return fermia(tdiff) * (sip1 + sip2) - fermib(tdiff) * sip1p2
 
 
 def get_best_sched(overpasses, area_of_interest, delay, avoid_list=None):
-    """Get the best schedule based on *area_of_interest*."""
-    avoid_list = avoid_list or []
+    """Get the best schedule based on *area_of_interest*.
+
+    The arcs to and from the passes overlapping one of the passes in *avoid_list*
+    (a list of passes or an :class:`~trollsched.satpass.AvoidIndex`) get a weight of 0.
+    """
+    from trollsched.satpass import AvoidIndex
+    if not isinstance(avoid_list, AvoidIndex):
+        avoid_list = AvoidIndex(avoid_list or [])
     passes = sorted(overpasses, key=lambda x: x.risetime)
-    grs = conflicting_passes(passes, delay)
+    twilights.clear()
+    prime_twilights([overpass.uptime for overpass in passes])
+    with profiler.timer("conflict_grouping"):
+        grs = conflicting_passes(passes, delay)
     logger.debug("conflicting %s", str(grs))
-    ncgrs = [get_non_conflicting_groups(gr, delay) for gr in grs]
+    with profiler.timer("clique_enumeration"):
+        ncgrs = [get_non_conflicting_groups(gr, delay) for gr in grs]
     logger.debug("non conflicting %s", str(ncgrs))
     n_vertices = len(passes)
+    vertex = {id(overpass): i + 1 for i, overpass in enumerate(passes)}
 
     graph = Graph(n_vertices=n_vertices + 2)
 
@@ -455,35 +595,268 @@ def get_best_sched(overpasses, area_of_interest, delay, avoid_list=None):
 #             fp_.write('        "' + str(p1) + '" -> "' + str(p2) +
 #                       '" [ label = "' + str(w) + '" ];\n')
 
-        graph.add_arc(passes.index(p1) + 1,
-                      passes.index(p2) + 1, w)
+        graph.add_arc(vertex[id(p1)], vertex[id(p2)], w)
         if hook is not None:
             hook()
 
-    prev = set()
-    for ncgr in ncgrs:
-        for pr in prev:
-            foll = set(gr[0] for gr in ncgr)
-            for f in foll:
-                add_arc(graph, pr, f)
+    with profiler.timer("graph_build"):
+        prev = set()
+        for ncgr in ncgrs:
+            for pr in prev:
+                foll = set(gr[0] for gr in ncgr)
+                for f in foll:
+                    add_arc(graph, pr, f)
 
-        prev = set(sorted(gr, key=lambda x: x.falltime)[-1] for gr in ncgr)
-        for gr in ncgr:
-            if len(gr) > 1:
-                for p1, p2 in zip(gr[:-1], gr[1:]):
-                    add_arc(graph, p1, p2)
+            prev = set(sorted(gr, key=lambda x: x.falltime)[-1] for gr in ncgr)
+            for gr in ncgr:
+                if len(gr) > 1:
+                    for p1, p2 in zip(gr[:-1], gr[1:]):
+                        add_arc(graph, p1, p2)
 
-    for pr in prev:
-        graph.add_arc(passes.index(pr) + 1, n_vertices + 1)
-    for first in ncgrs[0][0]:
-        graph.add_arc(0, passes.index(first) + 1)
+        for pr in prev:
+            graph.add_arc(vertex[id(pr)], n_vertices + 1)
+        for first in ncgrs[0][0]:
+            graph.add_arc(0, vertex[id(first)])
 
-    dist, path = graph.dag_longest_path(0, n_vertices + 1)
+    with profiler.timer("longest_path"):
+        dist, path = graph.dag_longest_path(0, n_vertices + 1)
 
     del dist
     return [passes[idx - 1] for idx in path[1:-1]], (graph, passes)
 
 
+def iter_best_sched(overpasses, area_of_interest, delay, avoid_list=None):
+    """Get the best schedule based on *area_of_interest*, segment by segment.
+
+    This gives the same schedule as :func:`get_best_sched`, without building the
+    graph of the whole period. The conflicting groups of passes are processed in
+    time order, keeping only the best paths to the passes ending the cliques of
+    the current group. When a group has only one such pass, all the schedules go
+    through it, so the schedule up to it is final and is yielded.
+
+    Yields:
+        The segments of the schedule, as lists of passes in time order.
+    """
+    from trollsched.satpass import AvoidIndex
+    if not isinstance(avoid_list, AvoidIndex):
+        avoid_list = AvoidIndex(avoid_list or [])
+    passes = sorted(overpasses, key=lambda x: x.risetime)
+    if not passes:
+        return
+    twilights.clear()
+    with profiler.timer("conflict_grouping"):
+        grs = conflicting_passes(passes, delay)
+
+    def weight(p1, p2):
+        if p1 in avoid_list or p2 in avoid_list:
+            return np.float64(0)
+        key = (id(p1), id(p2))
+        window_keys.append(key)
+        return np.float64(combine(p1, p2, area_of_interest))
+
+    # The arcs are relaxed in the same order as in Graph.dag_longest_path (by
+    # vertex, then by target), on negated distances, so that ties are broken the
+    # same way. Arcs between the passes of a clique may go back in vertex order, as
+    # the cliques are sorted by uptime, so the distance a pass has when its arcs are
+    # relaxed is kept aside.
+    source = None
+    dists = {id(source): 0}
+    relaxed_dists = {id(source): 0}
+    preds = {}
+    vertex = {id(source): 0}
+    prev = [source]
+    cut = source
+    offset = 1
+    window_keys = []
+
+    def relax(arcs):
+        for p1, p2, arc_weight in sorted(arcs, key=lambda arc: (vertex[id(arc[0])], vertex[id(arc[1])])):
+            candidate = relaxed_dists[id(p1)] + -arc_weight
+            if dists.get(id(p2), np.inf) > candidate:
+                dists[id(p2)] = candidate
+                preds[id(p2)] = p1
+
+    def backtrack(end):
+        segment = []
+        while end is not cut:
+            segment.append(end)
+            end = preds[id(end)]
+        return segment[::-1]
+
+    for gr in grs:
+        with profiler.timer("clique_enumeration"):
+            ncgr = get_non_conflicting_groups(gr, delay)
+        with profiler.timer("streaming_solve"):
+            prime_twilights([overpass.uptime for overpass in gr])
+            for i, overpass in enumerate(gr):
+                vertex[id(overpass)] = offset + i
+            offset += len(gr)
+
+            if prev == [source]:
+                # as in get_best_sched, the source leads to the passes of the first clique
+                relax([(source, first, np.float64(1)) for first in ncgr[0]])
+            else:
+                firsts = set(clique[0] for clique in ncgr)
+                relax([(pr, first, weight(pr, first)) for pr in prev for first in firsts])
+
+            arcs = {}
+            for clique in ncgr:
+                for p1, p2 in zip(clique[:-1], clique[1:]):
+                    arcs.setdefault(id(p1), {})[id(p2)] = (p1, p2)
+            for overpass in gr:
+                relaxed_dists[id(overpass)] = dists.get(id(overpass), np.inf)
+                relax([(p1, p2, weight(p1, p2)) for p1, p2 in arcs.get(id(overpass), {}).values()])
+
+            prev = list(set(sorted(clique, key=lambda x: x.falltime)[-1] for clique in ncgr))
+            if len(prev) != 1:
+                continue
+            segment = backtrack(prev[0])
+            cut = prev[0]
+            # forget everything before the cut
+            dists = {id(cut): dists[id(cut)]}
+            relaxed_dists = {id(cut): relaxed_dists[id(cut)]}
+            preds = {}
+            vertex = {id(cut): vertex[id(cut)]}
+            for key in window_keys:
+                combination.pop(key, None)
+            window_keys = []
+            for overpass in gr:
+                twilights.pop(overpass.uptime, None)
+        profiler.count("schedule_segments")
+        yield segment
+
+    with profiler.timer("streaming_solve"):
+        sink = object()
+        vertex[id(sink)] = offset
+        relax([(pr, sink, np.float64(1)) for pr in prev])
+        segment = backtrack(preds[id(sink)])
+    if segment:
+        profiler.count("schedule_segments")
+        yield segment
+
+
+def get_best_sched_dp(overpasses, area_of_interest, delay, avoid_list=None, score=None):
+    """Get the best schedule based on *area_of_interest*, by dynamic programming over the passes.
+
+    The paths of the graph of :func:`get_best_sched` are the chains of non overlapping
+    passes where no other pass fits between two consecutive passes, nor after the last
+    one. With the passes sorted by falltime, the possible predecessors of a pass are
+    thus the passes ending in a window found by binary search, the start of the window
+    being given by the latest risetime of the passes ending before the pass (a prefix
+    maximum). This gives the same schedule as :func:`get_best_sched`, ties included,
+    without enumerating the cliques of the conflicting groups (but the first one, which
+    is where the schedules of the graph start) nor building the graph.
+
+    The pass pairs are scored with *score*, called as :func:`combine`, which is the default.
+
+    Returns:
+        The schedule, as a list of passes in time order.
+    """
+    from bisect import bisect_right
+    from itertools import accumulate
+
+    from trollsched.satpass import AvoidIndex
+    if not isinstance(avoid_list, AvoidIndex):
+        avoid_list = AvoidIndex(avoid_list or [])
+    if delay is None:
+        delay = timedelta(seconds=0)
+    if score is None:
+        score = combine
+    passes = sorted(overpasses, key=lambda x: x.risetime)
+    if not passes:
+        return []
+    twilights.clear()
+    prime_twilights([overpass.uptime for overpass in passes])
+    with profiler.timer("clique_enumeration"):
+        starts = set(id(overpass) for overpass in get_non_conflicting_groups(conflicting_passes(passes, delay)[0],
+                                                                             delay)[0])
+
+    with profiler.timer("dp_solve"):
+        by_fall = sorted(range(len(passes)), key=lambda idx: passes[idx].falltime)
+        falltimes = [passes[idx].falltime for idx in by_fall]
+        latest_rises = list(accumulate((passes[idx].risetime for idx in by_fall), max))
+        last_rise = latest_rises[-1]
+
+        # The distances are negated and the predecessors tried in risetime order,
+        # keeping only strict improvements, to break ties as Graph.dag_longest_path.
+        dists = [np.inf] * len(passes)
+        preds = [None] * len(passes)
+        for idx in by_fall:
+            overpass = passes[idx]
+            if id(overpass) in starts:
+                dists[idx] = 0 + -np.float64(1)
+            end = bisect_right(falltimes, overpass.risetime - delay)
+            if end == 0:
+                continue
+            begin = bisect_right(falltimes, latest_rises[end - 1] - delay)
+            for pred in sorted(by_fall[begin:end]):
+                if dists[pred] == np.inf:
+                    continue
+                if passes[pred] in avoid_list or overpass in avoid_list:
+                    arc_weight = np.float64(0)
+                else:
+                    arc_weight = np.float64(score(passes[pred], overpass, area_of_interest))
+                if dists[idx] > dists[pred] + -arc_weight:
+                    dists[idx] = dists[pred] + -arc_weight
+                    preds[idx] = pred
+
+        sink_dist = np.inf
+        last = None
+        for idx, overpass in enumerate(passes):
+            if overpass.falltime + delay > last_rise and sink_dist > dists[idx] + -np.float64(1):
+                sink_dist = dists[idx] + -np.float64(1)
+                last = idx
+
+    schedule = []
+    while last is not None:
+        schedule.append(passes[last])
+        last = preds[last]
+    return schedule[::-1]
+
+
+# The pass scores are turned to integers for the flow solver, with this resolution
+FLOW_SCORE_RESOLUTION = 1e6
+
+
+def get_best_sched_antennas(overpasses, area_of_interest, delay, antennas, avoid_list=None):
+    """Get the best schedule based on *area_of_interest* for a station with several *antennas*.
+
+    The passes are assigned to the antennas by a minimum cost flow (see :mod:`trollsched.flow`),
+    which needs a score per pass: the score of the intersection of the pass with the area, as
+    in :func:`combine`, plus a bit to rather record passes than not when they score nothing. The
+    passes in *avoid_list* are not scheduled. The scheduled passes get the number of their antenna,
+    from 1, in their `antenna` attribute.
+
+    Returns:
+        The schedule, as a list of passes in time order.
+    """
+    from trollsched.flow import schedule_antennas
+    from trollsched.satpass import AvoidIndex
+    if not isinstance(avoid_list, AvoidIndex):
+        avoid_list = AvoidIndex(avoid_list or [])
+    if delay is None:
+        delay = timedelta(seconds=0)
+    passes = sorted(overpasses, key=lambda x: x.risetime)
+    twilights.clear()
+    prime_twilights([overpass.uptime for overpass in passes])
+
+    scores = []
+    for overpass in passes:
+        if overpass in avoid_list:
+            scores.append(None)
+            continue
+        _, score = get_area_score(overpass, area_of_interest, *get_twilight(overpass.uptime))
+        scores.append(int(round((score or 0) * FLOW_SCORE_RESOLUTION)) + 1)
+
+    with profiler.timer("flow_solve"):
+        schedules = schedule_antennas(passes, scores, antennas, delay)
+    for antenna, antenna_schedule in enumerate(schedules, 1):
+        for overpass in antenna_schedule:
+            overpass.antenna = antenna
+    return sorted((overpass for antenna_schedule in schedules for overpass in antenna_schedule),
+                  key=lambda x: x.risetime)
+
+
 def argmax(iterable):
     """Find the index of the maximum of an iterable."""
     return max((x, i) for i, x in enumerate(iterable))[1]
@@ -501,13 +874,16 @@ def save_passes(allpasses, poly, output_dir, plot_parameters=None, plot_title=No
     """Save overpass plots to png and store in directory *output_dir*."""
     from trollsched.drawing import save_fig
     for overpass in allpasses:
-        save_fig(overpass, poly=poly, directory=output_dir, plot_parameters=plot_parameters, plot_title=plot_title)
+        with profiler.timer("plot"):
+            save_fig(overpass, poly=poly, directory=output_dir, plot_parameters=plot_parameters, plot_title=plot_title)
     logger.info("All plots saved!")
 
 
 def get_passes_from_xml_file(filename):
     """Read passes from aquisition xml file."""
     import defusedxml.ElementTree as ET
+
+    from trollsched.satpass import SimplePass
     tree = ET.parse(filename)
     root = tree.getroot()
     pass_list = []
@@ -531,6 +907,14 @@ def build_filename(pattern_name, pattern_dict, kwargs):
     return pattern_dict[pattern_name].format(**kwargs)
 
 
+def is_missing(filename, only_missing=False):
+    """Check if *filename* has to be written, ie if it is not there or if all the files are to be written."""
+    if only_missing and os.path.exists(filename):
+        logger.info("Keeping existing " + str(filename))
+        return False
+    return True
+
+
 def send_file(url, file):
     """Send a file through ftp."""
     pathname, filename = os.path.split(file)
@@ -593,17 +977,28 @@ def combined_stations(scheduler, start_time, graph, allpasses):
                          s, ap, passes[s], p)
         raise
 
-    stats, schedule, (newgraph, newpasses) = get_combined_sched(graph, passes)
+    if scheduler.combined_solver == "lagrangian":
+        with profiler.timer("combination"):
+            stats, schedules = get_lagrangian_combined_sched(graph, passes)
+        newgraph = None
+        for station_schedule in schedules:
+            for opass in station_schedule:
+                opass.rec = True
+    else:
+        with profiler.timer("combination"):
+            stats, schedule, (newgraph, newpasses) = get_combined_sched(graph, passes)
+        profiler.gauge("graph_order", int(newgraph.order), station="comb")
+        profiler.gauge("graph_edges", int(np.count_nonzero(newgraph.adj_matrix)), station="comb")
 
-    for opass in schedule:
-        for _i, ipass in zip(range(len(opass)), opass):
-            if ipass[0] is None:
-                continue
-            ipass[0].rec = True
+        for opass in schedule:
+            for _i, ipass in zip(range(len(opass)), opass):
+                if ipass[0] is None:
+                    continue
+                ipass[0].rec = True
 
     logger.info("generating files")
 
-    if scheduler.opts.graph:
+    if scheduler.opts.graph and newgraph is not None:
         # save graph as npz file.
         pattern_args["station"] = "comb"
         newgraph.save(build_filename("file_graph", scheduler.patterns, pattern_args))
@@ -613,58 +1008,92 @@ def combined_stations(scheduler, start_time, graph, allpasses):
         newgraph.export(labels=[str(label) for label in clabels],
                         filename=build_filename("file_graph", scheduler.patterns, pattern_args) + ".gv")
 
+    write_combined_files(scheduler, start_time, passes)
+
+    logger.info("Finished coordinated schedules.")
+
+
+def write_combined_files(scheduler, start_time, passes, only_missing=False):
+    """Write the combined schedule files of the stations, from their *passes*.
+
+    With *only_missing*, the files which are already there are kept as they are.
+    """
+    opts = scheduler.opts
+    pattern = scheduler.patterns
+    pattern_args = {
+        "output_dir": opts.output_dir,
+        "date": start_time.strftime("%Y%m%d"),
+        "time": start_time.strftime("%H%M%S")
+    }
+    if opts.xml:
+        pattern_args["mode"] = "request"
+    elif opts.report:
+        pattern_args["mode"] = "report"
+
     for station_id in passes.keys():
         pattern_args["station"] = station_id + "-comb"
         logger.info("Create schedule file(s) for %s", station_id)
-        if scheduler.opts.scisys:
-            generate_sch_file(build_filename("file_sci", scheduler.patterns, pattern_args),
-                              passes[station_id],
-                              [s.coords for s in scheduler.stations if s.id == station_id][0])
-        if scheduler.opts.xml or scheduler.opts.report:
+        if opts.scisys and is_missing(build_filename("file_sci", pattern, pattern_args), only_missing):
+            with profiler.timer("writer", writer="scisys", station=station_id + "-comb"):
+                generate_sch_file(build_filename("file_sci", pattern, pattern_args),
+                                  passes[station_id],
+                                  [s.coords for s in scheduler.stations if s.id == station_id][0])
+            record_output_size(build_filename("file_sci", pattern, pattern_args),
+                               station=station_id + "-comb")
+        if opts.xml or opts.report:
             pattern_args["mode"] = "request"
-            xmlfile = generate_xml_file(passes[station_id],
-                                        start_time + timedelta(hours=scheduler.start),
-                                        start_time + timedelta(hours=scheduler.forward),
-                                        build_filename(
-                                            "file_xml", scheduler.patterns, pattern_args),
-                                        station_id,
-                                        scheduler.center_id,
-                                        False)
-            logger.info("Generated " + str(xmlfile))
-            url = urlparse(scheduler.opts.output_url or scheduler.opts.output_dir)
-            send_file(url, xmlfile)
-        if scheduler.opts.report:
+            if is_missing(build_filename("file_xml", pattern, pattern_args), only_missing):
+                with profiler.timer("writer", writer="xml", station=station_id + "-comb"):
+                    xmlfile = generate_xml_file(passes[station_id],
+                                                start_time + timedelta(hours=scheduler.start),
+                                                start_time + timedelta(hours=scheduler.forward),
+                                                build_filename(
+                                                    "file_xml", pattern, pattern_args),
+                                                station_id,
+                                                scheduler.center_id,
+                                                False)
+                logger.info("Generated " + str(xmlfile))
+                record_output_size(xmlfile, station=station_id + "-comb")
+                url = urlparse(opts.output_url or opts.output_dir)
+                send_file(url, xmlfile)
+        if opts.report:
             pattern_args["mode"] = "report"
-            xmlfile = generate_xml_file(passes[station_id],
-                                        start_time + timedelta(hours=scheduler.start),
-                                        start_time + timedelta(hours=scheduler.forward),
-                                        build_filename(
-                                            "file_xml", scheduler.patterns, pattern_args),
-                                        # scheduler.stations[station_id].name,
-                                        station_id,
-                                        scheduler.center_id,
-                                        True)
-            logger.info("Generated " + str(xmlfile))
-
-        if scheduler.opts.meos:
-            meosfile = generate_meos_file(build_filename("file_meos", scheduler.patterns, pattern_args),
-                                          passes[station_id],
-                                          # station_meta[station]['coords'],
-                                          [s.coords for s in scheduler.stations if s.id == station_id][0],
-                                          start_time + timedelta(hours=scheduler.start),
-                                          False)  # Ie only print schedule passes
+            if is_missing(build_filename("file_xml", pattern, pattern_args), only_missing):
+                with profiler.timer("writer", writer="report", station=station_id + "-comb"):
+                    xmlfile = generate_xml_file(passes[station_id],
+                                                start_time + timedelta(hours=scheduler.start),
+                                                start_time + timedelta(hours=scheduler.forward),
+                                                build_filename(
+                                                    "file_xml", pattern, pattern_args),
+                                                # scheduler.stations[station_id].name,
+                                                station_id,
+                                                scheduler.center_id,
+                                                True)
+                logger.info("Generated " + str(xmlfile))
+                record_output_size(xmlfile, station=station_id + "-comb")
+
+        if opts.meos and is_missing(build_filename("file_meos", pattern, pattern_args), only_missing):
+            with profiler.timer("writer", writer="meos", station=station_id + "-comb"):
+                meosfile = generate_meos_file(build_filename("file_meos", pattern, pattern_args),
+                                              passes[station_id],
+                                              # station_meta[station]['coords'],
+                                              [s.coords for s in scheduler.stations if s.id == station_id][0],
+                                              start_time + timedelta(hours=scheduler.start),
+                                              False)  # Ie only print schedule passes
             logger.info("Generated " + str(meosfile))
-        if scheduler.opts.metno_xml:
-            metno_xmlfile = generate_metno_xml_file(build_filename("file_metno_xml", scheduler.patterns, pattern_args),
-                                                    passes[station_id],
-                                                    # station_meta[station]['coords'],
-                                                    [s.coords for s in scheduler.stations if s.id == station_id][0],
-                                                    start_time + timedelta(hours=scheduler.start),
-                                                    start_time + timedelta(hours=scheduler.forward),
-                                                    station_id, scheduler.center_id, False)
+            record_output_size(meosfile, station=station_id + "-comb")
+        if opts.metno_xml and is_missing(build_filename("file_metno_xml", pattern, pattern_args), only_missing):
+            with profiler.timer("writer", writer="metno_xml", station=station_id + "-comb"):
+                metno_xmlfile = generate_metno_xml_file(build_filename("file_metno_xml", pattern,
+                                                                       pattern_args),
+                                                        passes[station_id],
+                                                        # station_meta[station]['coords'],
+                                                        [s.coords for s in scheduler.stations if s.id == station_id][0],
+                                                        start_time + timedelta(hours=scheduler.start),
+                                                        start_time + timedelta(hours=scheduler.forward),
+                                                        station_id, scheduler.center_id, False)
             logger.info("Generated " + str(metno_xmlfile))
-
-    logger.info("Finished coordinated schedules.")
+            record_output_size(metno_xmlfile, station=station_id + "-comb")
 
 
 def run(args=None):
@@ -686,17 +1115,42 @@ def run(args=None):
 
     setup_logging(opts)
 
-    tle_file = opts.tle
-    if opts.start_time:
-        start_time = opts.start_time
+    if opts.profile or opts.metrics or opts.metrics_port:
+        profiler.enable()
+    if opts.metrics_port:
+        from trollsched.metrics import serve_metrics
+        serve_metrics(opts.metrics_port)
+
+    if opts.backfill:
+        from trollsched.backfill import run_backfill
+        run_backfill(scheduler, opts)
+        dir_output = get_output_dir(scheduler, opts, opts.backfill[0])
+    elif opts.sweep:
+        from trollsched.sweep import run_sweep
+        dir_output = run_sweep(scheduler, opts)
     else:
-        start_time = datetime.utcnow()
+        tle_file = opts.tle
+        if tle_file is None:
+            # Refresh the stored TLEs once for all the stations, before any station process is started
+            from trollsched.tlestore import get_tle_store
+            get_tle_store().get_tle_file()
+        if opts.start_time:
+            start_time = opts.start_time
+        else:
+            start_time = datetime.utcnow()
+        # Only runs which can be repeated are cached: the TLEs are not fetched
+        # anew and the start time is not now.
+        dir_output = run_window(scheduler, opts, start_time, tle_file, cacheable=bool(opts.tle and opts.start_time))
 
-    allpasses = {}
-    graph = {}
+    if opts.profile:
+        log_prefilter_rate()
+        profiler.write_report(opts.profile)
+    if opts.metrics:
+        write_metrics(os.path.join(dir_output, METRICS_FILENAME))
 
-    logger.debug("start: %s forward: %s" % (scheduler.start, scheduler.forward))
 
+def get_output_dir(scheduler, opts, start_time):
+    """Get the output directory of the run starting at *start_time*, creating it if needed."""
     pattern_args = {
         "output_dir": opts.output_dir,
         "date": start_time.strftime("%Y%m%d"),
@@ -705,7 +1159,22 @@ def run(args=None):
     dir_output = build_filename("dir_output", scheduler.patterns, pattern_args)
     if not os.path.exists(dir_output):
         logger.debug("Create output dir " + dir_output)
-        os.makedirs(dir_output)
+        os.makedirs(dir_output, exist_ok=True)
+    return dir_output
+
+
+def run_window(scheduler, opts, start_time, tle_file, cacheable=False):
+    """Compute and write the schedules starting at *start_time*.
+
+    The schedules of a *cacheable* run are taken from the run cache if they are there, and stored in it otherwise.
+    The graphs are not cached, so runs saving them are never taken from the cache.
+
+    Returns:
+        The output directory of the run.
+    """
+    logger.debug("start: %s forward: %s" % (scheduler.start, scheduler.forward))
+
+    dir_output = get_output_dir(scheduler, opts, start_time)
 
     if len(scheduler.stations) > 1:
         opts.comb = True
@@ -718,11 +1187,54 @@ def run(args=None):
 
     scheduler.opts = opts
 
+    run_cache = None
+    if cacheable and not opts.graph:
+        from trollsched.runcache import RunCache, dump_run, get_run_key, load_run
+        run_cache = RunCache()
+        run_key = get_run_key(scheduler, opts, start_time, tle_file)
+
+    entry = None
+    if run_cache is not None and not opts.force_recompute:
+        entry = run_cache.get(run_key)
+        if entry is not None:
+            try:
+                entry = load_run(entry, [sat for station in scheduler.stations for sat in station.satellites],
+                                 [station.area for station in scheduler.stations])
+            except (KeyError, TypeError, ValueError) as err:
+                logger.warning("Invalid run cache entry %s, ignoring it: %s", run_key, str(err))
+                entry = None
+        profiler.count("run_cache", result="miss" if entry is None else "hit")
+
+    if entry is not None:
+        logger.info("Schedule found in the run cache, generating the missing files only")
+        write_cached_run(scheduler, start_time, entry)
+    else:
+        entry = compute_schedules(scheduler, start_time, tle_file, dir_output)
+        if run_cache is not None:
+            run_cache.put(run_key, dump_run(entry))
+    return dir_output
+
+
+def compute_schedules(scheduler, start_time, tle_file, dir_output):
+    """Compute the schedules of the stations, and their combination if there are several stations.
+
+    Returns:
+        The passes of the stations, with the recorded flags of the passes in the single and combined schedules.
+    """
+    opts = scheduler.opts
+    allpasses = {}
+    graph = {}
+    pattern_args = {
+        "output_dir": opts.output_dir,
+        "date": start_time.strftime("%Y%m%d"),
+        "time": start_time.strftime("%H%M%S")
+    }
+
     # single- or multi-processing?
     if not opts.multiproc or len(scheduler.stations) == 1:
         # sequential processing all stations' single schedule.
         for station in scheduler.stations:
-            graph[station.id], allpasses[station.id] = station.single_station(scheduler, start_time, tle_file)
+            graph[station.id], allpasses[station.id] = run_single_station(station, scheduler, start_time, tle_file)
     else:
         # processing the stations' single schedules with multiprocessing.
         process_single = {}
@@ -734,11 +1246,12 @@ def run(args=None):
             statlst_ordered.append(station.id)
             from multiprocessing import Process
             process_single[station.id] = Process(
-                target=station.single_station,
-                args=(scheduler, start_time, tle_file))
+                target=run_single_station,
+                args=(station, scheduler, start_time, tle_file, True))
             process_single[station.id].start()
         # second round through the stations, collecting the sub-processes and
         # their results.
+        import pickle
         for station_id in statlst_ordered:
             process_single[station_id].join()
             pattern_args["station"] = station_id
@@ -752,8 +1265,84 @@ def run(args=None):
             allpasses[station_id] = pickle.load(ph)
             ph.close()
 
+    entry = {"passes": allpasses,
+             "rec": {station_id: [opass.rec for opass in passes] for station_id, passes in allpasses.items()},
+             "comb_rec": None}
     if opts.comb:
         combined_stations(scheduler, start_time, graph, allpasses)
+        entry["comb_rec"] = {station_id: [opass.rec for opass in passes]
+                             for station_id, passes in allpasses.items()}
+    if getattr(opts, "catalogue", None) is not None:
+        from trollsched.catalogue import add_to_catalogue
+        add_to_catalogue(scheduler, start_time, allpasses, opts.catalogue)
+    return entry
+
+
+def write_cached_run(scheduler, start_time, entry):
+    """Write the files of a run found in the run cache, which are not there yet."""
+    opts = scheduler.opts
+    for station in scheduler.stations:
+        allpasses = entry["passes"][station.id]
+        for opass, rec in zip(allpasses, entry["rec"][station.id]):
+            opass.rec = rec
+        if opts.plot:
+            pattern_args = {"station": station.id,
+                            "output_dir": opts.output_dir,
+                            "date": start_time.strftime("%Y%m%d"),
+                            "time": start_time.strftime("%H%M%S")}
+            if opts.xml:
+                pattern_args["mode"] = "request"
+            elif opts.report:
+                pattern_args["mode"] = "report"
+            with profiler.timer("area_boundary", station=station.id):
+                station.area.poly = get_area_polygon(station.area, vertices_per_side=8)
+            save_passes(allpasses, station.area.poly, build_filename("dir_plots", scheduler.patterns, pattern_args),
+                        scheduler.plot_parameters, scheduler.plot_title)
+        station.write_schedule_files(scheduler, start_time, allpasses, only_missing=True)
+    if entry["comb_rec"] is not None:
+        for station_id, allpasses in entry["passes"].items():
+            for opass, rec in zip(allpasses, entry["comb_rec"][station_id]):
+                opass.rec = rec
+        write_combined_files(scheduler, start_time, entry["passes"], only_missing=True)
+    if opts.catalogue is not None:
+        from trollsched.catalogue import add_to_catalogue
+        add_to_catalogue(scheduler, start_time, entry["passes"], opts.catalogue)
+
+
+def log_prefilter_rate():
+    """Log how many of the polygon pairs were found disjoint without computing their intersection."""
+    rejected = profiler.get_count("intersection_prefilter", result="rejected")
+    total = rejected + profiler.get_count("intersection_prefilter", result="passed")
+    if total:
+        logger.info("Bounding cap prefilter rejected %d of %d polygon pairs (%.1f%%)",
+                    rejected, total, 100. * rejected / total)
+
+
+def run_single_station(station, scheduler, start_time, tle_file, subprocess=False):
+    """Run the schedule of a single *station*, under the profiler if asked for.
+
+    When running in a *subprocess*, the station's timings are written to their own report.
+    """
+    opts = scheduler.opts
+    if not (getattr(opts, "profile", None) or getattr(opts, "metrics", False)):
+        return station.single_station(scheduler, start_time, tle_file)
+
+    if opts.profile and opts.profiler:
+        with profiler.profile(opts.profiler, get_profile_filename(opts.profile, station.id, opts.profiler)):
+            res = station.single_station(scheduler, start_time, tle_file)
+    else:
+        res = station.single_station(scheduler, start_time, tle_file)
+    if subprocess and opts.profile:
+        base, ext = os.path.splitext(opts.profile)
+        profiler.write_report(base + "." + station.id + ext)
+    if subprocess and opts.metrics:
+        pattern_args = {"output_dir": opts.output_dir,
+                        "date": start_time.strftime("%Y%m%d"),
+                        "time": start_time.strftime("%H%M%S")}
+        base, ext = os.path.splitext(METRICS_FILENAME)
+        write_metrics(os.path.join(build_filename("dir_output", scheduler.patterns, pattern_args),
+                                   base + "." + station.id + ext))
+    return res
 
 
 def setup_logging(opts):
@@ -825,6 +1414,48 @@ def parse_args(args=None):
                             help="do not consider Aqua/Terra-dumps")
     group_spec.add_argument("--multiproc", action="store_true",
                             help="use multiple parallel processes")
+    group_spec.add_argument("--catalogue", nargs="?", const="", default=None, metavar="DIR",
+                            help="add the predicted passes to the pass catalogue in DIR (the 'catalogue' "
+                                 "directory of the cache directory if no DIR is given)")
+    group_spec.add_argument("--force-recompute", action="store_true",
+                            help="compute the schedule even if the same run is in the run cache, "
+                                 "and write all the files again")
+    group_spec.add_argument("--solver", default="graph", choices=["graph", "streaming", "dp"],
+                            help="how to find the best schedule: with the graph of the whole period (default), "
+                                 "segment by segment with bounded memory ('streaming'), or by dynamic programming "
+                                 "over the passes sorted by falltime ('dp'); the last two for single stations "
+                                 "only, without '-g'")
+    # argument group: backfill
+    group_back = parser.add_argument_group(title="backfill",
+                                           description="(schedules of a series of past start times)")
+    group_back.add_argument("--backfill", nargs=3, default=None, metavar=("START", "END", "STEP"),
+                            help="compute the schedules starting every STEP hours from START to END (iso times), "
+                                 "in one go")
+    group_back.add_argument("--tle-archive", default=None,
+                            help="directory, or glob pattern, of past TLE files to take the latest TLEs of each "
+                                 "start time from")
+    group_back.add_argument("--processes", type=int, default=1,
+                            help="number of processes computing the start times, or the sweep configurations, "
+                                 "in parallel (1 by default)")
+    # argument group: sweep
+    group_sweep = parser.add_argument_group(title="sweep",
+                                            description="(coverage of the schedules of a grid of parameter values)")
+    group_sweep.add_argument("--sweep", default=None, metavar="GRID",
+                             help="schedule the stations with each combination of the satellite scores, minimum "
+                                  "pass durations, delays and local horizons of the yaml file GRID, and write their "
+                                  "coverage to '%s' in the output directory instead of the schedules" % SWEEP_FILENAME)
+    # argument group: profiling
+    group_prof = parser.add_argument_group(title="profiling",
+                                           description="(timing of the different stages of the run)")
+    group_prof.add_argument("--profile", default=None, metavar="REPORT",
+                            help="write a timing report to REPORT, as csv if it ends with '.csv', json otherwise")
+    group_prof.add_argument("--profiler", default=None, choices=PROFILERS,
+                            help="also dump a profile of each station's computations next to the report")
+    group_prof.add_argument("--metrics", action="store_true",
+                            help="write Prometheus metrics of the run to '%s' in the output directory"
+                                 % METRICS_FILENAME)
+    group_prof.add_argument("--metrics-port", type=int, default=None,
+                            help="serve Prometheus metrics on http://localhost:METRICS_PORT/metrics while running")
     # argument group: output-related
     group_outp = parser.add_argument_group(title="output",
                                            description="(file pattern are taken from configuration file)")
@@ -854,7 +1485,25 @@ def parse_args(args=None):
         parser.error("Coordinates must be provided in the absence of "
                      "configuration file.")
 
-    if not (opts.xml or opts.scisys or opts.report or opts.metno_xml or opts.meos):
+    if opts.backfill:
+        try:
+            opts.backfill = [datetime.fromisoformat(opts.backfill[0]), datetime.fromisoformat(opts.backfill[1]),
+                             timedelta(hours=float(opts.backfill[2]))]
+        except ValueError:
+            parser.error("'--backfill' needs start and end iso times and a step in hours")
+        if opts.backfill[2] <= timedelta(0):
+            parser.error("The step of '--backfill' must be positive")
+        if opts.start_time:
+            parser.error("'--backfill' and '-s/--start-time' can't be used together")
+    elif opts.tle_archive:
+        parser.error("'--tle-archive' needs '--backfill'")
+    if opts.sweep and opts.backfill:
+        parser.error("'--sweep' and '--backfill' can't be used together")
+
+    if opts.profiler and not opts.profile:
+        parser.error("'--profiler' needs a report file, use '--profile'")
+
+    if not (opts.xml or opts.scisys or opts.report or opts.metno_xml or opts.meos or opts.sweep):
         parser.error("No output specified, use '--scisys', '-x/--xml', '-r/--report', '--meos', or '--metno-xml'")
 
     return opts
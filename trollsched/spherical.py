@@ -31,6 +31,8 @@ import logging
 import numpy as np
 import pyresample.spherical
 
+from trollsched.profiling import profiler
+
 logger = logging.getLogger(__name__)
 
 EPSILON = 0.0000001
@@ -54,23 +56,316 @@ class SphPolygon(pyresample.spherical.SphPolygon):
         mapper.plot(rx, ry, options, **more_options)
 
 
+def get_sun_lonlats(utctimes):
+    """Get the longitudes and latitudes (in radians) of the subsolar points at *utctimes*, as arrays."""
+    from pyorbital import astronomy
+    utctimes = np.array(utctimes, dtype="datetime64[us]")
+    ra, dec = astronomy.sun_ra_dec(utctimes)
+    return modpi(ra - astronomy.gmst(utctimes)), dec
+
+
+def get_sun_vectors(utctimes):
+    """Get the unit vectors pointing to the sun at *utctimes*, as a (times, 3) array."""
+    lon, lat = get_sun_lonlats(utctimes)
+    return np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def get_twilight_polys(utctimes):
+    """Return the polygons enclosing the sunlit part of the globe at each of *utctimes*."""
+    lon, lat = get_sun_lonlats(utctimes)
+    vertices = np.zeros((len(lon), 4, 2))
+
+    vertices[:, 0, 0] = modpi(lon - np.pi / 2)
+    south = lat <= 0
+    vertices[:, 1, 0] = np.where(south, lon, modpi(lon + np.pi))
+    vertices[:, 1, 1] = np.where(south, np.pi / 2 + lat, np.pi / 2 - lat)
+    vertices[:, 3, 0] = np.where(south, modpi(lon + np.pi), lon)
+    vertices[:, 3, 1] = np.where(south, -(np.pi / 2 + lat), -(np.pi / 2 - lat))
+    vertices[:, 2, 0] = modpi(lon + np.pi / 2)
+
+    return [SphPolygon(poly_vertices) for poly_vertices in vertices]
+
+
 def get_twilight_poly(utctime):
     """Return a polygon enclosing the sunlit part of the globe at *utctime*."""
-    from pyorbital import astronomy
-    ra, dec = astronomy.sun_ra_dec(utctime)
-    lon = modpi(ra - astronomy.gmst(utctime))
-    lat = dec
+    return get_twilight_polys([utctime])[0]
+
+
+def day_night_sides(polygons, sun_vectors):
+    """Tell on which side of the terminator each of *polygons* is, from the signs of its vertices.
+
+    Polygons smaller than a hemisphere with all their vertices on one side of the terminator are
+    entirely on that side, so no intersection is needed to know their day and night areas.
+
+    Args:
+        polygons: the polygons to check
+        sun_vectors: the unit vector pointing to the sun, or one per polygon, as from `get_sun_vectors`.
+
+    Returns:
+        An array with 1 for the polygons in daylight, -1 for the ones in the dark, and 0 for the ones across
+        the terminator.
+    """
+    if not len(polygons):
+        return np.zeros(0, dtype=int)
+    dots = np.einsum("ijk,ik->ij", _stack_vertices(polygons), np.broadcast_to(sun_vectors, (len(polygons), 3)))
+    return np.where(np.all(dots > 0, axis=1), 1, np.where(np.all(dots < 0, axis=1), -1, 0))
+
+
+class BoundingCap:
+    """A spherical cap and a lon/lat box around a polygon, to tell cheaply that two polygons are disjoint.
+
+    The cap is centered on the normalized mean of the polygon vertices, with the
+    angular radius of the farthest vertex. Caps narrower than a hemisphere are
+    convex, so they hold the great circle arcs between the vertices too. The box
+    (in radians) is the one enclosing the cap.
+    """
+
+    __slots__ = ("center", "radius", "lat_min", "lat_max", "lon", "lon_half_width")
+
+    def __init__(self, center, radius):
+        """Initialize the cap from its *center*, a unit vector, and its angular *radius*."""
+        self.center = center
+        self.radius = radius
+        lat = np.arcsin(np.clip(center[2], -1, 1))
+        self.lat_min = lat - radius
+        self.lat_max = lat + radius
+        self.lon = np.arctan2(center[1], center[0])
+        if self.lat_min <= -np.pi / 2 or self.lat_max >= np.pi / 2:
+            # the cap holds a pole, all the longitudes are in the box
+            self.lon_half_width = np.pi
+        else:
+            self.lon_half_width = np.arcsin(min(1, np.sin(radius) / np.cos(lat)))
+
+    @classmethod
+    def from_polygon(cls, poly):
+        """Get the bounding cap of *poly*, None if the polygon is too large to be bounded by one."""
+        vectors = poly.cvertices / np.linalg.norm(poly.cvertices, axis=1)[:, np.newaxis]
+        center = vectors.sum(axis=0)
+        norm = np.linalg.norm(center)
+        if norm < EPSILON:
+            return None
+        center /= norm
+        radius = np.arccos(np.clip(vectors @ center, -1, 1)).max()
+        # The vertices also bound the complement of a polygon, which is the larger part of the sphere
+        if radius >= np.pi / 2 or poly.area() > 2 * np.pi * poly.radius ** 2:
+            return None
+        return cls(center, radius)
+
+    def is_disjoint(self, other):
+        """Check if this cap and the *other* one have no point in common."""
+        if self.lat_min > other.lat_max or other.lat_min > self.lat_max:
+            return True
+        if abs(modpi(self.lon - other.lon)) > self.lon_half_width + other.lon_half_width:
+            return True
+        return np.arccos(np.clip(self.center @ other.center, -1, 1)) > self.radius + other.radius
+
+
+def _get_cached(poly, name, func):
+    """Get *func(poly)*, computed on first use and then kept with the polygon as long as its vertices don't change."""
+    cached = poly.__dict__.get(name)
+    if cached is not None and cached[0] is poly.cvertices:
+        return cached[1]
+    value = func(poly)
+    poly.__dict__[name] = (poly.cvertices, value)
+    return value
+
+
+def get_bounding_cap(poly):
+    """Get the bounding cap of *poly*, computed on first use and then kept with the polygon."""
+    return _get_cached(poly, "_bounding_cap", BoundingCap.from_polygon)
+
+
+def is_disjoint(poly1, poly2):
+    """Check cheaply if *poly1* and *poly2* are disjoint, from their bounding caps.
+
+    False means that the polygons may intersect. The outcome of the check is counted as
+    `intersection_prefilter` by the profiler.
+    """
+    cap1 = get_bounding_cap(poly1)
+    cap2 = get_bounding_cap(poly2)
+    if cap1 is not None and cap2 is not None and cap1.is_disjoint(cap2):
+        profiler.count("intersection_prefilter", result="rejected")
+        return True
+    profiler.count("intersection_prefilter", result="passed")
+    return False
+
+
+def intersection(poly1, poly2):
+    """Get the intersection of *poly1* and *poly2*, or None if they don't intersect.
+
+    The bounding caps of the polygons are checked first, and the exact intersection is only computed
+    if they overlap.
+    """
+    if is_disjoint(poly1, poly2):
+        return None
+    return poly1.intersection(poly2)
+
+
+def _unit_vertices(poly):
+    return poly.cvertices / np.linalg.norm(poly.cvertices, axis=1)[:, np.newaxis]
+
+
+def _edge_normals(vertices):
+    """Get the unit normals of the great circles through the successive *vertices*, closing the ring."""
+    normals = np.cross(vertices, np.roll(vertices, -1, axis=0))
+    return normals / np.linalg.norm(normals, axis=-1)[..., np.newaxis]
+
+
+def _triangulate(vertices):
+    """Split the polygon of *vertices* in triangles by ear clipping, None if that fails.
+
+    With the vertices enumerated clockwise, a vertex is an ear if the polygon turns right there
+    and no other vertex lies in the triangle it makes with its neighbours.
+    """
+    remaining = list(range(len(vertices)))
+    triangles = []
+    while len(remaining) > 3:
+        for i in range(len(remaining)):
+            prev_idx, idx, next_idx = remaining[i - 1], remaining[i], remaining[(i + 1) % len(remaining)]
+            triangle = vertices[[prev_idx, idx, next_idx]]
+            normals = _edge_normals(triangle)
+            if vertices[next_idx] @ normals[0] > EPSILON:
+                continue
+            others = vertices[[j for j in remaining if j not in (prev_idx, idx, next_idx)]]
+            if np.any(np.all(others @ normals.T < -EPSILON, axis=1)):
+                continue
+            triangles.append(normals)
+            del remaining[i]
+            break
+        else:
+            return None
+    triangles.append(_edge_normals(vertices[remaining]))
+    return np.array(triangles)
+
+
+def _get_convex_pieces(clip):
+    """Get the normals of the edges of convex polygons making up *clip*, as a (pieces, edges, 3) array.
+
+    A convex polygon is its only piece, other polygons are triangulated. With the vertices
+    enumerated clockwise, the inside of a piece is where the dot products with all its normals are
+    negative. None is returned if the polygon can't be split.
+    """
+    vertices = _unit_vertices(clip)
+    # drop the duplicate vertices
+    vertices = vertices[np.linalg.norm(vertices - np.roll(vertices, -1, axis=0), axis=1) > EPSILON]
+    if len(vertices) < 3:
+        return None
+    normals = _edge_normals(vertices)
+    if np.all(vertices @ normals.T <= EPSILON):
+        return normals[np.newaxis]
+    with np.errstate(invalid="ignore"):
+        return _triangulate(vertices)
+
+
+def _stack_vertices(polygons):
+    """Stack the unit vectors of the vertices of *polygons* in one (polygons, vertices, 3) array.
+
+    The shorter polygons are padded with their last vertex, which adds only empty edges.
+    """
+    size = max(len(poly.vertices) for poly in polygons)
+    points = np.empty((len(polygons), size, 3))
+    for i, poly in enumerate(polygons):
+        vectors = _unit_vertices(poly)
+        points[i, :len(vectors)] = vectors
+        points[i, len(vectors):] = vectors[-1]
+    return points
+
+
+def _clip_with_planes(points, normals):
+    """Clip each polygon in *points* with the half sphere below the great circle of its normal, à la Sutherland-Hodgman.
+
+    Each edge of a polygon yields its crossing with the great circle if any, and its end if that is inside.
+    The clipped polygons are padded with their last vertex, and empty polygons are all zeros.
+    """
+    dots = np.einsum("ijk,ik->ij", points, normals)
+    prev_points = np.roll(points, 1, axis=1)
+    prev_dots = np.roll(dots, 1, axis=1)
+    # the vertices on the great circle are inside, with some leeway for rounding errors
+    inside = dots <= 1e-12
+    crossing = inside != (prev_dots <= 1e-12)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        crossings = ((prev_dots[..., np.newaxis] * points - dots[..., np.newaxis] * prev_points)
+                     / (prev_dots - dots)[..., np.newaxis])
+        crossings /= np.linalg.norm(crossings, axis=-1)[..., np.newaxis]
+
+    candidates = np.stack((crossings, points), axis=2).reshape(len(points), -1, 3)
+    valid = np.stack((crossing, inside), axis=2).reshape(len(points), -1)
+    # move the valid vertices first, keeping their order
+    order = np.argsort(~valid, axis=1, kind="stable")
+    counts = valid.sum(axis=1)
+    size = max(counts.max(), 1)
+    order = order[:, :size]
+    last = np.take_along_axis(order, np.maximum(counts - 1, 0)[:, np.newaxis], axis=1)
+    order = np.where(np.arange(size) < counts[:, np.newaxis], order, last)
+    clipped = np.take_along_axis(candidates, order[..., np.newaxis], axis=1)
+    clipped[counts == 0] = 0
+    return clipped
+
+
+def _polygon_areas(points):
+    """Get the areas of the polygons in *points*, from the fans of triangles on their first vertex.
+
+    The spherical excess of each triangle is computed with the formula of Van Oosterom and Strackee.
+    """
+    if points.shape[1] < 3:
+        return np.zeros(len(points))
+    first = np.broadcast_to(points[:, :1], points[:, 2:].shape)
+    second = points[:, 1:-1]
+    third = points[:, 2:]
+    triple = np.einsum("ijk,ijk->ij", first, np.cross(second, third))
+    denominator = (1 + np.einsum("ijk,ijk->ij", first, second) + np.einsum("ijk,ijk->ij", second, third)
+                   + np.einsum("ijk,ijk->ij", third, first))
+    return np.abs(2 * np.arctan2(triple, denominator).sum(axis=1))
+
+
+def _combine_pieces(first, second):
+    """Combine two sets of convex pieces into the pieces of their intersection."""
+    return np.concatenate((np.repeat(first, len(second), axis=0),
+                           np.tile(second, (len(first), 1, 1))), axis=1)
+
+
+def clip_areas(polygons, *clips):
+    """Get the areas of the intersections of each of *polygons* with all the *clips* polygons.
+
+    All the polygons are clipped together, in one pass over the edges of the clip polygons, or of the
+    triangles they are split into if they are not convex (as the day or night half of the globe
+    is). The clipped polygons themselves need not be convex. If a clip polygon can't be split, the
+    intersections are computed one by one.
+
+    Returns:
+        The areas as an array, 0 where a polygon does not intersect the clip polygons.
+    """
+    if not len(polygons):
+        return np.zeros(0)
+    pieces = None
+    for clip in clips:
+        clip_pieces = _get_cached(clip, "_convex_pieces", _get_convex_pieces)
+        if clip_pieces is None:
+            return _intersection_areas(polygons, clips)
+        pieces = clip_pieces if pieces is None else _combine_pieces(pieces, clip_pieces)
+
+    npieces, nedges = pieces.shape[:2]
+    points = np.repeat(_stack_vertices(polygons), npieces, axis=0)
+    for edge in range(nedges):
+        points = _clip_with_planes(points, np.tile(pieces[:, edge], (len(polygons), 1)))
+    areas = _polygon_areas(points).reshape(len(polygons), npieces).sum(axis=1)
+    return areas * polygons[0].radius ** 2
 
-    vertices = np.zeros((4, 2))
 
-    vertices[0, :] = modpi(lon - np.pi / 2), 0
-    if lat <= 0:
-        vertices[1, :] = lon, np.pi / 2 + lat
-        vertices[3, :] = modpi(lon + np.pi), -(np.pi / 2 + lat)
-    else:
-        vertices[1, :] = modpi(lon + np.pi), np.pi / 2 - lat
-        vertices[3, :] = lon, -(np.pi / 2 - lat)
+def _intersection_areas(polygons, clips):
+    """Get the areas of the intersections of each of *polygons* with all the *clips*, one by one."""
+    areas = []
+    for poly in polygons:
+        for clip in clips:
+            poly = poly.intersection(clip)
+            if poly is None:
+                break
+        areas.append(0 if poly is None else poly.area())
+    return np.array(areas, dtype=np.float64)
 
-    vertices[2, :] = modpi(lon + np.pi / 2), 0
 
-    return SphPolygon(vertices)
+def get_areas(polygons):
+    """Get the areas of *polygons* as an array."""
+    if not len(polygons):
+        return np.zeros(0)
+    return _polygon_areas(_stack_vertices(polygons)) * polygons[0].radius ** 2
@@ -0,0 +1,345 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Schedule the stations with a grid of parameter values, to compare them.
+
+The parameters are the day and night scores of the satellites, the minimum
+pass duration, the delay between passes and the local horizon. Only the
+horizon changes the predicted passes and their boundaries, so the passes are
+predicted and intersected with the station areas once per horizon value: the
+areas of the day and night parts of the intersections of the passes, and of
+the pass pairs which can follow each other in a schedule, are computed once
+and weighted with the scores of each configuration. The schedules of the
+configurations are then found in parallel, with the dynamic programming
+solver (or the flow solver for stations with several antennas), and their
+coverage written to a table.
+"""
+
+import copy
+import csv
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import product
+
+from trollsched.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+SWEEP_FILENAME = "sweep.csv"
+
+PARAMETERS = ["local_horizon", "min_pass", "delay"]
+
+
+def read_grid(filename):
+    """Read the grid of parameter values to sweep from the yaml *filename*.
+
+    The file has lists of values for `local_horizon`, `min_pass` and `delay` (in seconds), and for the `day` and
+    `night` scores of the satellites under `satellites`. The parameters which are not in the grid keep the values of
+    the configuration and the command line.
+
+    Returns:
+        The values of each parameter, the satellite scores being named `<satellite>.day` and `<satellite>.night`.
+    """
+    from trollsched.utils import read_yaml_file
+
+    config = read_yaml_file(filename) or {}
+    grid = {}
+    for name, values in config.items():
+        if name == "satellites":
+            for sat_name, scores in values.items():
+                for score_name, score_values in scores.items():
+                    if score_name not in ("day", "night"):
+                        raise ValueError("Unknown score '%s' for %s in %s" % (score_name, sat_name, filename))
+                    grid[sat_name + "." + score_name] = score_values
+        elif name in PARAMETERS:
+            grid[name] = values
+        else:
+            raise ValueError("Unknown sweep parameter '%s' in %s" % (name, filename))
+    return {name: values if isinstance(values, list) else [values] for name, values in grid.items()}
+
+
+def get_configurations(grid):
+    """Get all the combinations of the values of the *grid*, as dicts of parameter values."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in product(*(grid[name] for name in names))]
+
+
+class SweepGeometry:
+    """The passes of a station for a local horizon, with the areas of their intersections with the station area.
+
+    Args:
+        station: the station, with the local horizon of the passes.
+        passes: the passes predicted for all the minimum pass durations of the sweep, as simple passes.
+        subsets: the indices of the passes kept with each minimum pass duration.
+        area: the area of the station area.
+        parts: the area of the intersection of each pass with the station area and its day area, or None if the
+            pass misses the station area.
+        pairs: the common area of the intersections of the pass pairs (by indices) which may follow each other
+            in a schedule, with its day areas at the uptimes of the two passes, or None if they don't intersect.
+    """
+
+    def __init__(self, station, passes, subsets, area, parts, pairs):
+        """Initialize the geometry."""
+        self.station = station
+        self.passes = passes
+        self.subsets = subsets
+        self.area = area
+        self.parts = parts
+        self.pairs = pairs
+
+
+def compute_geometry(station, scheduler, start_time, tle_file, min_passes, delays, avoid_list=None):
+    """Predict the passes of *station* and compute the areas needed to score them with any satellite scores.
+
+    The passes are predicted for each of the *min_passes*, the passes kept with several of them being shared.
+    The pass pairs are those scored when scheduling with any of the *delays*.
+
+    Returns:
+        The :class:`SweepGeometry` of the station.
+    """
+    from trollsched.areas import get_area_polygon
+    from trollsched.backfill import PassPool
+    from trollsched.satpass import SimplePass
+    from trollsched.schedule import get_area_parts, get_best_sched_dp, get_pair_parts, get_twilight, prime_twilights
+
+    station = copy.copy(station)
+    scheduler = copy.copy(scheduler)
+    scheduler.pass_pool = PassPool()
+    passes = []
+    index = {}
+    subsets = {}
+    for min_pass in min_passes:
+        station.min_pass = min_pass
+        subset = station.get_next_passes(scheduler.opts, scheduler, start_time, tle_file)
+        for overpass in subset:
+            if id(overpass) not in index:
+                index[id(overpass)] = len(passes)
+                passes.append(overpass)
+        subsets[min_pass] = [index[id(overpass)] for overpass in subset]
+
+    arcs = set()
+    if station.antennas == 1:
+        def record(p1, p2, area_of_interest):
+            arcs.add((index[id(p1)], index[id(p2)]))
+            return 0
+
+        # The arcs the solver goes through only depend on the passes and the delay, not on the scores
+        for subset in subsets.values():
+            for delay in delays:
+                get_best_sched_dp([passes[i] for i in subset], station.area, timedelta(seconds=delay), avoid_list,
+                                  score=record)
+
+    with profiler.timer("sweep_geometry", station=station.id):
+        station.area.poly = get_area_polygon(station.area, vertices_per_side=8)
+        prime_twilights([overpass.uptime for overpass in passes])
+        polys = []
+        parts = []
+        for overpass in passes:
+            ip1, total, day = get_area_parts(overpass, station.area, *get_twilight(overpass.uptime))
+            polys.append(ip1)
+            parts.append(None if ip1 is None else (total, day))
+        pairs = {}
+        for i, j in sorted(arcs):
+            if polys[i] is not None and polys[j] is not None:
+                pairs[i, j] = get_pair_parts(polys[i], polys[j], get_twilight(passes[i].uptime),
+                                             get_twilight(passes[j].uptime))
+
+    simple_passes = []
+    for overpass in passes:
+        simple_pass = SimplePass(overpass.satellite, overpass.risetime, overpass.falltime)
+        simple_pass.uptime = overpass.uptime
+        simple_pass.instrument = overpass.instrument
+        simple_passes.append(simple_pass)
+    return SweepGeometry(station, simple_passes, subsets, station.area.poly.area(), parts, pairs)
+
+
+def get_satellite_score(satellite, configuration):
+    """Get the scores of *satellite* in *configuration*, the satellite's own scores if it isn't swept."""
+    from trollsched.schedule import SatScore
+    return SatScore(configuration.get(satellite.name + ".day", satellite.score.day),
+                    configuration.get(satellite.name + ".night", satellite.score.night))
+
+
+def solve_configuration(geometry, configuration, delay, min_pass, avoid_list=None):
+    """Schedule the station of *geometry* with the scores of *configuration*, *delay* and *min_pass*.
+
+    Returns:
+        The schedule, as indices of the passes of the geometry, and the scores of all the passes of the geometry.
+    """
+    from trollsched.flow import schedule_antennas
+    from trollsched.satpass import AvoidIndex
+    from trollsched.schedule import FLOW_SCORE_RESOLUTION, get_best_sched_dp, get_pair_score, weigh_area
+
+    if not isinstance(avoid_list, AvoidIndex):
+        avoid_list = AvoidIndex(avoid_list or [])
+    sat_scores = {}
+    scores = []
+    for overpass, parts in zip(geometry.passes, geometry.parts):
+        sat_name = overpass.satellite.name
+        if sat_name not in sat_scores:
+            sat_scores[sat_name] = get_satellite_score(overpass.satellite, configuration)
+        scores.append(None if parts is None else weigh_area(*parts, sat_scores[sat_name], geometry.area))
+
+    index = {id(overpass): i for i, overpass in enumerate(geometry.passes)}
+    passes = [geometry.passes[i] for i in geometry.subsets[min_pass]]
+    delay = timedelta(seconds=delay)
+
+    if geometry.station.antennas > 1:
+        passes.sort(key=lambda x: x.risetime)
+        pass_scores = [None if overpass in avoid_list else int(round((scores[index[id(overpass)]] or 0) *
+                                                                     FLOW_SCORE_RESOLUTION)) + 1
+                       for overpass in passes]
+        schedules = schedule_antennas(passes, pass_scores, geometry.station.antennas, delay)
+        schedule = [overpass for antenna_schedule in schedules for overpass in antenna_schedule]
+    else:
+        def score(p1, p2, area_of_interest):
+            i, j = index[id(p1)], index[id(p2)]
+            if scores[i] is None or scores[j] is None:
+                return 0
+            parts = geometry.pairs[i, j]
+            if parts is None:
+                sip1p2 = 0
+            else:
+                common, day_a, day_b = parts
+                sip1p2 = (weigh_area(common, day_a, sat_scores[p1.satellite.name], geometry.area) +
+                          weigh_area(common, day_b, sat_scores[p2.satellite.name], geometry.area)) / 2.0
+            return get_pair_score(p1, p2, scores[i], scores[j], sip1p2)
+
+        schedule = get_best_sched_dp(passes, None, delay, avoid_list, score=score)
+    return sorted(index[id(overpass)] for overpass in schedule), scores
+
+
+def get_coverage(geometry, schedule, scores, min_pass):
+    """Get the coverage metrics of the *schedule* (pass indices) of the station of *geometry*."""
+    day = night = 0
+    minutes = 0
+    satellites = {}
+    for i in schedule:
+        overpass = geometry.passes[i]
+        minutes += overpass.seconds() / 60.
+        satellites[overpass.satellite.name] = satellites.get(overpass.satellite.name, 0) + 1
+        if geometry.parts[i] is not None:
+            total, day_area = geometry.parts[i]
+            day += day_area
+            night += total - day_area
+    row = {"passes": len(geometry.subsets[min_pass]),
+           "scheduled": len(schedule),
+           "scheduled_minutes": round(minutes, 2),
+           "day_coverage": round(day / geometry.area, 4),
+           "night_coverage": round(night / geometry.area, 4),
+           "score": round(sum(scores[i] or 0 for i in schedule), 6)}
+    for sat_name, count in satellites.items():
+        row["scheduled_" + sat_name] = count
+    return row
+
+
+def solve_configurations(geometry, configurations, opts, avoid_list=None):
+    """Schedule the station of *geometry* with each of the numbered *configurations*.
+
+    Returns:
+        The rows of the sweep table for the configurations.
+    """
+    rows = []
+    station = geometry.station
+    for number, configuration in configurations:
+        min_pass = configuration.get("min_pass", station.min_pass)
+        delay = configuration.get("delay", opts.delay)
+        with profiler.timer("sweep_solve", station=station.id):
+            schedule, scores = solve_configuration(geometry, configuration, delay, min_pass, avoid_list)
+        row = {"configuration": number, "station": station.id, "local_horizon": station.local_horizon,
+               "min_pass": min_pass, "delay": delay}
+        row.update((name, value) for name, value in configuration.items() if name not in row)
+        row.update(get_coverage(geometry, schedule, scores, min_pass))
+        rows.append(row)
+    return rows
+
+
+def write_table(filename, rows):
+    """Write the *rows* of the sweep table to the csv *filename*."""
+    fieldnames = []
+    for row in rows:
+        fieldnames.extend(name for name in row if name not in fieldnames)
+    with open(filename, "w", newline="") as fd_:
+        writer = csv.DictWriter(fd_, fieldnames=fieldnames, restval=0)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_sweep(scheduler, opts):
+    """Schedule the stations with the configurations of the `--sweep` grid, and write their coverage table.
+
+    Returns:
+        The output directory of the run.
+    """
+    from trollsched.schedule import get_output_dir, get_passes_from_xml_file
+
+    grid = read_grid(opts.sweep)
+    configurations = list(enumerate(get_configurations(grid), 1))
+    logger.info("Sweeping %d configurations of %s", len(configurations), ", ".join(grid) or "nothing")
+
+    start_time = opts.start_time or datetime.utcnow()
+    tle_file = opts.tle
+    if tle_file is None:
+        from trollsched.tlestore import get_tle_store
+        tle_file = get_tle_store().get_tle_file()
+    avoid_list = None
+    if opts.avoid is not None:
+        from trollsched.satpass import AvoidIndex
+        avoid_list = AvoidIndex(get_passes_from_xml_file(opts.avoid))
+    scheduler.opts = opts
+
+    # The configurations of each station and local horizon share the same passes
+    groups = {}
+    for station in scheduler.stations:
+        for number, configuration in configurations:
+            local_horizon = configuration.get("local_horizon", station.local_horizon)
+            groups.setdefault((station.id, local_horizon), (station, []))[1].append((number, configuration))
+    tasks = []
+    for (_, local_horizon), (station, group) in groups.items():
+        station = copy.copy(station)
+        station.local_horizon = local_horizon
+        min_passes = sorted({configuration.get("min_pass", station.min_pass) for _, configuration in group})
+        delays = sorted({configuration.get("delay", opts.delay) for _, configuration in group})
+        tasks.append((station, min_passes, delays, group))
+
+    processes = max(1, opts.processes)
+    rows = []
+    if processes == 1:
+        for station, min_passes, delays, group in tasks:
+            geometry = compute_geometry(station, scheduler, start_time, tle_file, min_passes, delays, avoid_list)
+            rows.extend(solve_configurations(geometry, group, opts, avoid_list))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            geometries = executor.map(compute_geometry, *zip(*[(station, scheduler, start_time, tle_file,
+                                                                min_passes, delays, avoid_list)
+                                                               for station, min_passes, delays, _ in tasks]))
+            futures = []
+            for geometry, (_, _, _, group) in zip(geometries, tasks):
+                # The configurations of a geometry are split between the processes, to ship it only once to each
+                size = -(-len(group) // processes)
+                futures.extend(executor.submit(solve_configurations, geometry, group[i:i + size], opts, avoid_list)
+                               for i in range(0, len(group), size))
+            for future in futures:
+                rows.extend(future.result())
+
+    station_order = {station.id: i for i, station in enumerate(scheduler.stations)}
+    rows.sort(key=lambda row: (row["configuration"], station_order[row["station"]]))
+    dir_output = get_output_dir(scheduler, opts, start_time)
+    filename = os.path.join(dir_output, SWEEP_FILENAME)
+    write_table(filename, rows)
+    logger.info("Wrote the coverage of %d configurations to %s", len(configurations), filename)
+    return dir_output
@@ -0,0 +1,74 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the cache of areas and area polygons."""
+
+import os
+from unittest import mock
+
+import pytest
+
+from trollsched import areas
+from trollsched.areas import clear_cache, get_area, get_area_polygon
+from trollsched.schedule import Station
+from trollsched.tests.test_schedule import euron1
+
+
+@pytest.fixture
+def area_file(tmp_path):
+    """Write an area file with one area."""
+    area_file = tmp_path / "areas.yaml"
+    with open(area_file, "w") as fd:
+        fd.write(euron1)
+    clear_cache()
+    yield os.fspath(area_file)
+    clear_cache()
+
+
+def test_area_file_parsed_once(area_file):
+    """Test that the area file is parsed once for all the stations using it."""
+    with mock.patch("trollsched.areas._parse_area_file", wraps=areas._parse_area_file) as parse:
+        stations = [Station(station_id, station_id, 16, 58, 0, "euron1", [], area_file=area_file)
+                    for station_id in ("nrk", "norrkoping")]
+    assert parse.call_count == 1
+    assert stations[0].area is stations[1].area
+    assert stations[0].area.area_id == "euron1"
+
+
+def test_area_file_changed(area_file):
+    """Test that a changed area file is parsed again."""
+    area = get_area(area_file, "euron1")
+    with open(area_file, "w") as fd:
+        fd.write(euron1.replace("height: 3072", "height: 1536"))
+    os.utime(area_file, ns=(0, os.stat(area_file).st_mtime_ns + 1000000))
+    new_area = get_area(area_file, "euron1")
+    assert new_area.shape == (1536, 3072)
+    assert get_area_polygon(new_area, vertices_per_side=8) is not get_area_polygon(area, vertices_per_side=8)
+
+
+def test_area_polygons_shared(area_file):
+    """Test that the polygons are shared for each resolution, and equal for equal areas."""
+    area = get_area(area_file, "euron1")
+    poly = get_area_polygon(area, vertices_per_side=8)
+    assert get_area_polygon(area, vertices_per_side=8) is poly
+    assert get_area_polygon(area, frequency=100) is not poly
+    assert get_area_polygon(area, frequency=100) is get_area_polygon(area, frequency=100)
+    assert poly.vertices.shape == area.boundary(8).contour_poly.vertices.shape
+
+    clear_cache()
+    same_area = get_area(area_file, "euron1")
+    assert same_area is not area
+    get_area_polygon(same_area, vertices_per_side=8)
+    assert get_area_polygon(area, vertices_per_side=8) is get_area_polygon(same_area, vertices_per_side=8)
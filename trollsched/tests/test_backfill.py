@@ -0,0 +1,144 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the computation of the schedules of a series of past start times."""
+
+import os
+import re
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+import yaml
+
+from trollsched import schedule
+from trollsched.backfill import PassPool, forget_before, get_start_times
+from trollsched.catalogue import PassCatalogue
+from trollsched.satpass import SimplePass
+from trollsched.schedule import parse_args, run
+from trollsched.tests.test_schedule import write_config
+
+
+def test_get_start_times():
+    """Test the start times of a backfill, the end included."""
+    start = datetime(2024, 4, 3)
+    assert get_start_times(start, start + timedelta(hours=12), timedelta(hours=6)) == [
+        start, start + timedelta(hours=6), start + timedelta(hours=12)]
+
+
+def test_backfill_options():
+    """Test the checks of the backfill options."""
+    opts = parse_args(["-c", "config.yaml", "-x", "--backfill", "2024-04-03T00:00", "2024-04-04", "1.5"])
+    assert opts.backfill == [datetime(2024, 4, 3), datetime(2024, 4, 4), timedelta(hours=1.5)]
+    with pytest.raises(SystemExit):
+        parse_args(["-c", "config.yaml", "-x", "--backfill", "2024-04-03", "2024-04-04", "-1"])
+    with pytest.raises(SystemExit):
+        parse_args(["-c", "config.yaml", "-x", "--tle-archive", "tles"])
+
+
+def make_pass(satellite, risetime, minutes=10):
+    """Make a pass with a fake orbital."""
+    overpass = SimplePass(satellite, risetime, risetime + timedelta(minutes=minutes))
+    overpass.uptime = risetime + timedelta(minutes=minutes / 2)
+    overpass.instrument = "avhrr"
+    overpass.orb = MagicMock()
+    overpass.orb.tle.line1 = "line1"
+    overpass.orb.tle.line2 = "line2"
+    return overpass
+
+
+def test_pass_pool_shares_passes():
+    """Test that the passes predicted again are replaced by the pooled ones, reset for the new schedule."""
+    start = datetime(2024, 4, 3)
+    pool = PassPool()
+    first = [make_pass("noaa-20", start + timedelta(hours=1)), make_pass("noaa-20", start + timedelta(hours=7))]
+    assert pool.share("nrk", first, start) == first
+    first[1].rec = True
+
+    second = [make_pass("noaa-20", start + timedelta(hours=7)), make_pass("noaa-20", start + timedelta(hours=13))]
+    shared = pool.share("nrk", second, start + timedelta(hours=6))
+    assert shared[0] is first[1]
+    assert shared[1] is second[1]
+    assert not shared[0].rec
+
+    assert pool.share("ska", second[:1], start + timedelta(hours=6))[0] is second[0]
+    assert pool.share("nrk", [make_pass("noaa-20", start + timedelta(hours=1))], start)[0] is not first[0]
+
+
+def test_forget_before(monkeypatch):
+    """Test that the cached scores of passes ended before a start time are removed."""
+    start = datetime(2024, 4, 3)
+    old, new = make_pass("noaa-20", start - timedelta(hours=1)), make_pass("noaa-20", start + timedelta(hours=1))
+    monkeypatch.setattr(schedule, "combination", {(id(old), id(new)): (old, new, 1), (id(new), id(new)): (new, new, 2)})
+    monkeypatch.setattr(schedule, "twilights", {old.uptime: None, new.uptime: None})
+    forget_before(start)
+    assert list(schedule.combination) == [(id(new), id(new))]
+    assert list(schedule.twilights) == [new.uptime]
+
+
+def strip_request_time(filename):
+    """Read a schedule file, without the time it was written at."""
+    with open(filename) as fd:
+        return re.sub("<requested-on>[^<]*</requested-on>", "", fd.read())
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_backfill(tmp_path, monkeypatch, processes):
+    """Test that backfilling writes the same schedules as separate runs, with the TLEs of the archive."""
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(tmp_path / "cache"))
+    config_file, tle_file, _ = write_config(tmp_path)
+    with open(config_file) as fd:
+        config = yaml.safe_load(fd)
+    config["pattern"]["file_xml"] = os.fspath(tmp_path / "sched-{date}{time}.xml")
+    config["default"]["forward"] = 6
+    with open(config_file, "w") as fd:
+        yaml.dump(config, fd)
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    os.rename(tle_file, archive / "tles.txt")
+
+    run(["-c", os.fspath(config_file), "-x", "--backfill", "2024-04-03T00:00:00", "2024-04-03T06:00:00", "3",
+         "--tle-archive", os.fspath(archive), "--processes", str(processes)])
+
+    assert sorted(path.name for path in tmp_path.glob("sched-*.xml")) == [
+        "sched-20240403000000.xml", "sched-20240403030000.xml", "sched-20240403060000.xml"]
+    assert PassCatalogue().get_station_ids() == []
+    backfilled = strip_request_time(tmp_path / "sched-20240403030000.xml")
+    os.remove(tmp_path / "sched-20240403030000.xml")
+    run(["-c", os.fspath(config_file), "-x", "-t", os.fspath(archive / "tles.txt"), "-s", "2024-04-03T03:00:00",
+         "--force-recompute"])
+    assert strip_request_time(tmp_path / "sched-20240403030000.xml") == backfilled
+
+
+def test_backfill_skips_start_times_before_the_tles(tmp_path, monkeypatch):
+    """Test that the start times without TLEs in the archive are skipped."""
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(tmp_path / "cache"))
+    config_file, tle_file, sched_file = write_config(tmp_path)
+    run(["-c", os.fspath(config_file), "-x", "--backfill", "2024-03-01T00:00:00", "2024-03-02T00:00:00", "24",
+         "--tle-archive", os.fspath(tle_file)])
+    assert not sched_file.exists()
+
+
+def test_backfill_to_catalogue(tmp_path, monkeypatch):
+    """Test that the windows backfilled to a catalogue in parallel each replace the passes of their own period."""
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(tmp_path / "cache"))
+    config_file, tle_file, _ = write_config(tmp_path)
+    run(["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file), "--backfill", "2024-04-03T00:00:00",
+         "2024-04-03T12:00:00", "12", "--processes", "2", "--catalogue", os.fspath(tmp_path / "catalogue")])
+
+    passes = PassCatalogue(tmp_path / "catalogue").get_passes("nrk")
+    risetimes = [overpass.risetime for overpass in passes]
+    assert risetimes == sorted(set(risetimes))
+    assert risetimes[0] < datetime(2024, 4, 3, 12) < risetimes[-1]
@@ -0,0 +1,165 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the catalogue of the predicted passes."""
+
+import os
+import re
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from trollsched.catalogue import PassCatalogue
+from trollsched.satpass import SimplePass
+from trollsched.schedule import Satellite, run
+from trollsched.spherical import SphPolygon
+from trollsched.tests.test_schedule import write_config
+
+START = datetime(2024, 4, 3, 12)
+
+
+def make_pass(sat_name, risetime, minutes=10, rec=False):
+    """Make a pass with a boundary around the station."""
+    overpass = SimplePass(Satellite(sat_name, 0.9, 0.4, schedule_name=sat_name.replace("-", "")), risetime,
+                          risetime + timedelta(minutes=minutes))
+    overpass.uptime = risetime + timedelta(minutes=minutes / 2)
+    overpass.instrument = "avhrr"
+    overpass.rec = rec
+    overpass.boundary = SimpleNamespace(contour_poly=SphPolygon(np.deg2rad([[10., 55.], [20., 55.], [15., 60.]])))
+    return overpass
+
+
+def test_time_range_queries(tmp_path):
+    """Test getting the passes of a time range and of a satellite from the memory-mapped catalogue."""
+    catalogue = PassCatalogue(tmp_path)
+    passes = [make_pass("noaa-20", START + timedelta(hours=hour), rec=hour % 2 == 0) for hour in range(6)]
+    passes.append(make_pass("metop-b", START + timedelta(hours=2, minutes=30), minutes=60))
+    catalogue.add_passes("nrk", passes[::-1], START)
+
+    assert catalogue.get_station_ids() == ["nrk"]
+    assert isinstance(catalogue.get_station("nrk").columns["risetime"], np.memmap)
+    found = catalogue.get_passes("nrk", START + timedelta(hours=3), START + timedelta(hours=5))
+    assert [(p.satellite.name, p.risetime) for p in found] == [("metop-b", START + timedelta(hours=2, minutes=30)),
+                                                               ("noaa-20", START + timedelta(hours=3)),
+                                                               ("noaa-20", START + timedelta(hours=4))]
+    assert [p.rec for p in found] == [False, False, True]
+    assert catalogue.get_passes("nrk", satellite="noaa20") == passes[:6]
+    assert catalogue.get_passes("ska") == []
+
+    np.testing.assert_allclose(found[1].boundary.contour_poly.vertices, passes[3].boundary.contour_poly.vertices)
+
+    again = catalogue.get_passes("nrk", START + timedelta(hours=3), START + timedelta(hours=5))
+    assert found[1] == again[1]
+    assert hash(found[1]) == hash(again[1])
+    assert len(set(found + again)) == 3
+
+
+def test_new_run_replaces_later_passes(tmp_path):
+    """Test that the passes of a run replace those of previous runs ending after its start time."""
+    catalogue = PassCatalogue(tmp_path)
+    catalogue.add_passes("nrk", [make_pass("noaa-20", START + timedelta(hours=hour)) for hour in range(4)], START)
+    new_start = START + timedelta(hours=2)
+    catalogue.add_passes("nrk", [make_pass("metop-b", new_start + timedelta(minutes=30))], new_start)
+
+    assert [(p.satellite.name, p.risetime) for p in catalogue.get_passes("nrk")] == [
+        ("noaa-20", START), ("noaa-20", START + timedelta(hours=1)), ("metop-b", new_start + timedelta(minutes=30))]
+    assert sorted(os.listdir(tmp_path)) == ["nrk", "nrk.lock"]
+    catalogue.add_passes("nrk", [], new_start)
+    assert sorted(os.listdir(tmp_path / "nrk")) == ["current", "gen-1", "gen-2"]
+
+
+def test_run_replaces_its_period_only(tmp_path):
+    """Test that a run replaces the passes of the period it predicted only, and drops the passes past retention."""
+    catalogue = PassCatalogue(tmp_path)
+    passes = [make_pass("noaa-20", START + timedelta(hours=hour)) for hour in range(12)]
+    for hour, overpass in enumerate(passes):
+        overpass.boundary.contour_poly = SphPolygon(np.deg2rad([[hour, 55.], [20., 55.], [15., 60. + hour]]))
+    catalogue.add_passes("nrk", passes, START, START + timedelta(hours=12))
+    past = START - timedelta(days=20)
+    catalogue.add_passes("nrk", [make_pass("metop-b", past + timedelta(hours=hour)) for hour in range(2)], past,
+                         past + timedelta(hours=12))
+    assert len(catalogue.get_passes("nrk", START)) == 12
+    assert len(catalogue.get_passes("nrk", past, START)) == 2
+
+    later = START + timedelta(days=25)
+    catalogue.add_passes("nrk", [make_pass("aqua", later)], later, later + timedelta(hours=12),
+                         retention=timedelta(days=30))
+    assert [p.satellite.name for p in catalogue.get_passes("nrk")] == ["noaa-20"] * 12 + ["aqua"]
+    for overpass, kept in zip(passes, catalogue.get_passes("nrk")):
+        np.testing.assert_allclose(kept.boundary.contour_poly.vertices, overpass.boundary.contour_poly.vertices)
+
+
+def test_concurrent_writers(tmp_path):
+    """Test that the runs writing the catalogue of a station at the same time all get their passes in."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def add_day(day):
+        start = START + timedelta(days=day)
+        PassCatalogue(tmp_path).add_passes("nrk", [make_pass("noaa-20", start + timedelta(hours=hour))
+                                                   for hour in range(10)], start, start + timedelta(hours=12))
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(add_day, range(8)))
+    assert len(PassCatalogue(tmp_path).get_passes("nrk")) == 80
+
+
+def test_readers_see_whole_generations(tmp_path, monkeypatch):
+    """Test that a reader opening the catalogue while it is written gets all the passes of one write."""
+    catalogue = PassCatalogue(tmp_path)
+    catalogue.add_passes("nrk", [make_pass("noaa-20", START + timedelta(hours=hour)) for hour in range(8)], START)
+    load = np.load
+    writes = []
+
+    def load_while_writing(*args, **kwargs):
+        if not writes:
+            writes.append(True)
+            catalogue.add_passes("nrk", [make_pass(sat_name, START) for sat_name in ["metop-b", "metop-c"]], START)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(np, "load", load_while_writing)
+    reader = PassCatalogue(tmp_path)
+    assert [p.satellite.name for p in reader.get_passes("nrk")] == ["noaa-20"] * 8
+    assert [p.satellite.name for p in reader.get_passes("nrk")] == ["metop-b", "metop-c"]
+
+
+def test_find_pass_from_schedule_times(tmp_path):
+    """Test finding a pass from the times of a schedule file, to the second."""
+    catalogue = PassCatalogue(tmp_path)
+    overpass = make_pass("noaa-20", START + timedelta(microseconds=600000))
+    catalogue.add_passes("nrk", [overpass], START)
+
+    assert catalogue.find_pass("nrk", "noaa20", START, overpass.falltime.replace(microsecond=0)) == overpass
+    assert catalogue.find_pass("nrk", "noaa20", START + timedelta(minutes=1), overpass.falltime) is None
+
+
+def test_run_adds_passes_to_catalogue(tmp_path, monkeypatch):
+    """Test that a run asked to add its passes to the catalogue, with their schedule and scores."""
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(tmp_path / "cache"))
+    config_file, tle_file, sched_file = write_config(tmp_path)
+    args = ["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file), "-s", START.isoformat()]
+    run(args)
+    assert not (tmp_path / "cache" / "catalogue").exists()
+
+    # from the run cache
+    run(args + ["--catalogue", os.fspath(tmp_path / "catalogue")])
+
+    passes = PassCatalogue(tmp_path / "catalogue").get_passes("nrk")
+    with open(sched_file) as fd:
+        scheduled = re.findall('start-time="([^"]*)"', fd.read())
+    assert [p.risetime.strftime("%Y-%m-%d-%H:%M:%S") for p in passes if p.rec] == scheduled
+    assert all(p.pass_key == ("noaa-20", p.orbit) and p.orbit > 0 for p in passes)
+    assert all(p.direction in ("ascending", "descending") and p.max_elev > 0 for p in passes)
+    assert any(p.area_score for p in passes)
@@ -0,0 +1,126 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the combination of the schedules of several stations."""
+
+from datetime import datetime, timedelta
+from itertools import combinations, product
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from trollsched.combine import get_lagrangian_combined_sched, get_reception_values, get_station_arcs
+from trollsched.satpass import SimplePass
+from trollsched.schedule import get_best_sched
+
+
+def make_station_passes(stations, seed):
+    """Make the passes of a few orbits seen by several stations, the same orbit seen by the stations a bit apart."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2018, 12, 4)
+    passes = {"st%d" % i: [] for i in range(stations)}
+    for satellite in ["noaa-20", "metop-b", "aqua"]:
+        first = start + timedelta(minutes=int(rng.integers(0, 100)))
+        for orbit in range(3):
+            for station_passes in passes.values():
+                if rng.random() < 0.7:
+                    risetime = first + timedelta(minutes=101 * orbit + int(rng.integers(-4, 5)))
+                    overpass = SimplePass(satellite, risetime, risetime + timedelta(minutes=int(rng.integers(6, 15))))
+                    overpass.uptime = risetime
+                    overpass.pass_key = (satellite, orbit)
+                    overpass.value = float(rng.uniform(0.1, 1))
+                    station_passes.append(overpass)
+    return passes
+
+
+def fake_combine(p1, p2, area_of_interest):
+    """Score a pass pair from the values of the passes."""
+    return p1.value + p2.value
+
+
+def get_graphs(passes):
+    """Get the graphs of the stations."""
+    graphs = {}
+    with patch("trollsched.schedule.combine", fake_combine), patch("trollsched.schedule.prime_twilights"):
+        for station, station_passes in passes.items():
+            _, (graphs[station], _) = get_best_sched(station_passes, None, timedelta(seconds=60))
+    return graphs
+
+
+def get_paths(arcs, vertex=0):
+    """Get all the paths of a station graph, as lists of inner vertices."""
+    if vertex == len(arcs) - 1:
+        return [[]]
+    return [([head] if head != len(arcs) - 1 else []) + path
+            for head, _ in arcs[vertex] for path in get_paths(arcs, head)]
+
+
+def get_score(graphs, passes, schedules):
+    """Get the score of the schedules: the weights of the station paths, less the duplicate receptions."""
+    score = 0
+    received = []
+    for station, schedule in zip(graphs, schedules):
+        graph = graphs[station]
+        index = {id(overpass): i + 1 for i, overpass in enumerate(sorted(passes[station], key=lambda x: x.risetime))}
+        path = [index[id(overpass)] for overpass in schedule]
+        score += sum(graph.weight(u, v) for u, v in zip([0] + path, path + [graph.order - 1]))
+        values = get_reception_values(graph)
+        received.append({overpass.pass_key: values[index[id(overpass)]] for overpass in schedule})
+    for first, second in combinations(received, 2):
+        score -= sum(min(value, second[key]) for key, value in first.items() if key in second)
+    return score
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_lagrangian_combination_is_optimal(seed):
+    """Test that the combined schedule is the best one, on cases small enough to try all the schedules."""
+    passes = make_station_passes(2 + seed % 2, seed)
+    graphs = get_graphs(passes)
+
+    stations, schedules = get_lagrangian_combined_sched(graphs, passes)
+
+    assert stations == list(graphs)
+    for station, schedule in zip(stations, schedules):
+        assert schedule == sorted(schedule, key=lambda x: x.risetime)
+        assert all(any(overpass is station_pass for station_pass in passes[station]) for overpass in schedule)
+    all_schedules = []
+    for station in stations:
+        station_passes = sorted(passes[station], key=lambda x: x.risetime)
+        all_schedules.append([[station_passes[u - 1] for u in path]
+                              for path in get_paths(get_station_arcs(graphs[station]))])
+    best = max(get_score(graphs, passes, candidate) for candidate in product(*all_schedules))
+    assert get_score(graphs, passes, schedules) == pytest.approx(best)
+
+
+def test_lagrangian_combination_avoids_duplicates():
+    """Test that a station rather takes another pass than one already received by another station."""
+    start = datetime(2018, 12, 4, 10)
+
+    def make_pass(satellite, minutes, value):
+        overpass = SimplePass(satellite, start + timedelta(minutes=minutes), start + timedelta(minutes=minutes + 10))
+        overpass.uptime = overpass.risetime
+        overpass.pass_key = (satellite, 1)
+        overpass.value = value
+        return overpass
+
+    passes = {"nrk": [make_pass("noaa-20", 0, 0.9)],
+              "ska": [make_pass("aqua", -30, 0.5), make_pass("noaa-20", 2, 0.8), make_pass("metop-b", 6, 0.6)]}
+    graphs = get_graphs(passes)
+
+    _, schedules = get_lagrangian_combined_sched(graphs, passes)
+
+    assert [[overpass.satellite.name for overpass in schedule] for schedule in schedules] == [["noaa-20"],
+                                                                                              ["aqua", "metop-b"]]
@@ -0,0 +1,172 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the comparison of the requests and their confirmations."""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+import pytest
+
+from trollsched.compare import (
+    ConfirmationWatcher,
+    RequestIndex,
+    compare,
+    compare_batch,
+    compare_files,
+    get_most_recent,
+    get_pairs,
+    run,
+)
+
+PASSES = [("noaa20", "2024-04-03-12:00:00", "2024-04-03-12:10:00"),
+          ("metopb", "2024-04-03-13:00:00", "2024-04-03-13:12:00"),
+          ("noaa20", "2024-04-03-13:40:00", "2024-04-03-13:52:00")]
+
+
+def write_schedule(filename, passes, kind="request", extra=""):
+    """Write a request or confirmation file with *passes*."""
+    lines = ['<?xml version="1.0" encoding="utf-8"?>', "<acquisition-schedule>",
+             "<properties><type>%s</type><station>nrk</station></properties>" % kind]
+    lines.extend('<pass satellite="%s" start-time="%s" end-time="%s"%s />' % (sat, start, end, extra)
+                 for sat, start, end in passes)
+    lines.append("</acquisition-schedule>")
+    filename.write_text("\n".join(lines))
+    return os.fspath(filename)
+
+
+def write_pair(directory, name, requested, confirmed, confirmation_dir=None):
+    """Write a request in *directory* and its confirmation in *confirmation_dir*, *directory* by default."""
+    confirmation_dir = confirmation_dir or directory
+    request = write_schedule(directory / ("%s-acquisition-schedule-request-nrk.xml" % name), requested)
+    confirmation = write_schedule(confirmation_dir / ("%s-acquisition-schedule-confirmation-nrk.xml" % name),
+                                  confirmed, "confirmation")
+    return request, confirmation
+
+
+def test_confirmation_in_any_order(tmp_path):
+    """Test that the passes are matched on their satellite and times, whatever their order."""
+    request, confirmation = write_pair(tmp_path, "2024-04-03-12-00-00", PASSES, PASSES[::-1])
+    assert compare_files(request, confirmation) == []
+    assert compare(request, confirmation)
+
+
+def test_all_differences_reported(tmp_path, caplog):
+    """Test that all the differences of a pair are reported, not only the first one."""
+    request = write_schedule(tmp_path / "request.xml", PASSES)
+    confirmed = [PASSES[0], PASSES[2][:2] + ("2024-04-03-13:51:00",), PASSES[0]]
+    confirmation = write_schedule(tmp_path / "confirmation.xml", confirmed, extra=' antenna="1"')
+
+    differences = compare_files(request, confirmation)
+    assert differences == [
+        "pass confirmed more than once: noaa20 2024-04-03-12:00:00 to 2024-04-03-12:10:00",
+        "pass noaa20 2024-04-03-12:00:00 to 2024-04-03-12:10:00: attribute antenna missing from request",
+        "pass not confirmed: metopb 2024-04-03-13:00:00 to 2024-04-03-13:12:00",
+        "pass not confirmed: noaa20 2024-04-03-13:40:00 to 2024-04-03-13:52:00",
+        "pass not requested: noaa20 2024-04-03-13:40:00 to 2024-04-03-13:51:00"]
+    with caplog.at_level(logging.ERROR):
+        assert not compare(request, confirmation)
+    assert len(caplog.records) == len(differences)
+    assert compare_files(request, os.fspath(tmp_path / "missing.xml"))[0].startswith("cannot read the files")
+
+
+@pytest.mark.parametrize("value", ["*", " 1"])
+def test_attributes_compared_strictly(tmp_path, value):
+    """Test that the attributes of the passes are compared as they are written, with no wildcard."""
+    request = write_schedule(tmp_path / "request.xml", PASSES[:1], extra=' antenna="1"')
+    confirmation = write_schedule(tmp_path / "confirmation.xml", PASSES[:1], extra=' antenna="%s"' % value)
+    assert compare_files(request, confirmation) == [
+        "pass noaa20 2024-04-03-12:00:00 to 2024-04-03-12:10:00: antenna='1', antenna=%r" % value]
+@pytest.mark.parametrize("processes", [1, 2])
+def test_batch_compare(tmp_path, processes):
+    """Test comparing all the requests of a directory with their confirmations."""
+    confdir = tmp_path / "confirmations"
+    confdir.mkdir()
+    for hour in range(20):
+        write_pair(tmp_path, "2024-04-03-%02d-00-00" % hour, PASSES, PASSES[:2] if hour == 7 else PASSES, confdir)
+    os.remove(confdir / "2024-04-03-11-00-00-acquisition-schedule-confirmation-nrk.xml")
+
+    pairs = get_pairs(os.fspath(tmp_path), os.fspath(confdir))
+    assert len(pairs) == 20
+    differences = compare_batch(pairs, processes)
+    assert {os.path.basename(request)[:13]: diffs for request, diffs in differences.items()} == {
+        "2024-04-03-07": ["pass not confirmed: noaa20 2024-04-03-13:40:00 to 2024-04-03-13:52:00"],
+        "2024-04-03-11": ["no confirmation file"]}
+
+
+def test_most_recent(tmp_path, caplog):
+    """Test checking the most recent request against its confirmation."""
+    assert get_most_recent(os.fspath(tmp_path)) is None
+    old_request, _ = write_pair(tmp_path, "2024-04-03-11-00-00", PASSES, PASSES[:1])
+    os.utime(old_request, (0, 0))
+    request, _ = write_pair(tmp_path, "2024-04-03-12-00-00", PASSES, PASSES)
+    assert get_most_recent(os.fspath(tmp_path)) == request
+
+    with caplog.at_level(logging.INFO):
+        run(["-r", os.fspath(tmp_path)])
+    assert "All passes confirmed." in caplog.text
+
+
+def test_request_index(tmp_path):
+    """Test that the requests are indexed by their confirmation names, listing the directory again on misses."""
+    request, confirmation = write_pair(tmp_path, "2024-04-03-12-00-00", PASSES, PASSES)
+    index = RequestIndex(os.fspath(tmp_path))
+    assert index.get_request(confirmation) == request
+    new_request, new_confirmation = write_pair(tmp_path, "2024-04-03-13-00-00", PASSES, PASSES)
+    assert index.get_request(new_confirmation) == new_request
+    assert index.get_request(os.fspath(tmp_path / "2024-04-03-14-00-00-acquisition-schedule-confirmation-nrk.xml")) \
+        is None
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    """Get a watcher of a confirmation directory, polling it in a thread, and the queue of its checks."""
+    monkeypatch.setitem(sys.modules, "pyinotify", None)
+    confdir = tmp_path / "confirmations"
+    confdir.mkdir()
+    write_pair(tmp_path, "2024-04-03-11-00-00", PASSES, PASSES[:1], confdir)
+    watcher = ConfirmationWatcher(os.fspath(confdir), os.fspath(tmp_path), poll_interval=0.05)
+    checks = queue.Queue()
+    process = watcher.process
+    monkeypatch.setattr(watcher, "process", lambda path: checks.put((os.path.basename(path), process(path))))
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    assert watcher.ready.wait(5)
+    yield watcher, checks
+    watcher.stop()
+    thread.join()
+
+
+def test_watch_confirmations(tmp_path, watcher):
+    """Test that the new confirmations are checked against their requests as soon as they are written."""
+    watcher, checks = watcher
+    confdir = tmp_path / "confirmations"
+
+    start = time.monotonic()
+    write_pair(tmp_path, "2024-04-03-12-00-00", PASSES, PASSES, confdir)
+    assert checks.get(timeout=5) == ("2024-04-03-12-00-00-acquisition-schedule-confirmation-nrk.xml", True)
+    assert time.monotonic() - start < 1
+
+    _, confirmation = write_pair(tmp_path, "2024-04-03-13-00-00", PASSES, PASSES[:2])
+    os.rename(confirmation, confdir / os.path.basename(confirmation))
+    assert checks.get(timeout=5) == (os.path.basename(confirmation), False)
+
+    write_schedule(confdir / "2024-04-03-14-00-00-acquisition-schedule-confirmation-nrk.xml", PASSES)
+    assert checks.get(timeout=5) == ("2024-04-03-14-00-00-acquisition-schedule-confirmation-nrk.xml", None)
+    assert checks.empty()
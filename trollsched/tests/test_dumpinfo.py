@@ -0,0 +1,206 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the fetching and caching of the Aqua and Terra dump info."""
+
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from trollsched.dumpinfo import DumpInfoFetcher, DumpTable, get_report_date, parse_report
+
+URL = "ftp://ftp.example.com/schedule/%s/downlink/"
+
+REPORT_HEADER = ["header"] * 7
+
+
+def make_report(*dumps):
+    """Make the lines of a dump report."""
+    lines = list(REPORT_HEADER)
+    for station, aos, elev, los in dumps:
+        lines.append(" ".join([station, aos.strftime("%Y:%j:%H:%M:%S"), elev, los.strftime("%Y:%j:%H:%M:%S")]))
+        lines.append("")
+    lines.append("")
+    return lines
+
+
+def make_report_name(sat_name, date):
+    """Make the file name of a dump report."""
+    return date.strftime("wotis." + sat_name + ".%Y%j.%H%M%S.rpt")
+
+
+class FakeFTPServer:
+    """A stand-in for an ftp server, with files in directories."""
+
+    def __init__(self, files):
+        """Set up the server with *files*, a dict of paths to lists of lines."""
+        self.files = files
+        self.connections = []
+        self.retrieved = []
+        self.failing = set()
+        self.up = True
+        self.lock = threading.Lock()
+
+    def ftp_class(self, host, timeout=None):
+        """Open a connection to the server."""
+        if not self.up:
+            raise socket.gaierror("server down")
+        ftp = FakeFTP(self, timeout)
+        with self.lock:
+            self.connections.append(ftp)
+        return ftp
+
+
+class FakeFTP:
+    """A stand-in for an ftp connection."""
+
+    def __init__(self, server, timeout):
+        """Set up the connection."""
+        self.server = server
+        self.timeout = timeout
+        self.closed = False
+
+    def login(self, user, passwd):
+        """Log in."""
+
+    def prot_p(self):
+        """Protect the transfers."""
+
+    def dir(self, path, callback):
+        """List the directory."""
+        for filename in self.server.files:
+            dirname, name = filename.rsplit("/", 1)
+            if dirname + "/" == path:
+                callback("-rw-r--r--   1 ftp ftp  1234 Jan 01 00:00 " + name)
+
+    def retrlines(self, cmd, callback):
+        """Retrieve a file."""
+        filename = cmd.split(" ", 1)[1]
+        if filename in self.server.failing:
+            raise EOFError
+        with self.server.lock:
+            self.server.retrieved.append(filename)
+        for line in self.server.files[filename]:
+            callback(line)
+
+    def quit(self):
+        """Close the connection."""
+
+    def close(self):
+        """Close the connection."""
+        self.closed = True
+
+
+@pytest.fixture
+def report_dates():
+    """Get the dates of two recent reports."""
+    now = datetime.utcnow().replace(microsecond=0)
+    return now - timedelta(days=2), now - timedelta(days=1)
+
+
+@pytest.fixture
+def server(report_dates):
+    """Get a fake ftp server with two reports for each satellite."""
+    files = {}
+    for sat_name, station in (("aqua", "SG1"), ("terra", "AS2")):
+        for date in report_dates:
+            aos = date + timedelta(hours=3)
+            filename = "/schedule/" + sat_name + "/downlink/" + make_report_name(sat_name, date)
+            files[filename] = make_report((station, aos, "12.5", aos + timedelta(minutes=10)))
+    files["/schedule/aqua/downlink/README"] = ["nothing here"]
+    return FakeFTPServer(files)
+
+
+def test_parse_report():
+    """Test parsing a dump report."""
+    aos = datetime(2018, 12, 3, 1, 17, 53)
+    los = datetime(2018, 12, 3, 1, 28, 14)
+    dumps = parse_report(make_report(("SG2", aos, "9.2428", los), ("AS2", aos + timedelta(hours=2), "23.5", los)))
+    assert dumps[0] == {"station": "SG2", "aos": aos, "los": los, "elev": "9.2428"}
+    assert len(dumps) == 2
+
+
+def test_get_report_date():
+    """Test getting the date of a report from its name."""
+    assert get_report_date("wotis.aqua.2018337.011753.rpt") == datetime(2018, 12, 3, 1, 17, 53)
+
+
+def test_fetch_dumps(server, report_dates, tmp_path):
+    """Test fetching the dumps of both satellites."""
+    fetcher = DumpInfoFetcher(URL, cache_dir=str(tmp_path), ftp_class=server.ftp_class, max_workers=2)
+    dumps = fetcher.get_dumps("aqua")
+    assert [dump["aos"] for dump in dumps] == [date + timedelta(hours=3) for date in report_dates]
+    assert all(dump["station"] == "SG1" for dump in dumps)
+    assert len(server.retrieved) == 4
+    assert len(server.connections) <= 2
+    assert all(ftp.timeout == fetcher.timeout for ftp in server.connections)
+
+    # terra was fetched together with aqua, and the table is not refreshed before the refresh interval
+    dumps = fetcher.get_dumps("terra")
+    assert all(dump["station"] == "AS2" for dump in dumps)
+    assert len(server.retrieved) == 4
+
+
+def test_fetch_only_new_reports(server, report_dates, tmp_path):
+    """Test that the reports already in the table on disk are not downloaded again."""
+    DumpInfoFetcher(URL, cache_dir=str(tmp_path), ftp_class=server.ftp_class).refresh()
+    new_date = report_dates[1] + timedelta(hours=12)
+    new_report = "/schedule/aqua/downlink/" + make_report_name("aqua", new_date)
+    server.files[new_report] = make_report(("SG1", new_date, "45.0", new_date + timedelta(minutes=12)))
+    server.retrieved = []
+
+    fetcher = DumpInfoFetcher(URL, cache_dir=str(tmp_path), ftp_class=server.ftp_class)
+    dumps = fetcher.get_dumps("aqua")
+    assert server.retrieved == [new_report]
+    assert len(dumps) == 3
+    assert dumps[-1]["elev"] == "45.0"
+
+
+def test_fetch_offline_uses_table(server, report_dates, tmp_path):
+    """Test that the table on disk is used when the server cannot be reached."""
+    DumpInfoFetcher(URL, cache_dir=str(tmp_path), ftp_class=server.ftp_class).refresh()
+    server.up = False
+    fetcher = DumpInfoFetcher(URL, cache_dir=str(tmp_path), ftp_class=server.ftp_class)
+    assert len(fetcher.get_dumps("terra")) == 2
+
+
+def test_failed_connections_are_closed(server, report_dates, tmp_path, caplog):
+    """Test that a connection failing in a download is closed and not used again, the table being used as is."""
+    failing = "/schedule/terra/downlink/" + make_report_name("terra", report_dates[0])
+    server.failing.add(failing)
+    fetcher = DumpInfoFetcher(URL, cache_dir=str(tmp_path), ftp_class=server.ftp_class, max_workers=1)
+
+    fetcher.refresh()
+
+    assert failing not in server.retrieved
+    assert "Cannot get the dump info" in caplog.text
+    assert len(server.connections) == 2
+    assert server.connections[0].closed
+
+
+def test_table_eviction(tmp_path):
+    """Test that old reports are evicted from the table."""
+    table = DumpTable(str(tmp_path / "table.json"), ttl=timedelta(days=3))
+    now = datetime(2018, 12, 10)
+    for days in (1, 5):
+        date = now - timedelta(days=days)
+        table.add_report("aqua", make_report_name("aqua", date),
+                         [{"station": "SG1", "aos": date, "los": date + timedelta(minutes=10), "elev": "10"}])
+    table.evict(now)
+    table.save()
+    dumps = DumpTable(str(tmp_path / "table.json")).get_dumps("aqua")
+    assert [dump["aos"] for dump in dumps] == [now - timedelta(days=1)]
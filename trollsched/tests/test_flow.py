@@ -0,0 +1,122 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the minimum cost flows and the scheduling of the antennas."""
+
+from datetime import datetime, timedelta
+from itertools import combinations
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from trollsched.flow import FlowNetwork, schedule_antennas
+from trollsched.satpass import SimplePass
+from trollsched.schedule import get_best_sched_antennas
+from trollsched.tests.test_schedule import make_random_passes
+from trollsched.writers import generate_xml_requests
+
+
+def test_min_cost_flow_takes_the_cheapest_paths():
+    """Test the minimum cost flow on a small network, where the cheapest path alone is not part of the best flow."""
+    network = FlowNetwork(4)
+    network.add_arc(0, 1, 1, 0)
+    network.add_arc(0, 2, 1, 2)
+    middle = network.add_arc(1, 2, 1, -1)
+    network.add_arc(1, 3, 1, 2)
+    network.add_arc(2, 3, 1, 0)
+
+    assert network.min_cost_flow(0, 3, 3) == (2, 4)
+    assert network.get_flow(middle) == 0
+
+
+def test_min_cost_flow_rejects_backward_arcs():
+    """Test that the arcs have to follow the order of the vertices."""
+    network = FlowNetwork(2)
+    with pytest.raises(ValueError, match="follow the order"):
+        network.add_arc(1, 0, 1, 0)
+
+
+def fits(passes, antennas, delay):
+    """Check if the passes can be recorded with the antennas, ie if no more than *antennas* passes overlap."""
+    events = sorted([(overpass.risetime, 1) for overpass in passes] +
+                    [(overpass.falltime + delay, -1) for overpass in passes], key=lambda x: (x[0], x[1]))
+    busy = 0
+    for _, change in events:
+        busy += change
+        if busy > antennas:
+            return False
+    return True
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("antennas", [1, 2, 3])
+def test_schedule_antennas_is_optimal(seed, antennas):
+    """Test that the antennas get the best set of passes, each antenna recording one pass at a time."""
+    delay = timedelta(minutes=1)
+    passes = make_random_passes(11, seed, hours=4)
+    rng = np.random.default_rng(seed)
+    scores = [int(score) for score in rng.integers(1, 100, len(passes))]
+
+    schedules = schedule_antennas(passes, scores, antennas, delay)
+
+    assert len(schedules) == antennas
+    for schedule in schedules:
+        for first, second in zip(schedule[:-1], schedule[1:]):
+            assert first.falltime + delay <= second.risetime
+    scheduled = [overpass for schedule in schedules for overpass in schedule]
+    assert len(set(map(id, scheduled))) == len(scheduled)
+    score = {id(overpass): pass_score for overpass, pass_score in zip(passes, scores)}
+    best = max(sum(score[id(overpass)] for overpass in subset)
+               for size in range(len(passes) + 1)
+               for subset in combinations(passes, size) if fits(subset, antennas, delay))
+    assert sum(score[id(overpass)] for overpass in scheduled) == best
+
+
+def test_schedule_antennas_skips_passes_without_score():
+    """Test that the passes without score are never scheduled."""
+    passes = make_random_passes(5, 0, hours=4)
+    schedules = schedule_antennas(passes, [None] * 5, 2, timedelta(0))
+    assert schedules == [[], []]
+
+
+def test_get_best_sched_antennas():
+    """Test that the passes get their antenna, which ends up in the xml requests."""
+    start = datetime(2018, 12, 4, 10)
+    passes = [SimplePass("sat-%d" % i, start + timedelta(minutes=minutes), start + timedelta(minutes=minutes + 10))
+              for i, minutes in enumerate([0, 2, 4, 20])]
+    for overpass in passes:
+        overpass.uptime = overpass.risetime + timedelta(minutes=5)
+    scores = {"sat-0": 0.5, "sat-1": 0.2, "sat-2": 0.4, "sat-3": None}
+
+    def fake_area_score(overpass, area_of_interest, twilight, sun=None):
+        return None, scores[overpass.satellite.name]
+
+    with patch("trollsched.schedule.get_area_score", fake_area_score), \
+            patch("trollsched.schedule.prime_twilights"), \
+            patch("trollsched.schedule.get_twilight", return_value=(None, None)):
+        schedule = get_best_sched_antennas(passes, None, timedelta(minutes=1), 2)
+
+    assert [overpass.satellite.name for overpass in schedule] == ["sat-0", "sat-2", "sat-3"]
+    assert sorted(overpass.antenna for overpass in schedule[:2]) == [1, 2]
+    assert passes[1].antenna is None
+
+    for overpass in schedule:
+        overpass.rec = True
+    # as a pass unpickled from before the antennas were scheduled
+    del passes[3].antenna
+    root, _ = generate_xml_requests(passes, start - timedelta(minutes=1), start + timedelta(hours=1), "nrk", "SMHI")
+    antennas = {elt.get("satellite"): elt.get("antenna") for elt in root.iter("pass")}
+    assert antennas == {"sat-0": str(passes[0].antenna), "sat-2": str(passes[2].antenna), "sat-3": None}
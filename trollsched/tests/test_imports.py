@@ -0,0 +1,58 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Guard the start-up time of the command line tools against regressions."""
+
+import subprocess  # noqa: S404
+import sys
+
+import pytest
+
+HEAVY_PACKAGES = ["pyorbital", "pyresample", "matplotlib", "cartopy", "scipy", "pyproj", "shapely"]
+
+
+def get_imported_modules(statement):
+    """Run *statement* with `-X importtime` in a fresh interpreter and list the modules it imported."""
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],  # noqa: S603
+                         capture_output=True, text=True, check=True)
+    modules = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+@pytest.mark.parametrize("statement", ["import trollsched",
+                                       "import trollsched.schedule",
+                                       "import trollsched.compare",
+                                       "import trollsched.drawing"])
+def test_no_heavy_imports(statement):
+    """Test that importing the command line modules does not pull in heavy dependencies."""
+    modules = get_imported_modules(statement)
+    heavy = [name for name in modules if name.split(".")[0] in HEAVY_PACKAGES]
+    assert heavy == []
+    assert "trollsched.version" not in modules
+
+
+def test_heavy_imports_on_use():
+    """Test that the heavy dependencies are still there when needed."""
+    modules = get_imported_modules("from trollsched.areas import _parse_area_file; "
+                                   "from trollsched.satpass import Pass")
+    assert "pyorbital.orbital" in modules
+    assert "pyresample" in modules
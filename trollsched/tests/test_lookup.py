@@ -0,0 +1,77 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the lookup of the passes of the scheduler's last runs."""
+
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from trollsched.catalogue import PassCatalogue
+from trollsched.lookup import PassLookup, RemotePassLookup, get_pass_lookup, serve_passes
+from trollsched.tests.test_catalogue import START, make_pass
+
+
+@pytest.fixture
+def lookup(tmp_path):
+    """Get a lookup of a catalogue of noaa-20 passes over two stations."""
+    catalogue = PassCatalogue(tmp_path / "catalogue")
+    catalogue.add_passes("nrk", [make_pass("noaa-20", START + timedelta(hours=hour)) for hour in range(3)], START)
+    catalogue.add_passes("ska", [make_pass("noaa-20", START + timedelta(hours=1, minutes=2), rec=True)], START)
+    return PassLookup(catalogue)
+
+
+def test_get_pass_at_time(lookup):
+    """Test getting the pass of a satellite at a given time, preferring a scheduled pass."""
+    overpass = lookup.get_pass("noaa-20", START + timedelta(hours=1, minutes=5))
+    assert (overpass.station, overpass.risetime, overpass.rec) == ("ska", START + timedelta(hours=1, minutes=2), True)
+    assert lookup.get_pass("noaa-20", START + timedelta(hours=1, minutes=5), "nrk").station == "nrk"
+    assert lookup.get_pass("noaa-20", START).risetime == START
+    assert lookup.get_pass("noaa-20", START + timedelta(minutes=30)) is None
+    assert lookup.get_pass("metop-b", START) is None
+
+
+@pytest.fixture(params=["http", "unix"])
+def remote(request, lookup, tmp_path):
+    """Get a lookup of the passes of *lookup* through a server."""
+    if request.param == "unix":
+        server = serve_passes(lookup, socket_path=str(tmp_path / "lookup.sock"))
+        address = "unix://" + str(tmp_path / "lookup.sock")
+    else:
+        server = serve_passes(lookup, port=0)
+        address = "http://localhost:%d" % server.server_address[1]
+    yield get_pass_lookup(address)
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_lookup(lookup, remote):
+    """Test that a server gives the passes of the catalogue, with their boundaries."""
+    assert isinstance(remote, RemotePassLookup)
+    overpass = remote.get_pass("noaa20", START + timedelta(minutes=5), "nrk")
+    expected = lookup.get_pass("noaa20", START + timedelta(minutes=5), "nrk")
+    assert vars(overpass).keys() == vars(expected).keys()
+    assert (overpass.risetime, overpass.falltime, overpass.uptime, overpass.satellite.schedule_name) == (
+        expected.risetime, expected.falltime, expected.uptime, "noaa20")
+    np.testing.assert_allclose(overpass.boundary.contour_poly.vertices, expected.boundary.contour_poly.vertices)
+
+    assert remote.get_pass("noaa-20", START + timedelta(minutes=30)) is None
+    assert [p.risetime for p in remote.get_passes("nrk", START + timedelta(minutes=30))] == [
+        START + timedelta(hours=1), START + timedelta(hours=2)]
+    assert remote.find_pass("ska", "noaa-20", START + timedelta(hours=1, minutes=2),
+                            START + timedelta(hours=1, minutes=12)).rec
+    with pytest.raises(IOError, match="400"):
+        remote.get_pass("noaa-20", None)
@@ -0,0 +1,61 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the Prometheus metrics of the scheduler."""
+
+from urllib.request import urlopen
+
+import pytest
+
+from trollsched.metrics import generate_metrics, serve_metrics
+from trollsched.profiling import Profiler
+
+
+@pytest.fixture
+def prof():
+    """Get a profiler with a few things recorded."""
+    prof = Profiler()
+    prof.enable()
+    with prof.timer("graph_build"):
+        pass
+    prof.count("combination_cache", 3, result="hit")
+    prof.count("combination_cache", result="miss")
+    prof.gauge("graph_order", 42, station='n"rk')
+    return prof
+
+
+def test_generate_metrics(prof):
+    """Test the text exposition of the metrics."""
+    lines = generate_metrics(prof).splitlines()
+    assert "# TYPE trollsched_stage_seconds_total counter" in lines
+    assert 'trollsched_stage_calls_total{stage="graph_build"} 1.0' in lines
+    assert "# TYPE trollsched_combination_cache_total counter" in lines
+    assert 'trollsched_combination_cache_total{result="hit"} 3.0' in lines
+    assert 'trollsched_combination_cache_total{result="miss"} 1.0' in lines
+    assert "# TYPE trollsched_graph_order gauge" in lines
+    assert 'trollsched_graph_order{station="n\\"rk"} 42.0' in lines
+    assert any(line.startswith("trollsched_peak_rss_bytes ") for line in lines)
+
+
+def test_serve_metrics(prof):
+    """Test serving the metrics over http."""
+    server = serve_metrics(0, prof=prof)
+    try:
+        with urlopen("http://localhost:%d/metrics" % server.server_address[1]) as response:  # noqa: S310
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert body == generate_metrics(prof)
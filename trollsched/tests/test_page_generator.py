@@ -0,0 +1,165 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the generation of the schedule pages."""
+
+import os
+import queue
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import defusedxml.ElementTree as ET
+import pytest
+
+from trollsched.catalogue import PassCatalogue
+from trollsched.drawing import get_fig_filename
+from trollsched.lookup import PassLookup
+from trollsched.page_generator import PageGenerator, process_request
+from trollsched.profiling import profiler
+from trollsched.tests.test_catalogue import START, make_pass
+
+TIME_FORMAT = "%Y-%m-%d-%H:%M:%S"
+
+
+def fake_render(job, plotdir):
+    """Write an empty plot for *job*, as the plot of the pass would be named."""
+    sat_name = job.platform_name if job.values is None else job.values["satellite"]
+    name = get_fig_filename(sat_name, job.instrument, job.risetime, job.falltime)
+    filename = os.path.join(plotdir, name)
+    with open(filename, "w") as fd:
+        fd.write(str(os.getpid()))
+    return filename
+
+
+class LocalPublisher:
+    """Stand in for a posttroll publisher and subscriber, with messages carrying the uri of request files."""
+
+    def __init__(self):
+        """Initialize the publisher."""
+        self.messages = queue.Queue()
+
+    def send(self, uri):
+        """Publish a message for *uri*."""
+        self.messages.put(SimpleNamespace(data={"uri": uri}))
+
+    def close(self):
+        """Stop publishing."""
+        self.messages.put(StopIteration)
+
+    def recv(self, timeout=0.05):
+        """Receive the messages, None when there was none during *timeout*, as posttroll's subscribers do."""
+        while True:
+            try:
+                message = self.messages.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+                continue
+            if message is StopIteration:
+                return
+            yield message
+
+
+def write_request(filename, station="nrk", hours=(0, 1, 2)):
+    """Write a schedule request of noaa-20 passes over *station*."""
+    passes = "".join('<pass satellite="noaa20" start-time="%s" end-time="%s" />' % (
+        (START + timedelta(hours=hour)).strftime(TIME_FORMAT),
+        (START + timedelta(hours=hour, minutes=10)).strftime(TIME_FORMAT)) for hour in hours)
+    filename.write_text('<?xml version="1.0" encoding="utf-8"?>\n<acquisition-schedule><properties><station>%s'
+                        "</station></properties>%s</acquisition-schedule>" % (station, passes))
+    return filename
+
+
+@pytest.fixture
+def profiling():
+    """Enable the profiler."""
+    profiler.reset()
+    profiler.enable()
+    yield profiler
+    profiler.disable()
+    profiler.reset()
+
+
+def test_process_request_skips_existing_plots(tmp_path, profiling):
+    """Test that a page links the plots of its passes, rendering those which don't exist yet."""
+    catalogue = PassCatalogue(tmp_path / "catalogue")
+    catalogue.add_passes("nrk", [make_pass("noaa-20", START)], START)
+    request = write_request(tmp_path / "request.xml")
+    page = tmp_path / "page.xml"
+    plotdir = tmp_path / "plots"
+    plotdir.mkdir()
+    existing = plotdir / get_fig_filename("NOAA-20", "viirs", START + timedelta(hours=1),
+                                          START + timedelta(hours=1, minutes=10))
+    existing.write_text("old")
+
+    process_request(request, os.fspath(plotdir), page, lookup=PassLookup(catalogue), render=fake_render)
+
+    stylesheet = "<?xml-stylesheet type='text/xsl' href='reqreader.xsl'?>"
+    lines = page.read_text().splitlines()
+    assert lines[1].startswith(stylesheet)
+    plots = [child.get("img") for child in ET.fromstring(lines[1][len(stylesheet):]).iter("pass")]
+    assert plots == [os.fspath(plotdir / name) for name in ["20240403120000_noaa-20_avhrr_20240403121000.png",
+                                                            existing.name,
+                                                            "20240403140000_NOAA-20_viirs_20240403141000.png"]]
+    assert existing.read_text() == "old"
+    assert profiler.get_count("page_plots", result="rendered") == 2
+    assert profiler.get_count("page_plots", result="skipped") == 1
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_generator_coalesces_bursts(tmp_path, profiling, processes):
+    """Test that the messages for the same request in a burst make one page, rendered in a process pool."""
+    first = write_request(tmp_path / "first.xml", hours=(0,))
+    second = write_request(tmp_path / "second.xml", hours=(1, 2, 3))
+    plotdir = tmp_path / "plots"
+    plotdir.mkdir()
+    generator = PageGenerator(os.fspath(plotdir), tmp_path / "page.xml", processes=processes, queue_size=2,
+                              delay=0.5, render=fake_render)
+    publisher = LocalPublisher()
+    for filename in [first, second, first, second]:
+        publisher.send("file://" + os.fspath(filename))
+    publisher.close()
+
+    generator.run(publisher.recv())
+
+    assert list(generator.job_registry) == [os.fspath(first), os.fspath(second)]
+    assert profiler.get_count("page_requests", result="processed") == 2
+    assert profiler.get_count("page_requests", result="coalesced") == 2
+    assert len(os.listdir(plotdir)) == 4
+    pids = {(plotdir / name).read_text() for name in os.listdir(plotdir)}
+    assert (str(os.getpid()) in pids) == (processes == 1)
+    assert "20240403150000" in (tmp_path / "page.xml").read_text()
+
+
+def test_generator_caps_bursts(tmp_path, profiling):
+    """Test that steady traffic doesn't hold back the pages, the bursts being capped in time and size."""
+    requests = [write_request(tmp_path / ("request%d.xml" % number), hours=(number,)) for number in range(8)]
+    plotdir = tmp_path / "plots"
+    plotdir.mkdir()
+    generator = PageGenerator(os.fspath(plotdir), tmp_path / "page.xml", processes=1, delay=0.5, max_wait=0.5,
+                              max_burst=3, render=fake_render)
+    generator.start()
+    try:
+        for filename in requests[:5]:
+            generator.submit(SimpleNamespace(data={"uri": "file://" + os.fspath(filename)}))
+            time.sleep(0.3)
+        assert profiler.get_count("page_requests", result="processed") >= 2
+
+        for filename in requests[5:]:
+            generator.submit(SimpleNamespace(data={"uri": "file://" + os.fspath(filename)}))
+    finally:
+        generator.stop()
+    assert list(generator.job_registry) == [os.fspath(filename) for filename in requests[3:]]
+    assert profiler.get_count("page_requests", result="processed") == 8
@@ -0,0 +1,62 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the profiling of schedule runs."""
+
+import csv
+
+from trollsched.profiling import Profiler
+
+
+def test_disabled_profiler_records_nothing():
+    """Test that nothing is recorded until the profiler is enabled."""
+    profiler = Profiler()
+    with profiler.timer("graph_build"):
+        pass
+    profiler.count("combination_cache", result="hit")
+    assert profiler.report() == []
+
+
+def test_timers_and_counters():
+    """Test timing stages and counting."""
+    profiler = Profiler()
+    profiler.enable()
+    for satellite in ("noaa 19", "noaa 19", "metop-b"):
+        with profiler.timer("pass_prediction", satellite=satellite):
+            pass
+    profiler.count("combination_cache", result="hit")
+    profiler.count("combination_cache", 3, result="miss")
+
+    report = profiler.report()
+    assert [(record["name"], record["labels"], record["calls"]) for record in report if record["kind"] == "timer"] == [
+        ("pass_prediction", {"satellite": "metop-b"}, 1), ("pass_prediction", {"satellite": "noaa 19"}, 2)]
+    assert profiler.get_count("combination_cache") == 4
+    assert profiler.get_count("combination_cache", result="miss") == 3
+    assert profiler.get_total("pass_prediction") >= 0
+
+
+def test_write_csv_report(tmp_path):
+    """Test writing the report as csv."""
+    profiler = Profiler()
+    profiler.enable()
+    with profiler.timer("writer", writer="xml", station="nrk"):
+        pass
+    filename = str(tmp_path / "report.csv")
+    profiler.write_report(filename)
+    with open(filename) as fd_:
+        rows = list(csv.DictReader(fd_))
+    assert rows[0]["name"] == "writer"
+    assert rows[0]["labels"] == "station=nrk;writer=xml"
+    assert rows[0]["calls"] == "1"
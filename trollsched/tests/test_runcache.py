@@ -0,0 +1,200 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the cache of the schedule runs."""
+
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from pyorbital import orbital
+from pyresample import create_area_def
+
+from trollsched.runcache import RunCache, dump_run, get_run_key, load_run
+from trollsched.satpass import Pass
+from trollsched.schedule import Satellite, parse_args, run
+from trollsched.tests.test_schedule import write_config
+from trollsched.utils import read_config
+
+START = "2024-04-03T12:00:00"
+
+
+def get_key(config_file, tle_file, *args):
+    """Get the run key of a config and command line."""
+    opts = parse_args(["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file), "-s", START, *args])
+    return get_run_key(read_config(opts.config), opts, opts.start_time, opts.tle)
+
+
+def test_run_key(tmp_path):
+    """Test that the run key only changes with what the schedule depends on."""
+    config_file, tle_file, _ = write_config(tmp_path)
+    key = get_key(config_file, tle_file)
+
+    assert get_key(config_file, tle_file) == key
+    assert get_key(config_file, tle_file, "-o", os.fspath(tmp_path / "elsewhere"), "-r") == key
+    assert get_key(config_file, tle_file, "-d", "120") != key
+    assert get_key(config_file, tle_file, "--solver", "dp") != key
+
+    with open(config_file) as fd:
+        config = fd.read()
+    with open(config_file, "w") as fd:
+        fd.write(config.replace("day: 0.9", "day: 0.8"))
+    assert get_key(config_file, tle_file) != key
+
+
+def test_run_key_changes_with_tle(tmp_path):
+    """Test that the run key changes with the TLE lines of the scheduled satellites only."""
+    config_file, tle_file, _ = write_config(tmp_path)
+    key = get_key(config_file, tle_file)
+
+    with open(tle_file, "a") as fd:
+        fd.write("METOP-B\n"
+                 "1 38771U 12049A   24093.50000000  .00000100  00000+0  66000-4 0  9991\n"
+                 "2 38771  98.6900 150.0000 0001000  90.0000 270.0000 14.21500000600004\n")
+    assert get_key(config_file, tle_file) == key
+
+    with open(tle_file) as fd:
+        tle = fd.read()
+    with open(tle_file, "w") as fd:
+        # A later epoch, with the same checksum
+        fd.write(tle.replace("24093.57357837", "24093.57357846"))
+    assert get_key(config_file, tle_file) != key
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Test that the cache keeps its most recently used entries."""
+    cache = RunCache(tmp_path, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    os.utime(tmp_path / "a.json", ns=(0, 0))
+    os.utime(tmp_path / "b.json", ns=(1, 1))
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cache_size_limit(tmp_path):
+    """Test that the cache doesn't grow over its size limit."""
+    cache = RunCache(tmp_path, max_bytes=1000)
+    cache.put("a", "x" * 600)
+    os.utime(tmp_path / "a.json", ns=(0, 0))
+    cache.put("b", "y" * 600)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 600
+
+
+def test_cache_ignores_corrupt_entries(tmp_path):
+    """Test that a corrupt entry is a miss."""
+    with open(tmp_path / "a.json", "wb") as fd:
+        fd.write(b"garbage")
+    assert RunCache(tmp_path).get("a") is None
+
+
+def test_run_entry_round_trip(tmp_path):
+    """Test that the passes of a run are stored as json, with their orbitals and boundaries."""
+    satellite = Satellite("noaa-20", 0.9, 0.4, schedule_name="noaa20")
+    risetime = datetime(2024, 4, 3, 12, 30)
+    tle = ["1 43013U 17073A   24093.57357837  .00000145  00000+0  86604-4 0  9999",
+           "2 43013  98.7039  32.7741 0007542 324.8026  35.2652 14.21254587330172"]
+    orb = orbital.Orbital("noaa-20", line1=tle[0], line2=tle[1])
+    passes = [Pass(satellite, risetime + timedelta(hours=hours), risetime + timedelta(hours=hours, minutes=12),
+                   orb=orb, instrument="viirs") for hours in (0, 2)]
+    passes[0].rec = True
+    passes[0].antenna = 2
+    passes[1].max_elev = np.float32(12.5)
+    area = create_area_def("euron1", {"proj": "stere", "lat_0": 90, "lon_0": 14}, width=10, height=10,
+                           area_extent=[-1000000.0, -4500000.0, 2072000.0, -1428000.0])
+    passes[0].score = {area: (object(), np.float64(0.25))}
+    vertices = passes[0].boundary.contour_poly.vertices
+    entry = {"passes": {"nrk": passes}, "rec": {"nrk": [True, False]}, "comb_rec": None}
+
+    cache = RunCache(tmp_path)
+    cache.put("a", dump_run(entry))
+    with open(tmp_path / "a.json") as fd:
+        assert json.load(fd)["passes"]["nrk"][0]["orbital"] == ["NOAA-20", *tle]
+    loaded = load_run(cache.get("a"), [satellite], [area])
+
+    first, second = loaded["passes"]["nrk"]
+    assert loaded["rec"] == entry["rec"]
+    assert first.satellite is satellite
+    assert (first.risetime, first.falltime, first.uptime) == (passes[0].risetime, passes[0].falltime,
+                                                              passes[0].uptime)
+    assert (first.rec, first.antenna, first.instrument) == (True, 2, "viirs")
+    assert first.pass_key == passes[0].pass_key
+    assert first.orb is second.orb
+    np.testing.assert_allclose(first.boundary.contour_poly.vertices, vertices)
+    assert first.score == {area: (None, 0.25)}
+    assert second.max_elev == 12.5
+    assert second._boundary is None
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Use a cache directory of its own."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(cache_dir))
+    return cache_dir
+
+
+def strip_request_time(schedule):
+    """Remove the time the schedule was written at."""
+    return re.sub("<requested-on>[^<]*</requested-on>", "", schedule)
+
+
+def test_rerun_writes_missing_files_from_cache(tmp_path, cache_dir):
+    """Test that running again gets the schedule from the cache, and only writes the missing files."""
+    config_file, tle_file, sched_file = write_config(tmp_path)
+    args = ["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file), "-s", START]
+    run(args)
+    with open(sched_file) as fd:
+        schedule = fd.read()
+    os.remove(sched_file)
+
+    with patch("trollsched.schedule.compute_schedules", side_effect=AssertionError("computed again")):
+        run(args)
+    with open(sched_file) as fd:
+        rerun_schedule = fd.read()
+    assert strip_request_time(rerun_schedule) == strip_request_time(schedule)
+
+    mtime = os.stat(sched_file).st_mtime_ns
+    with patch("trollsched.schedule.compute_schedules", side_effect=AssertionError("computed again")):
+        run(args)
+    assert os.stat(sched_file).st_mtime_ns == mtime
+
+
+def test_force_recompute(tmp_path, cache_dir):
+    """Test that the schedule is computed again when asked for."""
+    config_file, tle_file, _ = write_config(tmp_path)
+    args = ["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file), "-s", START]
+    run(args)
+
+    with patch("trollsched.schedule.compute_schedules", side_effect=RuntimeError("computed again")):
+        with pytest.raises(RuntimeError):
+            run(args + ["--force-recompute"])
+
+
+def test_runs_without_start_time_are_not_cached(tmp_path, cache_dir):
+    """Test that runs starting now are not cached, as they never run again."""
+    config_file, tle_file, _ = write_config(tmp_path)
+    run(["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file)])
+    assert not (cache_dir / "runs").exists()
@@ -348,6 +348,35 @@ class TestSwathBoundary:
         cov = mypass.area_coverage(self.euron1)
         assert cov == pytest.approx(0.786836, 1e-5)
 
+    def test_swath_coverage_simplified(self):
+        """Test that simplifying the swath boundary drops points but barely changes the coverage."""
+        tstart = datetime.strptime("2019-01-05T01:01:45", "%Y-%m-%dT%H:%M:%S")
+        tend = tstart + timedelta(seconds=60*15.5)
+
+        tle1 = "1 43010U 17072A   18363.54078832 -.00000045  00000-0 -79715-6 0  9999"
+        tle2 = "2 43010  98.6971 300.6571 0001567 143.5989 216.5282 14.19710974 58158"
+
+        mypass = Pass("FENGYUN 3D", tstart, tend, instrument="mersi2", tle1=tle1, tle2=tle2, frequency=100)
+        simplified = Pass("FENGYUN 3D", tstart, tend, instrument="mersi2", tle1=tle1, tle2=tle2, frequency=100,
+                          simplify_tolerance=5)
+        lons, lats = mypass.boundary.contour()
+        simple_lons, simple_lats = simplified.boundary.contour()
+        assert len(simple_lons) < len(lons) / 2
+        assert simple_lons[0] == lons[0]
+        assert simplified.area_coverage(self.euron1) == pytest.approx(mypass.area_coverage(self.euron1), abs=5e-3)
+
+    def test_batch_area_coverage(self):
+        """Test getting the coverages of several passes at once."""
+        from trollsched.satpass import batch_area_coverage
+
+        passes = [Pass("NOAA-19", datetime(2018, 10, 16, 3, 54, 13), datetime(2018, 10, 16, 3, 55, 13),
+                       orb=self.n19orb, instrument="avhrr"),
+                  Pass("NOAA-19", datetime(2018, 10, 16, 4, 0), datetime(2018, 10, 16, 4, 1),
+                       orb=self.n19orb, instrument="avhrr")]
+        coverage = batch_area_coverage(passes, self.euron1)
+        assert coverage[0] == 0
+        assert coverage[1] == pytest.approx(0.103526, 1e-5)
+
     def test_arctic_is_not_antarctic(self):
         """Test that artic and antarctic are not mixed up."""
         tstart = datetime(2021, 2, 3, 16, 28, 3)
@@ -414,3 +443,76 @@ class TestPassList:
     def tearDown(self):
         """Clean up."""
         pass
+
+
+def test_pass_interval_index():
+    """Test finding overlapping passes with the interval index, against the brute force overlap check."""
+    from trollsched.satpass import PassIntervalIndex, SimplePass
+
+    start = datetime(2018, 11, 28, 10, 0)
+    rng = np.random.default_rng(12)
+    passes = [SimplePass("aqua", start + timedelta(minutes=int(rise)), start + timedelta(minutes=int(rise + length)))
+              for rise, length in zip(rng.integers(0, 600, 50), rng.integers(2, 40, 50))]
+    others = [SimplePass("terra", start + timedelta(minutes=int(rise)), start + timedelta(minutes=int(rise + 15)))
+              for rise in range(-60, 660, 7)]
+    index = PassIntervalIndex(passes)
+    for delay in (None, timedelta(minutes=40)):
+        for other in others:
+            expected = [i for i, overpass in enumerate(passes) if overpass.overlaps(other, delay)]
+            assert index.overlapping(other, delay) == expected
+
+
+def test_pass_key():
+    """Test the identity key of passes, shared by the passes of one orbit seen from different stations."""
+    tle1 = "1 43010U 17072A   18363.54078832 -.00000045  00000-0 -79715-6 0  9999"
+    tle2 = "2 43010  98.6971 300.6571 0001567 143.5989 216.5282 14.19710974 58158"
+    tstart = datetime(2019, 1, 5, 1, 1, 45)
+    pass1 = Pass("FENGYUN 3D", tstart, tstart + timedelta(minutes=15), instrument="mersi-2", tle1=tle1, tle2=tle2)
+    pass2 = Pass("FENGYUN 3D", tstart + timedelta(minutes=2), tstart + timedelta(minutes=14),
+                 orb=pass1.orb, instrument="mersi-2")
+    pass3 = Pass("FENGYUN 3D", tstart + timedelta(minutes=101), tstart + timedelta(minutes=115),
+                 orb=pass1.orb, instrument="mersi-2")
+
+    assert pass1.pass_key == ("FENGYUN 3D", 5907)
+    assert pass1 == pass2
+    assert hash(pass1) == hash(pass2)
+    assert pass1 != pass3
+    assert len({pass1, pass2, pass3}) == 2
+
+    pass3.risetime = tstart + timedelta(minutes=1)
+    assert pass3.pass_key == pass1.pass_key
+
+
+def test_avoid_index():
+    """Test that the avoid index finds the same passes as looking for them in a list of passes to avoid."""
+    from trollsched.satpass import AvoidIndex, SimplePass
+
+    start = datetime(2018, 11, 28, 10, 0)
+    rng = np.random.default_rng(7)
+
+    def random_passes(count):
+        return [SimplePass(str(sat), start + timedelta(minutes=int(rise)),
+                           start + timedelta(minutes=int(rise + length)))
+                for sat, rise, length in zip(rng.choice(["noaa 19", "metop-b", "aqua"], count),
+                                             rng.integers(0, 2000, count), rng.integers(0, 60, count))]
+
+    avoid_list = random_passes(80)
+    passes = random_passes(300) + avoid_list[:10]
+    index = AvoidIndex(avoid_list)
+    assert len(index) == 80
+    assert [overpass in index for overpass in passes] == [overpass in avoid_list for overpass in passes]
+    assert any(overpass in index for overpass in passes[:300])
+    assert SimplePass("noaa 20", start, start + timedelta(hours=40)) not in index
+
+
+def test_simple_pass_hashing():
+    """Test that overlapping simple passes, equal but not transitively so, are hashed by identity."""
+    from trollsched.satpass import SimplePass
+
+    tstart = datetime(2019, 1, 5, 1, 0)
+    passa, passb, passc = [SimplePass("noaa-20", tstart + timedelta(minutes=minutes),
+                                      tstart + timedelta(minutes=minutes + 10)) for minutes in (0, 8, 16)]
+    assert passa == passb
+    assert passb == passc
+    assert passa != passc
+    assert len({passa, passb, passc}) == len({passb, passa, passc}) == 3
@@ -27,11 +27,27 @@ import tempfile
 from datetime import datetime, timedelta
 from unittest.mock import patch
 
+import numpy as np
 import pytest
 import yaml
 
 from trollsched.satpass import get_aqua_terra_dumps, get_metopa_passes, get_next_passes
-from trollsched.schedule import build_filename, conflicting_passes, fermia, fermib, run
+from trollsched.schedule import (
+    build_filename,
+    conflicting_passes,
+    fermia,
+    fermib,
+    get_best_sched,
+    get_best_sched_dp,
+    iter_best_sched,
+    run,
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the run cache and the pass catalogue of the test runs in their temporary directory."""
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(tmp_path / "cache"))
 
 
 class TestTools:
@@ -53,6 +69,56 @@ class TestTools:
         assert len(conflicting_passes(passes, timedelta(seconds=60))) == 1
 
 
+def make_random_passes(number, seed, hours=48):
+    """Make random simple passes of four satellites over *hours*, with uptimes."""
+    from trollsched.satpass import SimplePass
+
+    rng = np.random.default_rng(seed)
+    start = datetime(2018, 12, 4)
+    passes = []
+    for _ in range(number):
+        risetime = start + timedelta(minutes=int(rng.integers(0, hours * 60)))
+        overpass = SimplePass(str(rng.choice(["noaa-20", "metop-b", "aqua", "terra"])), risetime,
+                              risetime + timedelta(minutes=int(rng.integers(5, 16))))
+        overpass.uptime = risetime + (overpass.falltime - risetime) / 2
+        passes.append(overpass)
+    return passes
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_streaming_solver_matches_graph_solver(seed):
+    """Test that the streaming solver finds the same schedule as the graph solver, ties included."""
+    passes = make_random_passes(60, seed)
+
+    def fake_combine(p1, p2, area_of_interest):
+        # few distinct weights, to have ties
+        return float((p1.risetime.minute * 7 + p2.falltime.minute * 3) % 5)
+
+    with patch("trollsched.schedule.combine", fake_combine):
+        schedule, _ = get_best_sched(passes, None, timedelta(seconds=60))
+        segments = list(iter_best_sched(passes, None, timedelta(seconds=60)))
+
+    assert len(segments) > 1
+    streamed = [overpass for segment in segments for overpass in segment]
+    assert [id(overpass) for overpass in streamed] == [id(overpass) for overpass in schedule[::-1]]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("delay", [0, 60])
+def test_dp_solver_matches_graph_solver(seed, delay):
+    """Test that the dp solver finds the same schedule as the graph solver, ties included."""
+    passes = make_random_passes(60, seed)
+
+    def fake_combine(p1, p2, area_of_interest):
+        return float((p1.risetime.minute * 7 + p2.falltime.minute * 3) % 5 - 1)
+
+    with patch("trollsched.schedule.combine", fake_combine):
+        schedule, _ = get_best_sched(passes, None, timedelta(seconds=delay))
+        dp_schedule = get_best_sched_dp(passes, None, timedelta(seconds=delay))
+
+    assert [id(overpass) for overpass in dp_schedule] == [id(overpass) for overpass in schedule[::-1]]
+
+
 class TestUtils:
     """Test class for utilities."""
 
@@ -333,13 +399,12 @@ euron1 = """euron1:
 
 
 
-def test_pyorbitals_platform_name(tmp_path):
-    """Test that using pyorbital's platform name allows spurious names in the TLE data."""
+def write_config(tmp_path, tle=None):
+    """Write a config file for one station, with its area and tle files, to *tmp_path*."""
     spurious_tle = ("NOAA 20 (JPSS-1)\n"
                     "1 43013U 17073A   24093.57357837  .00000145  00000+0  86604-4 0  9999\n"
                     "2 43013  98.7039  32.7741 0007542 324.8026  35.2652 14.21254587330172\n")
 
-
     config_file = tmp_path / "config.yaml"
     tle_file = tmp_path / "test.tle"
     area_file = tmp_path / "areas.yaml"
@@ -349,8 +414,7 @@ def test_pyorbitals_platform_name(tmp_path):
         fd.write(euron1)
 
     with open(tle_file, "w") as fd:
-        fd.write(spurious_tle)
-
+        fd.write(tle or spurious_tle)
 
     config = dict(default=dict(station=["nrk"],
                                forward=12,
@@ -367,13 +431,79 @@ def test_pyorbitals_platform_name(tmp_path):
                   pattern=dict(dir_output=os.fspath(tmp_path),
                                file_xml=os.fspath(sched_file)),
                   satellites={"noaa-20": dict(schedule_name="noaa20",
-                                                       international_designator="43013",
-                                                       night=0.4,
-                                                       day=0.9)}
-                   )
+                                              international_designator="43013",
+                                              night=0.4,
+                                              day=0.9)}
+                  )
 
     with open(config_file, "w") as fd:
         fd.write(yaml.dump(config))
+    return config_file, tle_file, sched_file
+
+
+@pytest.mark.parametrize("solver", ["lagrangian", "lagrange"])
+def test_combined_solver_config(tmp_path, solver):
+    """Test that the combined solver of the config is checked."""
+    from trollsched.utils import read_config
+
+    config_file, _, _ = write_config(tmp_path)
+    config = yaml.safe_load(config_file.read_text())
+    config["default"]["combined_solver"] = solver
+    config_file.write_text(yaml.dump(config))
+    if solver == "lagrangian":
+        assert read_config(os.fspath(config_file)).combined_solver == "lagrangian"
+    else:
+        with pytest.raises(ValueError, match="lagrange"):
+            read_config(os.fspath(config_file))
+
+
+def test_pyorbitals_platform_name(tmp_path):
+    """Test that using pyorbital's platform name allows spurious names in the TLE data."""
+    config_file, tle_file, sched_file = write_config(tmp_path)
 
     run(["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file)])
     assert sched_file in tmp_path.iterdir()
+
+
+def test_profile_report(tmp_path):
+    """Test that a run writes a timing report of its stages."""
+    import json
+
+    from trollsched.profiling import profiler
+
+    config_file, tle_file, sched_file = write_config(tmp_path)
+    report_file = tmp_path / "profile.json"
+    try:
+        run(["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file),
+             "--profile", os.fspath(report_file), "--profiler", "cprofile"])
+    finally:
+        profiler.disable()
+        profiler.reset()
+
+    with open(report_file) as fd:
+        report = json.load(fd)
+    stages = {record["name"] for record in report if record["kind"] == "timer"}
+    assert {"tle_load", "pass_prediction", "area_boundary", "conflict_grouping", "clique_enumeration",
+            "graph_build", "longest_path"} <= stages
+    assert {"name": "writer", "labels": {"station": "nrk", "writer": "xml"}} in [
+        {"name": record["name"], "labels": record["labels"]} for record in report]
+    assert (tmp_path / "profile.nrk.prof").exists()
+
+
+def test_metrics_file(tmp_path):
+    """Test that a run writes its metrics next to the outputs."""
+    from trollsched.profiling import profiler
+
+    config_file, tle_file, sched_file = write_config(tmp_path)
+    try:
+        run(["-c", os.fspath(config_file), "-x", "-t", os.fspath(tle_file), "--metrics"])
+    finally:
+        profiler.disable()
+        profiler.reset()
+
+    with open(tmp_path / "trollsched.prom") as fd:
+        metrics = fd.read()
+    assert 'trollsched_graph_order{station="nrk"}' in metrics
+    assert 'trollsched_output_file_bytes{file="mysched.xml",station="nrk"}' in metrics
+    assert 'trollsched_passes_predicted_total{satellite="noaa-20"}' in metrics
+    assert 'trollsched_stage_seconds_total{stage="longest_path"}' in metrics
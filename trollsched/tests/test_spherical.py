@@ -0,0 +1,160 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the spherical functions."""
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+from trollsched.spherical import (
+    BoundingCap,
+    SphPolygon,
+    clip_areas,
+    day_night_sides,
+    get_areas,
+    get_bounding_cap,
+    get_sun_vectors,
+    get_twilight_poly,
+    get_twilight_polys,
+    intersection,
+)
+
+
+def make_box(lon_min, lat_min, lon_max, lat_max):
+    """Make a lon/lat box polygon, in degrees, with its vertices clockwise."""
+    return SphPolygon(np.deg2rad(np.array([[lon_min, lat_min], [lon_min, lat_max],
+                                           [lon_max, lat_max], [lon_max, lat_min]])))
+
+
+def test_bounding_cap():
+    """Test that the cap holds the polygon and its box."""
+    cap = get_bounding_cap(make_box(-10, 50, 30, 70))
+    assert np.rad2deg(cap.lat_min) < 50 < 70 < np.rad2deg(cap.lat_max)
+    assert np.rad2deg(cap.lon_half_width) > 20
+    assert get_bounding_cap(make_box(-10, 50, 30, 70)).radius == cap.radius
+    assert BoundingCap(np.array([0., 0., 1.]), 0.2).lon_half_width == np.pi
+
+
+def test_no_bounding_cap_for_large_polygons():
+    """Test that polygons larger than a hemisphere have no cap."""
+    assert get_bounding_cap(get_twilight_poly(datetime(2018, 12, 4, 12))) is None
+    box = make_box(-10, 50, 30, 70)
+    complement = SphPolygon(box.vertices[::-1])
+    assert get_bounding_cap(complement) is None
+
+
+def test_intersection_prefilter():
+    """Test that disjoint polygons are rejected before intersecting them."""
+    europe = make_box(-10, 50, 30, 70)
+    pacific = make_box(-170, -20, -140, 10)
+    with mock.patch.object(SphPolygon, "intersection") as exact:
+        assert intersection(europe, pacific) is None
+    exact.assert_not_called()
+
+    # across the antimeridian
+    assert intersection(make_box(170, -10, -170, 10), make_box(175, -5, -175, 5)) is not None
+
+
+def test_intersection_prefilter_is_exact():
+    """Test that the prefilter rejects only pairs that do not intersect."""
+    rng = np.random.default_rng(42)
+    for _ in range(100):
+        lon, lat = rng.uniform(-180, 180), rng.uniform(-80, 45)
+        width, height = rng.uniform(1, 40, 2)
+        first = make_box(lon, lat, lon + width, lat + height)
+        lon, lat = rng.uniform(-180, 180), rng.uniform(-80, 45)
+        width, height = rng.uniform(1, 40, 2)
+        second = make_box(lon, lat, lon + width, lat + height)
+        prefiltered = intersection(first, second)
+        exact = first.intersection(second)
+        assert (prefiltered is None) == (exact is None)
+
+
+def make_random_boxes(number, seed=42):
+    """Make random lon/lat boxes over Europe."""
+    rng = np.random.default_rng(seed)
+    boxes = []
+    for _ in range(number):
+        lon, lat = rng.uniform(-40, 60), rng.uniform(30, 45)
+        width, height = rng.uniform(1, 40, 2)
+        boxes.append(make_box(lon, lat, lon + width, lat + height))
+    return boxes
+
+
+def get_exact_areas(polygons, clip):
+    """Get the areas of the intersections, one by one."""
+    areas = []
+    for poly in polygons:
+        inter = poly.intersection(clip)
+        areas.append(0 if inter is None else inter.area())
+    return np.array(areas)
+
+
+def test_clip_areas_convex():
+    """Test clipping polygons with a convex polygon."""
+    boxes = make_random_boxes(30)
+    clip = make_box(-10, 50, 30, 70)
+    np.testing.assert_allclose(clip_areas(boxes, clip), get_exact_areas(boxes, clip), atol=1e-12)
+    np.testing.assert_allclose(clip_areas([clip], clip), clip.area())
+    # a polygon inside the clip polygon
+    np.testing.assert_allclose(clip_areas([make_box(0, 55, 10, 65)], clip), make_box(0, 55, 10, 65).area())
+
+
+def test_clip_areas_not_convex():
+    """Test clipping polygons with an area boundary, which is not convex."""
+    from pyresample.geometry import AreaDefinition
+
+    euron1 = AreaDefinition("euron1", "Northern Europe - 1km", "euron1",
+                            {"proj": "stere", "ellps": "WGS84", "lat_0": 90.0, "lon_0": 0.0, "lat_ts": 60.0},
+                            3072, 3072, (-1000000.0, -4500000.0, 2072000.0, -1428000.0))
+    clip = euron1.boundary(8).contour_poly
+    boxes = make_random_boxes(30)
+    np.testing.assert_allclose(clip_areas(boxes, clip), get_exact_areas(boxes, clip), atol=1e-12)
+
+
+def test_clip_areas_day_and_night():
+    """Test splitting the areas of polygons in day and night."""
+    boxes = make_random_boxes(30)
+    twilight = get_twilight_poly(datetime(2018, 12, 4, 12))
+    day = clip_areas(boxes, twilight)
+    np.testing.assert_allclose(day, get_exact_areas(boxes, twilight), atol=1e-12)
+    twilight.invert()
+    np.testing.assert_allclose(day + clip_areas(boxes, twilight), get_areas(boxes))
+
+    clip = make_box(-10, 50, 30, 70)
+    day_in_clip = clip_areas(boxes, clip, twilight)
+    assert np.all(day_in_clip <= clip_areas(boxes, clip) + 1e-15)
+
+
+def test_twilight_polys():
+    """Test getting the twilight polygons of many times at once."""
+    times = [datetime(2018, 12, 4) + timedelta(hours=5 * i) for i in range(10)]
+    for poly, utctime in zip(get_twilight_polys(times), times):
+        np.testing.assert_array_equal(poly.vertices, get_twilight_poly(utctime).vertices)
+
+
+def test_day_night_sides():
+    """Test telling day from night from the vertices of the polygons."""
+    utctime = datetime(2018, 3, 20, 12)
+    sun = get_sun_vectors([utctime])[0]
+    assert sun[0] > 0.99
+    boxes = [make_box(-10, 50, 30, 70), make_box(170, -10, -170, 10), make_box(80, -10, 100, 10)]
+    np.testing.assert_array_equal(day_night_sides(boxes, sun), [1, -1, 0])
+
+    twilight = get_twilight_poly(utctime)
+    day = clip_areas(boxes, twilight)
+    np.testing.assert_allclose(day[:2], [boxes[0].area(), 0], atol=1e-12)
@@ -0,0 +1,84 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the sweeps of the scheduling parameters."""
+
+import csv
+import os
+import re
+
+import pytest
+
+from trollsched.schedule import parse_args, run
+from trollsched.sweep import SWEEP_FILENAME, get_configurations, read_grid
+from trollsched.tests.test_schedule import write_config
+
+START = "2024-04-03T12:00:00"
+
+
+def test_read_grid(tmp_path):
+    """Test reading a grid of parameter values, single values being lists of one."""
+    grid_file = tmp_path / "grid.yaml"
+    grid_file.write_text("satellites:\n  noaa-20:\n    day: [0.9, 0.5]\n    night: 0.2\ndelay: [60, 120]\n")
+    assert read_grid(os.fspath(grid_file)) == {"noaa-20.day": [0.9, 0.5], "noaa-20.night": [0.2],
+                                               "delay": [60, 120]}
+
+    grid_file.write_text("horizon: [0, 5]\n")
+    with pytest.raises(ValueError, match="horizon"):
+        read_grid(os.fspath(grid_file))
+
+
+def test_get_configurations():
+    """Test that the configurations are all the combinations of the grid values."""
+    configurations = get_configurations({"noaa-20.day": [0.9, 0.5], "delay": [60, 120, 180]})
+    assert len(configurations) == 6
+    assert configurations[0] == {"noaa-20.day": 0.9, "delay": 60}
+    assert configurations[-1] == {"noaa-20.day": 0.5, "delay": 180}
+
+
+def test_sweep_options():
+    """Test that a sweep needs no schedule output, and can't be a backfill."""
+    assert parse_args(["-c", "config.yaml", "--sweep", "grid.yaml"]).sweep == "grid.yaml"
+    with pytest.raises(SystemExit):
+        parse_args(["-c", "config.yaml", "--sweep", "grid.yaml", "--backfill", "2024-04-03", "2024-04-04", "6"])
+
+
+def read_table(filename):
+    """Read the rows of a sweep table."""
+    with open(filename, newline="") as fd:
+        return list(csv.DictReader(fd))
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_sweep_schedules_as_separate_runs(tmp_path, monkeypatch, processes):
+    """Test that the swept configurations schedule the passes a run with the same parameters does."""
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(tmp_path / "cache"))
+    config_file, tle_file, sched_file = write_config(tmp_path)
+    grid_file = tmp_path / "grid.yaml"
+    grid_file.write_text("satellites:\n  noaa-20:\n    day: [0.9, 0.1]\nmin_pass: [4, 12]\n")
+    args = ["-c", os.fspath(config_file), "-t", os.fspath(tle_file), "-s", START]
+
+    run(args + ["--sweep", os.fspath(grid_file), "--processes", str(processes)])
+
+    rows = read_table(tmp_path / SWEEP_FILENAME)
+    assert [(row["configuration"], row["noaa-20.day"], row["min_pass"]) for row in rows] == [
+        ("1", "0.9", "4"), ("2", "0.9", "12"), ("3", "0.1", "4"), ("4", "0.1", "12")]
+    assert int(rows[1]["passes"]) < int(rows[0]["passes"])
+
+    run(args + ["-x", "--solver", "dp", "--force-recompute"])
+    with open(sched_file) as fd:
+        scheduled = len(re.findall("<pass ", fd.read()))
+    assert scheduled > 0
+    assert int(rows[0]["scheduled"]) == int(rows[0]["scheduled_noaa-20"]) == scheduled
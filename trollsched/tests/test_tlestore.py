@@ -0,0 +1,143 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the store of the TLEs."""
+
+import os
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from trollsched.satpass import Pass
+from trollsched.tlestore import TleArchive, TleStore, parse_tles
+
+NOAA20_OLD = ("1 43013U 17073A   24093.57357837  .00000145  00000+0  86604-4 0  9999",
+              "2 43013  98.7039  32.7741 0007542 324.8026  35.2652 14.21254587330172")
+NOAA20_NEW = ("1 43013U 17073A   24094.57357837  .00000145  00000+0  86604-4 0  9990",
+              "2 43013  98.7039  32.7741 0007542 324.8026  35.2652 14.21254587330172")
+METOPB = ("1 38771U 12049A   24093.50000000  .00000100  00000+0  66000-4 0  9991",
+          "2 38771  98.6900 150.0000 0001000  90.0000 270.0000 14.21500000600004")
+
+
+def write_tles(filename, *tles):
+    """Write (name, line1, line2) *tles* to *filename*."""
+    with open(filename, "w") as fd:
+        for name, line1, line2 in tles:
+            if name:
+                fd.write(name + "\n")
+            fd.write(line1 + "\n" + line2 + "\n")
+
+
+def test_parse_tles():
+    """Test parsing TLEs with and without platform names."""
+    lines = ["NOAA 20 (JPSS-1)\n", *NOAA20_OLD, "", *METOPB]
+    assert parse_tles(lines) == [("NOAA 20 (JPSS-1)", *NOAA20_OLD), (None, *METOPB)]
+
+
+def test_index_keeps_latest_tle(tmp_path):
+    """Test that the index has the latest TLE of each satellite, found by pyorbital's platform names."""
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    write_tles(mirror / "new.txt", ("NOAA 20 (JPSS-1)", *NOAA20_NEW))
+    write_tles(mirror / "old.txt", ("NOAA 20 (JPSS-1)", *NOAA20_OLD), ("METOP-B", *METOPB))
+    store = TleStore(tmp_path / "cache", mirror=os.fspath(mirror))
+
+    assert store.get_tle("noaa-20") == NOAA20_NEW
+    assert store.index["NOAA 20 (JPSS-1)"] == NOAA20_NEW
+    assert store.get_tle("Metop-B") == METOPB
+    with pytest.raises(KeyError):
+        store.get_tle("noaa-21")
+
+
+def test_refresh_from_mirror_when_it_changes(tmp_path):
+    """Test that the stored TLEs follow the mirror."""
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    write_tles(mirror / "tles.txt", ("NOAA 20", *NOAA20_OLD))
+    store = TleStore(tmp_path, mirror=os.fspath(mirror / "*.txt"))
+    assert store.get_tle("noaa-20") == NOAA20_OLD
+
+    write_tles(mirror / "tles2.txt", ("NOAA 20", *NOAA20_NEW))
+    future = time.time() + 10
+    os.utime(mirror / "tles2.txt", (future, future))
+    assert store.is_stale()
+    store.refresh()
+    assert store.get_tle("noaa-20") == NOAA20_NEW
+
+
+def fake_fetch(filename):
+    """Fetch the TLEs from a fake internet."""
+    write_tles(filename, ("NOAA 20", *NOAA20_OLD))
+
+
+def test_fetch_at_most_once_per_max_age(tmp_path):
+    """Test that the TLEs are fetched when there are none, or when they are too old, and only then."""
+    store = TleStore(tmp_path, max_age=timedelta(hours=6))
+    with patch("pyorbital.tlefile.fetch", side_effect=fake_fetch) as fetch:
+        store.get_tle_file()
+        store.get_tle_file()
+        assert store.get_tle("noaa-20") == NOAA20_OLD
+        assert fetch.call_count == 1
+
+        old = time.time() - 7 * 3600
+        os.utime(store.filename, (old, old))
+        store.get_tle_file()
+        assert fetch.call_count == 1
+        assert store.is_stale()
+
+        store = TleStore(tmp_path, max_age=timedelta(hours=6))
+        store.get_tle_file()
+        assert fetch.call_count == 2
+    assert not store.is_stale()
+    assert store.is_stale(datetime.now() + timedelta(hours=7))
+    assert os.listdir(tmp_path) == ["tle.txt"]
+
+
+def test_offline_refresh_keeps_stored_tles(tmp_path):
+    """Test that the stored TLEs are used when new ones can't be fetched."""
+    store = TleStore(tmp_path)
+    with patch("pyorbital.tlefile.fetch", side_effect=OSError("offline")):
+        with pytest.raises(OSError, match="offline"):
+            store.get_tle_file()
+        fake_fetch(store.filename)
+        store.refresh()
+    assert store.get_tle("noaa-20") == NOAA20_OLD
+    assert os.listdir(tmp_path) == ["tle.txt"]
+
+
+def test_pass_gets_its_tle_from_the_store(tmp_path):
+    """Test that a pass without orbital nor TLE lines gets its TLE from the store."""
+    store = TleStore(tmp_path)
+    fake_fetch(store.filename)
+    with patch("trollsched.satpass.get_tle_store", return_value=store):
+        overpass = Pass("NOAA-20", datetime(2024, 4, 3, 12), datetime(2024, 4, 3, 12, 15))
+    assert overpass.orb.tle.line1 == NOAA20_OLD[0]
+
+
+def test_archive_gives_latest_tle_before_time(tmp_path):
+    """Test that the archive gives the TLE that was the latest at a given time."""
+    write_tles(tmp_path / "20240403.txt", ("NOAA 20 (JPSS-1)", *NOAA20_OLD), ("METOP-B", *METOPB))
+    write_tles(tmp_path / "20240404.txt", ("NOAA 20 (JPSS-1)", *NOAA20_NEW))
+    archive = TleArchive(os.fspath(tmp_path))
+
+    assert archive.get_tle("noaa-20", datetime(2024, 4, 3, 10)) == NOAA20_OLD
+    assert archive.get_tle("noaa-20", datetime(2024, 4, 4)) == NOAA20_NEW
+    assert archive.get_tle("metop-b", datetime(2024, 4, 10)) == METOPB
+    with pytest.raises(KeyError, match="before"):
+        archive.get_tle("noaa-20", datetime(2024, 4, 2))
+    with pytest.raises(OSError, match="No TLE files"):
+        TleArchive(os.fspath(tmp_path / "missing"))
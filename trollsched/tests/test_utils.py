@@ -0,0 +1,58 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the utility functions."""
+
+import os
+import stat
+
+import pytest
+
+from trollsched.utils import get_cache_dir
+
+
+def test_cache_dir_is_private(tmp_path, monkeypatch):
+    """Test that the cache directory is created in the user's cache directory, private to the user."""
+    monkeypatch.delenv("TROLLSCHED_CACHE_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", os.fspath(tmp_path / "home" / ".cache"))
+
+    cache_dir = get_cache_dir("runs")
+
+    assert cache_dir == os.fspath(tmp_path / "home" / ".cache" / "trollsched" / "runs")
+    assert stat.S_IMODE(os.stat(tmp_path / "home" / ".cache" / "trollsched").st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no file permissions")
+def test_cache_dir_writable_by_others_is_refused(tmp_path, monkeypatch):
+    """Test that a cache directory other users can write to is refused."""
+    base_dir = tmp_path / "shared"
+    base_dir.mkdir()
+    base_dir.chmod(0o777)
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(base_dir))
+
+    with pytest.raises(PermissionError, match="writable by other users"):
+        get_cache_dir("runs")
+    assert not (base_dir / "runs").exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no file owners")
+def test_cache_dir_of_another_user_is_refused(tmp_path, monkeypatch):
+    """Test that a cache directory belonging to another user is refused."""
+    monkeypatch.setenv("TROLLSCHED_CACHE_DIR", os.fspath(tmp_path))
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(tmp_path).st_uid + 1)
+
+    with pytest.raises(PermissionError, match="belongs to another user"):
+        get_cache_dir()
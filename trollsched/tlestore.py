@@ -0,0 +1,252 @@
+# Copyright (c) 2024 Pytroll-schedule developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Keep the TLEs used when no TLE file is given.
+
+The TLEs are kept in a single file of the scheduler's cache directory. The file
+is refreshed when it is older than a maximum age, from the internet, or from a
+local mirror of TLE files when working offline, and replaced atomically so that
+a reader never sees it half written. The freshness of the file is checked at
+most once per maximum age in a process, so all the stations of a run use the
+same TLEs, downloaded once.
+
+The TLEs of the file are indexed by platform name and by catalogue number, the
+latest TLE of a satellite winning when the file has several of them.
+
+An archive of past TLE files gives the TLEs that were the latest at a given
+time instead, to compute the schedules of the past.
+"""
+
+import glob
+import logging
+import os
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from trollsched.utils import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+#: How old the stored TLEs may get before they are refreshed
+DEFAULT_MAX_AGE = timedelta(hours=6)
+
+TLE_FILENAME = "tle.txt"
+
+
+def _get_epoch(line1):
+    """Get the epoch of a TLE from its first line, as a (year, day of year) tuple."""
+    year = int(line1[18:20])
+    return (year + (1900 if year >= 57 else 2000), float(line1[20:32]))
+
+
+def get_epoch_time(line1):
+    """Get the epoch of a TLE from its first line, as a datetime."""
+    year, day = _get_epoch(line1)
+    return datetime(year, 1, 1) + timedelta(days=day - 1)
+
+
+def _get_index_keys(name, line1):
+    """Get the keys of a TLE in the indices: its platform name if it has one, and its catalogue number."""
+    return [key for key in (name and name.upper(), line1[2:7].strip()) if key]
+
+
+def _lookup(index, platform):
+    """Look *platform* up in *index*, by catalogue number if pyorbital knows it, by name otherwise."""
+    from pyorbital.tlefile import SATELLITES
+    name = platform.strip().upper()
+    number = SATELLITES.get(name)
+    if number in index:
+        return index[number]
+    if name in index:
+        return index[name]
+    raise KeyError("Found no TLE entry for '%s'" % platform)
+
+
+def parse_tles(lines):
+    """Parse TLE *lines*, with or without platform names, into (name, line1, line2) tuples.
+
+    The name is None for the TLEs without a platform name line.
+    """
+    tles = []
+    lines = [line.strip() for line in lines if line.strip()]
+    i = 0
+    while i < len(lines) - 1:
+        if lines[i].startswith("1 ") and lines[i + 1].startswith("2 "):
+            name = lines[i - 1] if i > 0 and not lines[i - 1].startswith("2 ") else None
+            if name and name.startswith("0 "):
+                # Three line element sets
+                name = name[2:]
+            tles.append((name, lines[i], lines[i + 1]))
+            i += 2
+        else:
+            i += 1
+    return tles
+
+
+class TleStore:
+    """The TLEs used when no TLE file is given, stored in *cache_dir*.
+
+    Args:
+        cache_dir: where to store the TLE file, defaults to the scheduler's cache directory.
+        max_age: how old the TLEs may get before they are refreshed.
+        mirror: a local directory of TLE files, or a glob pattern of TLE files, to refresh the TLEs from
+            instead of the internet.
+    """
+
+    def __init__(self, cache_dir=None, max_age=DEFAULT_MAX_AGE, mirror=None):
+        """Initialize the store."""
+        cache_dir = cache_dir or get_cache_dir("tle")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.filename = os.path.join(cache_dir, TLE_FILENAME)
+        self.max_age = max_age
+        self.mirror = mirror
+        self._last_check = None
+        self._index = None
+        self._index_key = None
+        self._lock = threading.Lock()
+
+    def _get_mirror_files(self):
+        pattern = os.path.join(self.mirror, "*") if os.path.isdir(self.mirror) else self.mirror
+        return sorted(filename for filename in glob.glob(pattern) if os.path.isfile(filename))
+
+    def is_stale(self, now=None):
+        """Check if the stored TLEs are missing, too old, or older than the files of the mirror."""
+        try:
+            mtime = os.path.getmtime(self.filename)
+        except FileNotFoundError:
+            return True
+        now = now or datetime.now()
+        if now - datetime.fromtimestamp(mtime) > self.max_age:
+            return True
+        if self.mirror:
+            return any(os.path.getmtime(filename) > mtime for filename in self._get_mirror_files())
+        return False
+
+    def refresh(self):
+        """Get new TLEs and replace the stored ones with them, atomically.
+
+        If the new TLEs can't be had, the stored ones are kept if there are any.
+        """
+        tmp_filename = self.filename + ".%d.tmp" % os.getpid()
+        try:
+            if self.mirror:
+                logger.info("Refresh the TLEs from %s", self.mirror)
+                with open(tmp_filename, "w") as fd_:
+                    for filename in self._get_mirror_files():
+                        with open(filename) as mirror_fd:
+                            fd_.write(mirror_fd.read().rstrip("\n") + "\n")
+            else:
+                from pyorbital import tlefile
+
+                from trollsched.profiling import profiler
+                logger.info("Fetch tle info from internet")
+                with profiler.timer("tle_fetch"):
+                    tlefile.fetch(tmp_filename)
+            os.replace(tmp_filename, self.filename)
+        except (OSError, ValueError) as err:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            if not os.path.exists(self.filename):
+                raise
+            logger.warning("Cannot refresh the TLEs, using the stored ones from %s: %s",
+                           datetime.fromtimestamp(os.path.getmtime(self.filename)).isoformat(), str(err))
+
+    def get_tle_file(self):
+        """Get the name of the file of the TLEs, refreshing them first if needed."""
+        with self._lock:
+            now = datetime.now()
+            if self._last_check is None or now - self._last_check > self.max_age:
+                self._last_check = now
+                if self.is_stale(now):
+                    self.refresh()
+        return self.filename
+
+    @property
+    def index(self):
+        """The latest TLE lines of each satellite, keyed by platform name and catalogue number."""
+        filename = self.get_tle_file()
+        stat = os.stat(filename)
+        with self._lock:
+            if self._index_key != (stat.st_mtime_ns, stat.st_size):
+                with open(filename) as fd_:
+                    tles = parse_tles(fd_)
+                index = {}
+                for name, line1, line2 in tles:
+                    for key in _get_index_keys(name, line1):
+                        if key not in index or _get_epoch(index[key][0]) < _get_epoch(line1):
+                            index[key] = (line1, line2)
+                self._index = index
+                self._index_key = (stat.st_mtime_ns, stat.st_size)
+            return self._index
+
+    def get_tle(self, platform):
+        """Get the latest TLE lines of *platform*, with pyorbital's platform names.
+
+        Raises:
+            KeyError: if there is no TLE for the platform.
+        """
+        return _lookup(self.index, platform)
+
+
+class TleArchive:
+    """The TLEs of the files of an archive *directory*, to get the TLEs a satellite had at past times.
+
+    Args:
+        directory: the directory of the archived TLE files, or a glob pattern of them.
+    """
+
+    def __init__(self, directory):
+        """Read and index the archived TLEs."""
+        pattern = os.path.join(directory, "*") if os.path.isdir(directory) else directory
+        filenames = sorted(filename for filename in glob.glob(pattern) if os.path.isfile(filename))
+        if not filenames:
+            raise IOError("No TLE files found in %s" % directory)
+        tles = {}
+        for filename in filenames:
+            with open(filename) as fd_:
+                for name, line1, line2 in parse_tles(fd_):
+                    for key in _get_index_keys(name, line1):
+                        tles.setdefault(key, {})[_get_epoch(line1)] = (get_epoch_time(line1), line1, line2)
+        #: The TLEs of each satellite, ordered by epoch
+        self.index = {key: [satellite_tles[epoch] for epoch in sorted(satellite_tles)]
+                      for key, satellite_tles in tles.items()}
+        logger.debug("Read %d TLEs from %d files in %s",
+                     sum(map(len, self.index.values())), len(filenames), directory)
+
+    def get_tle(self, platform, utctime):
+        """Get the TLE lines of *platform* at *utctime*, ie the TLE with the latest epoch before *utctime*.
+
+        Raises:
+            KeyError: if there is no TLE of the platform before *utctime*.
+        """
+        tles = _lookup(self.index, platform)
+        i = bisect_right([epoch for epoch, _, _ in tles], utctime)
+        if i == 0:
+            raise KeyError("Found no TLE entry for '%s' before %s" % (platform, utctime.isoformat()))
+        return tles[i - 1][1:]
+
+
+_stores = {}
+
+
+def get_tle_store(mirror=None):
+    """Get the shared TLE store, refreshed from *mirror*, or from the TLES environment variable if it is set."""
+    mirror = mirror or os.environ.get("TLES")
+    try:
+        return _stores[mirror]
+    except KeyError:
+        store = _stores[mirror] = TleStore(mirror=mirror)
+        return store
@@ -26,11 +26,10 @@ import warnings
 
 import yaml
 import logging
+import os
 from collections.abc import Mapping
 from configparser import ConfigParser
 
-from trollsched import schedule
-
 
 logger = logging.getLogger("trollsched")
 
@@ -47,6 +46,44 @@ def read_yaml_file(file_name):
     return conf_dict
 
 
+def get_cache_dir(*subdirs):
+    """Get the directory where the scheduler keeps its caches, creating it if needed.
+
+    The caches live in a *trollsched* directory of the user's cache directory (``$XDG_CACHE_HOME``, or
+    ``~/.cache``), unless the TROLLSCHED_CACHE_DIR environment variable says otherwise. As the files of the caches
+    are trusted, the directory is created private to the user, and a directory belonging to another user or
+    writable by others is refused.
+
+    Raises:
+        PermissionError: if the cache directory is not the user's own.
+    """
+    base_dir = os.environ.get("TROLLSCHED_CACHE_DIR")
+    if base_dir is None:
+        xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        base_dir = os.path.join(xdg_cache_home, "trollsched")
+    os.makedirs(base_dir, mode=0o700, exist_ok=True)
+    check_private_dir(base_dir)
+    cache_dir = os.path.join(base_dir, *subdirs)
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    return cache_dir
+
+
+def check_private_dir(directory):
+    """Check that *directory* belongs to the user and is not writable by others.
+
+    Raises:
+        PermissionError: if it belongs to another user or is writable by its group or by anyone.
+    """
+    if not hasattr(os, "getuid"):
+        # no ownership nor mode bits to check on windows
+        return
+    stat = os.stat(directory)
+    if stat.st_uid != os.getuid():
+        raise PermissionError("The cache directory %s belongs to another user" % directory)
+    if stat.st_mode & 0o022:
+        raise PermissionError("The cache directory %s is writable by other users" % directory)
+
+
 def recursive_dict_update(d, u):
     """Recursive dictionary update.
 
@@ -73,6 +110,7 @@ def read_config(filename):
 
 def read_config_yaml(filename):
     """Read the yaml file *filename* and create a scheduler."""
+    from trollsched import schedule
 
     cfg = read_yaml_file(filename)
     satellites = {sat_name: schedule.Satellite(sat_name, **sat_params)
@@ -100,6 +138,10 @@ def read_config_yaml(filename):
     sched_params = cfg['default']
     plot_parameters = sched_params.get('plot_parameters', {})
     plot_title = sched_params.get('plot_title', None)
+    combined_solver = sched_params.get("combined_solver", "graph")
+    if combined_solver not in schedule.COMBINED_SOLVERS:
+        raise ValueError("Unknown combined_solver %r, should be one of %s"
+                         % (combined_solver, ", ".join(schedule.COMBINED_SOLVERS)))
 
     scheduler = schedule.Scheduler(stations=[stations[st_id]
                                              for st_id in sched_params['station']],
@@ -110,6 +152,7 @@ def read_config_yaml(filename):
                                    patterns=pattern,
                                    center_id=sched_params.get('center_id', 'unknown'),
                                    plot_parameters=plot_parameters,
-                                   plot_title=plot_title)
+                                   plot_title=plot_title,
+                                   combined_solver=combined_solver)
 
     return scheduler
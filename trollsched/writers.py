@@ -113,6 +113,10 @@ def generate_xml_requests(sched, start, end, station_name, center_id, report_mod
             ovpass.set("satellite", sat_name)
             ovpass.set("start-time", overpass.risetime.strftime(time_format))
             ovpass.set("end-time", overpass.falltime.strftime(time_format))
+            # the passes pickled before the antennas were scheduled have no antenna
+            antenna = getattr(overpass, "antenna", None)
+            if antenna is not None:
+                ovpass.set("antenna", str(antenna))
             if report_mode:
                 if overpass.fig is not None:
                     ovpass.set("img", overpass.fig)